@@ -1,127 +1,227 @@
-import streamlit as st
-import geopandas as gpd
-import folium
-from streamlit_folium import st_folium
-from main import app  # Your LangGraph workflow
-import os
-
-st.set_page_config(page_title="🧠 Spatial LLM Map", layout="wide")
-st.title("🗺 Spatial Query Assistant")
-
-# Initialize session state
-if "final" not in st.session_state:
-    st.session_state.final = None
-
-query = st.text_input("🔍 Ask your spatial query:", placeholder="e.g., Show me areas safe from flooding in Surat")
-
-# Run the query
-if st.button("Run Query") and query.strip():
-    with st.spinner("🧠 Processing your query..."):
-        state = {"query": query, "cot_log": []}
-        st.session_state.final = app.invoke(state)
-
-# Retrieve result
-final = st.session_state.final
-
-if final:
-    st.subheader("🤖 Chain of Thought")
-    for step in final.get("cot_log", []):
-        st.markdown(f"- {step}")
-
-    st.subheader("📦 Final Output State")
-    st.json({k: v for k, v in final.items() if k != "cot_log"})
-
-    # Determine map path and title
-    map_path = final.get("map_path")
-    map_title = final.get("map_title", "🗺 Spatial Result")
-    style_fn = None
-    legend_html = ""
-
-    # 🧪 Debugging Information
-    st.subheader("🧪 Debugging Information")
-    st.write("🧭 Map Path from state:", map_path)
-    st.write("📂 File Exists:", os.path.exists(map_path) if map_path else False)
-    if os.path.exists("data"):
-        st.write("📁 Files in /data/:", os.listdir("data"))
-    else:
-        st.write("🚫 'data' directory not found!")
-
-    if map_path and os.path.exists(map_path):
-        # Conditional styling and legend
-        if "safe_zones" in map_path:
-            map_title = "🛡 Disaster Safe Zones"
-
-            def style_fn(feature):
-                return {"fillColor": "#ff4848", "color": "#cc0000", "weight": 2, "fillOpacity": 0.5}
-
-            legend_html = """
-            <div style="position: fixed;
-                        bottom: 30px; left: 30px; width: 180px; height: 60px;
-                        background-color: white; border:2px solid grey; z-index:9999; font-size:13px;
-                        padding: 10px;">
-                <b>Legend</b><br>
-                <i style="background:#ff4d4d; width: 12px; height: 12px; float: left; margin-right: 5px; opacity: 0.7;"></i> Safe Zone
-            </div>
-            """
-
-        elif "suitability" in map_path:
-            map_title = "✅ Suitable Areas"
-
-            def style_fn(feature):
-                return {"fillColor": "#4CAF50", "color": "#2E7D32", "weight": 2, "fillOpacity": 0.5}
-
-            legend_html = """
-            <div style="position: fixed;
-                        bottom: 30px; left: 30px; width: 180px; height: 60px;
-                        background-color: white; border:2px solid grey; z-index:9999; font-size:13px;
-                        padding: 10px;">
-                <b>Legend</b><br>
-                <i style="background:#4CAF50; width: 12px; height: 12px; float: left; margin-right: 5px; opacity: 0.7;"></i> Suitable Area
-            </div>
-            """
-
-        elif "buffered" in map_path:
-            map_title = "🟢 Buffered Region"
-
-        elif "mask" in map_path:
-            map_title = "🌄 Elevation Masked Area"
-
-        # Display map
-        try:
-            gdf = gpd.read_file(map_path)
-            if not gdf.empty:
-                bounds = gdf.total_bounds
-                m = folium.Map(
-                    location=[(bounds[1] + bounds[3]) / 2, (bounds[0] + bounds[2]) / 2],
-                    zoom_start=7
-                )
-
-                folium.GeoJson(
-                    gdf,
-                    name="Geo Output",
-                    style_function=style_fn if style_fn else None
-                ).add_to(m)
-
-
-                if legend_html:
-                    m.get_root().html.add_child(folium.Element(legend_html))
-
-                st.subheader(map_title)
-                st_folium(m, width=800, height=500)
-            else:
-                st.warning("⚠ GeoDataFrame is empty.")
-        except Exception as e:
-            st.error(f"❌ Error displaying map: {e}")
-    else:
-        st.warning("⚠ No map output available.")
-
-    # Download buttons (for raster and DEM)
-    if final.get("dem_path") and os.path.exists(final["dem_path"]):
-        st.download_button("📥 Download DEM", open(final["dem_path"], "rb"), file_name=os.path.basename(final["dem_path"]))
-
-    if final.get("suitability_output") and os.path.exists(final["suitability_output"]):
-        st.download_button("📥 Download Suitability Raster", open(final["suitability_output"], "rb"), file_name=os.path.basename(final["suitability_output"]))
-
-    if final.get("raster_result", {}).get("raster_output") and os.path.exists(final["raster_result"]["raster_output"]):
-        st.download_button("📥 Download Masked Raster", open(final["raster_result"]["raster_output"], "rb"),
-                           file_name=os.path.basename(final["raster_result"]["raster_output"]))
+import streamlit as st
+import folium
+from streamlit_folium import st_folium
+from main import app  # Your LangGraph workflow
+from working_set import WorkingSet, session
+from tile_server import TileServer, zoom_for_bounds
+import math
+import os
+
+st.set_page_config(page_title="🧠 Spatial LLM Map", layout="wide")
+st.title("🗺 Spatial Query Assistant")
+
+@st.cache_resource
+def get_tile_server():
+    # One tile server per Streamlit process, shared by all sessions
+    return TileServer().start()
+
+
+# Initialize session state
+if "final" not in st.session_state:
+    st.session_state.final = None
+if "working_set" not in st.session_state:
+    # Boundaries and arrays loaded by this session's queries, reused by the next ones
+    st.session_state.working_set = WorkingSet()
+
+
+def show_preview(event, key):
+    if event["kind"] == "raster":
+        st.image(event["image"], caption=event["title"], width=320)
+    elif event["kind"] == "features":
+        minx, miny, maxx, maxy = event["bounds"]
+        preview_map = folium.Map(tiles="cartodbpositron")
+        folium.GeoJson(event["geojson"]).add_to(preview_map)
+        preview_map.fit_bounds([[miny, minx], [maxy, maxx]])
+        st.caption(f"{event['title']}: {event['count']} polygons so far")
+        st_folium(preview_map, height=300, key=key, returned_objects=[])
+
+
+def run_streaming(state):
+    # Streams the graph: cot_log lines, node timings and coarse previews appear as
+    # nodes produce them, and the final state is returned when the graph ends
+    status = st.status("🧠 Processing your query...", expanded=True)
+    log_area = status.container()
+    timing_area = status.empty()
+    preview_area = status.container()
+    timings, final, previews = [], dict(state), 0
+
+    with session(st.session_state.working_set):
+        for mode, chunk in app.stream({**state, "previews": True}, stream_mode=["updates", "custom"]):
+            if mode == "updates":
+                for update in chunk.values():
+                    final = update or final
+                continue
+
+            if chunk["event"] == "node_start":
+                status.update(label=f"🧠 Running {chunk['node']}...")
+            elif chunk["event"] == "log":
+                log_area.markdown(f"- {chunk['message']}")
+            elif chunk["event"] == "node_end":
+                timings.append({"node": chunk["node"], "seconds": round(chunk["seconds"], 3)})
+                timing_area.dataframe(timings, hide_index=True)
+            elif chunk["event"] == "preview":
+                with preview_area:
+                    show_preview(chunk, key=f"preview_{previews}")
+                previews += 1
+
+    status.update(label="✅ Query complete", state="complete", expanded=False)
+    return final
+
+
+query = st.text_input("🔍 Ask your spatial query:", placeholder="e.g., Show me areas safe from flooding in Surat")
+
+# Run the query
+if st.button("Run Query") and query.strip():
+    st.session_state.final = run_streaming({"query": query, "cot_log": []})
+
+# Retrieve result
+final = st.session_state.final
+
+stats = st.session_state.working_set.stats()
+st.sidebar.caption(
+    f"Working set: {stats['entries']} items, {stats['bytes'] / 1e6:,.0f} MB "
+    f"({stats['hits']} hits, {stats['misses']} misses)"
+)
+
+if final:
+    st.subheader("🤖 Chain of Thought")
+    for step in final.get("cot_log", []):
+        st.markdown(f"- {step}")
+
+    # Large regions run on a coarser DEM first; re-run the same query at full resolution on demand
+    if final.get("dem_scale", 30) > 30 and st.button(f"🔬 Refine to full resolution (now {final['dem_scale']} m)"):
+        st.session_state.final = run_streaming({"query": final["query"], "cot_log": [], "refine": True})
+        st.rerun()
+
+    # Per-node spans: a waterfall of when each node ran plus its resource use
+    if final.get("trace"):
+        import altair as alt
+        import pandas as pd
+
+        st.subheader("⏱ Timing")
+        spans = final["trace"]
+        origin = min(span["start_time_unix_nano"] for span in spans)
+        rows = [{
+            "node": span["name"],
+            "start_ms": (span["start_time_unix_nano"] - origin) / 1e6,
+            "end_ms": (span["end_time_unix_nano"] - origin) / 1e6,
+            "status": span["status"],
+            **{k: v for k, v in span["attributes"].items() if k != "error"},
+            "events": ", ".join(event["name"] for event in span["events"])
+        } for span in spans]
+        timings = pd.DataFrame(rows)
+
+        chart = alt.Chart(timings).mark_bar().encode(
+            x=alt.X("start_ms:Q", title="ms since query start"),
+            x2="end_ms:Q",
+            y=alt.Y("node:N", sort=None, title=None),
+            color=alt.Color("status:N", scale=alt.Scale(domain=["ok", "error"], range=["#4CAF50", "#ff4848"])),
+            tooltip=list(timings.columns)
+        )
+        st.altair_chart(chart, use_container_width=True)
+        st.dataframe(timings.drop(columns=["start_ms", "end_ms"]), use_container_width=True)
+
+    st.subheader("📦 Final Output State")
+    st.json({k: v for k, v in final.items() if k not in ("cot_log", "trace", "trace_id", "previews")})
+
+    # Determine map path and title
+    map_path = final.get("map_path")
+    map_title = final.get("map_title", "🗺 Spatial Result")
+    style = None
+    legend_html = ""
+
+    # 🧪 Debugging Information
+    st.subheader("🧪 Debugging Information")
+    st.write("🧭 Map Path from state:", map_path)
+    st.write("📂 File Exists:", os.path.exists(map_path) if map_path else False)
+    if os.path.exists("data"):
+        st.write("📁 Files in /data/:", os.listdir("data"))
+    else:
+        st.write("🚫 'data' directory not found!")
+
+    if map_path and os.path.exists(map_path):
+        # Conditional styling and legend
+        if "safe_zones" in map_path:
+            map_title = "🛡 Disaster Safe Zones"
+
+            style = {"fillColor": "#ff4848", "color": "#cc0000", "fillOpacity": 0.5}
+
+            legend_html = """
+            <div style="position: fixed;
+                        bottom: 30px; left: 30px; width: 180px; height: 60px;
+                        background-color: white; border:2px solid grey; z-index:9999; font-size:13px;
+                        padding: 10px;">
+                <b>Legend</b><br>
+                <i style="background:#ff4d4d; width: 12px; height: 12px; float: left; margin-right: 5px; opacity: 0.7;"></i> Safe Zone
+            </div>
+            """
+
+        elif "suitability" in map_path:
+            map_title = "✅ Suitable Areas"
+
+            style = {"fillColor": "#4CAF50", "color": "#2E7D32", "fillOpacity": 0.5}
+
+            legend_html = """
+            <div style="position: fixed;
+                        bottom: 30px; left: 30px; width: 180px; height: 60px;
+                        background-color: white; border:2px solid grey; z-index:9999; font-size:13px;
+                        padding: 10px;">
+                <b>Legend</b><br>
+                <i style="background:#4CAF50; width: 12px; height: 12px; float: left; margin-right: 5px; opacity: 0.7;"></i> Suitable Area
+            </div>
+            """
+
+        elif "buffered" in map_path:
+            map_title = "🟢 Buffered Region"
+
+        elif "mask" in map_path:
+            map_title = "🌄 Elevation Masked Area"
+
+        # Display map: the result is rendered server-side into XYZ tiles, so the
+        # page payload does not grow with the number of polygons or pixels
+        try:
+            tile_server = get_tile_server()
+            layer_id = tile_server.register(map_path, style)
+            bounds = tile_server.bounds(layer_id)
+            if not all(math.isfinite(b) for b in bounds):
+                raise ValueError("Map output is empty.")
+
+            m = folium.Map(
+                location=[(bounds[1] + bounds[3]) / 2, (bounds[0] + bounds[2]) / 2],
+                zoom_start=zoom_for_bounds(bounds)
+            )
+
+            folium.TileLayer(
+                tiles=tile_server.url(layer_id),
+                attr="Spatial Query Assistant",
+                name="Geo Output",
+                overlay=True,
+                max_zoom=18
+            ).add_to(m)
+
+            if legend_html:
+                m.get_root().html.add_child(folium.Element(legend_html))
+
+            st.subheader(map_title)
+            st_folium(m, width=800, height=500)
+        except Exception as e:
+            st.error(f"❌ Error displaying map: {e}")
+    else:
+        st.warning("⚠ No map output available.")
+
+    # Download buttons (for raster and DEM)
+    if final.get("dem_path") and os.path.exists(final["dem_path"]):
+        dem_path = final["dem_path"]
+        if dem_path.endswith(".vrt") and final.get("region_path"):
+            # DEM mosaics from the tile store are VRT indexes: offer the region's window as a GeoTIFF
+            from main import export_dem
+            dem_path = export_dem(dem_path, final["region_path"])
+        if not dem_path.endswith(".vrt"):
+            st.download_button("📥 Download DEM", open(dem_path, "rb"), file_name=os.path.basename(dem_path))
+
+    if final.get("suitability_output") and os.path.exists(final["suitability_output"]):
+        st.download_button("📥 Download Suitability Raster", open(final["suitability_output"], "rb"), file_name=os.path.basename(final["suitability_output"]))
+
+    if final.get("raster_result", {}).get("raster_output") and os.path.exists(final["raster_result"]["raster_output"]):
+        st.download_button("📥 Download Masked Raster", open(final["raster_result"]["raster_output"], "rb"),
+                           file_name=os.path.basename(final["raster_result"]["raster_output"]))
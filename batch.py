@@ -0,0 +1,213 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+from collections import defaultdict
+
+import main
+from dem_store import level_suffix
+from query_parser import DEFAULT_THRESHOLD
+
+# Job fields that may be given as lists in a JSONL row and are expanded as a grid
+GRID_FIELDS = ["region", "threshold", "comparison"]
+
+
+def _number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def read_jobs(path):
+    # JSONL rows or CSV lines, each either {"query": ...} or explicit parameters
+    # (region, threshold, comparison, plus any extra state keys). In JSONL, list
+    # values of region/threshold/comparison are expanded into their product, and
+    # "threshold_range": [start, stop, step] is shorthand for a threshold list
+    if path.lower().endswith(".csv"):
+        with open(path, newline="") as f:
+            rows = [{k: v for k, v in row.items() if v not in (None, "")} for row in csv.DictReader(f)]
+    else:
+        with open(path) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    jobs = []
+    for row in rows:
+        if "threshold_range" in row:
+            start, stop, step = row.pop("threshold_range")
+            row["threshold"] = list(range(start, stop + 1, step))
+        grid = [row[k] if isinstance(row.get(k), list) else [row.get(k)] for k in GRID_FIELDS]
+        for values in itertools.product(*grid):
+            job = {**row, **{k: v for k, v in zip(GRID_FIELDS, values) if v is not None}}
+            jobs.append(job)
+    return jobs
+
+
+def resolve(job):
+    # Fills intent/region/threshold from the query (rules first, LLM fallback);
+    # explicit job fields win over what the query says
+    resolved = {"intent": "raster_analysis", "comparison": "below"}
+    if job.get("query"):
+        parsed = main.parse(job["query"].lower())
+        resolved.update({k: v for k, v in parsed.items() if v is not None and k in ("intent", "region", "threshold", "comparison")})
+    resolved.update(job)
+    resolved["region"] = resolved.get("region") or main.DEFAULT_REGION
+    if resolved["intent"] == "raster_analysis":
+        resolved["threshold"] = _number(resolved.get("threshold", DEFAULT_THRESHOLD))
+    return resolved
+
+
+def run_region(region, jobs, timings):
+    import numpy as np
+    import rasterio
+    from shapely.geometry import mapping
+    from rasterio.features import geometry_window
+    from tools.raster_tool import (
+        clip_elevation, threshold_levels, level_mask, write_mask, vectorize_mask, raster_tool_fn
+    )
+    from tools.windows import WINDOWED_PIXEL_THRESHOLD
+    from tools.vector_io import read_vector_cached
+
+    results = []
+    start = time.perf_counter()
+    region_path = main.fetch_boundary(region)
+    # Jobs of a region share one DEM level: full resolution if any job asks to refine
+    scale = main.dem_scale(region, refine=any(job.get("refine") for job in jobs))
+    dem_path = main.fetch_dem(region, scale=scale)
+    timings["fetch"] += time.perf_counter() - start
+
+    # Non-raster jobs run through the graph; boundary and DEM are now on disk
+    raster_jobs = [job for job in jobs if job["intent"] == "raster_analysis"]
+    for job in jobs:
+        if job["intent"] != "raster_analysis":
+            if not job.get("query"):
+                results.append({**job, "status": "error", "error": "Non-raster jobs need a query"})
+                continue
+            start = time.perf_counter()
+            final = main.app.invoke({"cot_log": [], **job})
+            elapsed = time.perf_counter() - start
+            timings["graph"] += elapsed
+            results.append({**job, "status": "error" if final.get("error") else "success",
+                            "map_path": final.get("map_path"), "error": final.get("error"), "seconds": elapsed})
+    if not raster_jobs:
+        return results
+
+    start = time.perf_counter()
+    boundary = read_vector_cached(region_path)
+    with rasterio.open(dem_path) as src:
+        if boundary.crs != src.crs:
+            boundary = boundary.to_crs(src.crs)
+        geom = [mapping(boundary.union_all())]
+        region_window = geometry_window(src, geom)
+        in_memory = region_window.width * region_window.height <= WINDOWED_PIXEL_THRESHOLD
+        # Clip once; every threshold is evaluated against this array
+        elevation_data, transform = clip_elevation(src, geom) if in_memory else (None, None)
+        valid = None if elevation_data is None else ~np.isnan(elevation_data)
+        timings["clip"] += time.perf_counter() - start
+
+        by_comparison = defaultdict(list)
+        for job in raster_jobs:
+            by_comparison[job["comparison"]].append(job)
+
+        for comparison, group in by_comparison.items():
+            if elevation_data is not None:
+                start = time.perf_counter()
+                thresholds, levels, counts = threshold_levels(elevation_data, [job["threshold"] for job in group], comparison)
+                index = {float(t): i for i, t in enumerate(thresholds)}
+                timings["threshold"] += time.perf_counter() - start
+
+            for job in group:
+                state = {
+                    **job,
+                    "cot_log": [],
+                    "region": region.replace(" ", "_"),
+                    "region_path": region_path,
+                    "dem_path": dem_path,
+                    "dem_scale": scale
+                }
+                job_start = time.perf_counter()
+
+                key = None
+                if main.cache_enabled():
+                    spec = main.CACHE_SPECS["raster_analysis"]
+                    key, hit = main.result_cache.lookup("raster_analysis", state, spec["params"], spec["inputs"])
+                    if hit is not None:
+                        results.append({**job, **hit["raster_result"], "cached": True,
+                                        "seconds": time.perf_counter() - job_start})
+                        continue
+
+                if elevation_data is None:
+                    # Region too large to hold in memory: stream it through the tool
+                    result = raster_tool_fn({**state, "windowed": True})["raster_result"]
+                    pixels = None
+                else:
+                    i = index[float(job["threshold"])]
+                    pixels = int(counts[i])
+                    raster_out_path = f"data/{state['region']}_mask_{comparison}_{job['threshold']}m{level_suffix(scale)}.tif"
+                    write_mask(src, level_mask(levels, i, comparison), valid, transform, raster_out_path)
+                    result = vectorize_mask(state, raster_out_path, boundary.crs)
+
+                elapsed = time.perf_counter() - job_start
+                timings["vectorize"] += elapsed
+                if key is not None:
+                    main.result_cache.record(key, {"raster_result": result}, ["raster_result"])
+                results.append({**job, **result, "pixels": pixels, "seconds": elapsed})
+
+    return results
+
+
+def run_batch(jobs):
+    timings = defaultdict(float)
+    start = time.perf_counter()
+    jobs = [resolve(job) for job in jobs]
+    timings["parse"] = time.perf_counter() - start
+
+    # One boundary/DEM fetch and clip per region, however many jobs share it
+    by_region = defaultdict(list)
+    for job in jobs:
+        by_region[job["region"]].append(job)
+
+    results = []
+    for region, region_jobs in by_region.items():
+        try:
+            results.extend(run_region(region, region_jobs, timings))
+        except Exception as e:
+            results.extend({**job, "status": "error", "error": str(e)} for job in region_jobs)
+
+    timings["total"] = time.perf_counter() - start
+    summary = {
+        "jobs": len(results),
+        "regions": len(by_region),
+        "succeeded": sum(r.get("status") == "success" for r in results),
+        "empty": sum(r.get("status") == "empty" for r in results),
+        "failed": sum(r.get("status") == "error" for r in results),
+        "cached": sum(bool(r.get("cached")) for r in results),
+        "seconds": {k: round(v, 3) for k, v in timings.items()},
+        "jobs_per_second": round(len(results) / timings["total"], 2) if timings["total"] else None
+    }
+    return results, summary
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Run a batch of spatial queries or parameter grids")
+    parser.add_argument("jobs", help="JSONL or CSV file of queries / parameters")
+    parser.add_argument("--out", default="data/batch_results.jsonl", help="where to write one result per job")
+    args = parser.parse_args()
+
+    results, summary = run_batch(read_jobs(args.jobs))
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        for result in results:
+            f.write(json.dumps(result, default=str) + "\n")
+    with open(f"{os.path.splitext(args.out)[0]}_summary.json", "w") as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\n📄 Results written to {args.out}")
+    print("⏱ Batch summary:")
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    # Usage: python batch.py jobs.jsonl [--out data/batch_results.jsonl]
+    main_cli()
@@ -0,0 +1,46 @@
+import argparse
+import os
+import sys
+import time
+
+# Repository root on the import path, so the script runs as `python benchmarks/<name>.py`
+# from anywhere as well as with `python -m benchmarks.<name>` from the root
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from query_parser import parse_query, FAST_PATH_CONFIDENCE
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "query_corpus.txt")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the rule-based query parser")
+    parser.add_argument("corpus", nargs="?", default=DEFAULT_CORPUS, help="text file with one query per line")
+    parser.add_argument("--repeat", type=int, default=2000, help="parses per query when timing")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        queries = [line.strip() for line in f if line.strip()]
+
+    hits = 0
+    total_us = 0.0
+    print(f"{'latency (us)':>12}  {'conf':>4}  {'intent':<24} query")
+    for query in queries:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            parsed = parse_query(query)
+        latency_us = (time.perf_counter() - start) / args.repeat * 1e6
+        total_us += latency_us
+
+        fast = parsed["confidence"] >= FAST_PATH_CONFIDENCE
+        hits += fast
+        print(f"{latency_us:12.1f}  {parsed['confidence']:4.1f}  {str(parsed['intent']):<24} "
+              f"{query}{'' if fast else '  [LLM fallback]'}")
+
+    print(f"\nQueries: {len(queries)}")
+    print(f"Mean parse latency: {total_us / len(queries):.1f} us")
+    print(f"Fast-path hit rate: {hits / len(queries):.1%} (confidence >= {FAST_PATH_CONFIDENCE})")
+
+
+if __name__ == "__main__":
+    main()
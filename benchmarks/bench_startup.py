@@ -0,0 +1,65 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Imports are profiled from the repository root, wherever the script is run from
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be imported just by importing main / compiling the graph
+HEAVY_MODULES = ["ee", "geemap", "osmnx", "geopandas", "rasterio", "langchain_groq"]
+
+
+def import_profile(module):
+    # Runs `python -X importtime -c "import <module>"` in a fresh interpreter and
+    # returns the wall time plus {module: (self_us, cumulative_us)}
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=REPO_ROOT
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    timings = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return wall, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time profile of the app entry points")
+    parser.add_argument("module", nargs="?", default="main")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail if the total import time exceeds this")
+    args = parser.parse_args()
+
+    wall, timings = import_profile(args.module)
+    total_us = timings.get(args.module, (0, 0))[1]
+
+    print(f"{'cumulative (ms)':>15}  {'self (ms)':>9}  module")
+    slowest = sorted(timings.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"{cumulative_us / 1000:15.1f}  {self_us / 1000:9.1f}  {name}")
+
+    print(f"\nimport {args.module}: {total_us / 1000:.1f} ms (interpreter wall time {wall * 1000:.0f} ms)")
+
+    failures = []
+    heavy = [name for name in HEAVY_MODULES if name in timings]
+    if heavy:
+        failures.append(f"heavy modules imported eagerly: {', '.join(heavy)}")
+    if args.budget_ms is not None and total_us / 1000 > args.budget_ms:
+        failures.append(f"import time {total_us / 1000:.1f} ms exceeds budget {args.budget_ms:.1f} ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import rasterio
+import shapely
+import geopandas as gpd
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+# Repository root on the import path, so the script runs as `python benchmarks/<name>.py`
+# from anywhere as well as with `python -m benchmarks.<name>` from the root
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from tools.vector_io import vector_path, write_vector
+
+# ~1 arc-second pixels, the resolution of the SRTM DEMs the tools read
+PIXEL_DEGREES = 1 / 3600
+ORIGIN = (72.0, 24.0)
+
+# Rows generated and written per block, so 20k x 20k inputs never sit in memory whole
+STRIP_ROWS = 1024
+
+# Synthetic elevations are centred here; thresholding at it masks about half the region
+THRESHOLD = 200
+
+NODES = ["raster", "disaster", "suitability", "ranking", "vector"]
+
+def wave_field(rows, cols, size, seed, waves=6):
+    # Smooth field in [-1, 1] (a few sine waves over the whole raster) for a block of rows/cols
+    rng = np.random.default_rng(seed)
+    params = rng.uniform([1, 1, 0], [8, 8, 2 * np.pi], size=(waves, 3))
+    y = (rows.astype(np.float32) / size)[:, None]
+    x = (cols.astype(np.float32) / size)[None, :]
+    field = np.zeros((len(rows), len(cols)), dtype=np.float32)
+    for fx, fy, phase in params:
+        field += np.sin(2 * np.pi * (fx * x + fy * y) + phase)
+    return field / waves
+
+
+def write_field(path, size, seed, dtype, nodata, to_values, scale=1):
+    # Writes a size x size (divided by scale) single-band raster strip by strip; the
+    # top-left corner triangle is nodata, like the edge of a real DEM tile
+    width = height = size // scale
+    profile = {
+        "driver": "GTiff", "width": width, "height": height, "count": 1, "dtype": dtype,
+        "crs": "EPSG:4326", "nodata": nodata,
+        "transform": from_origin(*ORIGIN, PIXEL_DEGREES * scale, PIXEL_DEGREES * scale),
+        "tiled": True, "blockxsize": 512, "blockysize": 512, "compress": "deflate", "bigtiff": "IF_SAFER"
+    }
+    rng = np.random.default_rng(seed + 1)
+    cols = np.arange(width) * scale
+    with rasterio.open(path, "w", **profile) as dst:
+        for row_off in range(0, height, STRIP_ROWS):
+            rows = np.arange(row_off, min(row_off + STRIP_ROWS, height)) * scale
+            field = wave_field(rows, cols, size, seed)
+            values = to_values(field, rng).astype(dtype)
+            values[rows[:, None] + cols[None, :] < size // 8] = nodata
+            dst.write(values, 1, window=Window(0, row_off, width, len(rows)))
+    return path
+
+
+def wobbly_polygon(cx, cy, radius, vertices, seed):
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    wobble = 1 + 0.15 * np.sin(angles * np.random.default_rng(seed).integers(3, 9))
+    return shapely.Polygon(np.c_[cx + radius * wobble * np.cos(angles), cy + radius * wobble * np.sin(angles)])
+
+
+def make_inputs(workdir, size):
+    # DEM, region boundary, three criteria (one on a coarser grid, so suitability warps it),
+    # a suitability surface for ranking, and a layer of features to buffer
+    os.makedirs(workdir, exist_ok=True)
+    extent = size * PIXEL_DEGREES
+    cx, cy = ORIGIN[0] + extent / 2, ORIGIN[1] - extent / 2
+
+    inputs = {"dem": os.path.join(workdir, "dem.tif")}
+    write_field(
+        inputs["dem"], size, 1, "int16", -32768,
+        lambda field, rng: THRESHOLD + 150 * field + rng.normal(0, 2, field.shape)
+    )
+
+    inputs["region"] = write_vector(
+        gpd.GeoDataFrame(geometry=[wobbly_polygon(cx, cy, extent * 0.4, 2000, 1)], crs="EPSG:4326"),
+        vector_path(os.path.join(workdir, "region"))
+    )
+
+    inputs["criteria"] = [
+        write_field(os.path.join(workdir, f"criterion_{i}.tif"), size, 10 + i, "float32", -9999,
+                    lambda field, rng: (field + 1) * 50, scale=3 if i == 2 else 1)
+        for i in range(3)
+    ]
+    inputs["suitability"] = write_field(
+        os.path.join(workdir, "suitability.tif"), size, 20, "float32", 0,
+        lambda field, rng: (field + 1) / 2 + rng.uniform(0, 0.01, field.shape)
+    )
+
+    # One ~32-vertex feature per 10k pixels, scattered over the extent
+    rng = np.random.default_rng(30)
+    count = max(1, size * size // 10_000)
+    centres = rng.uniform([ORIGIN[0], ORIGIN[1] - extent], [ORIGIN[0] + extent, ORIGIN[1]], size=(count, 2))
+    inputs["features"] = write_vector(
+        gpd.GeoDataFrame(
+            geometry=[wobbly_polygon(x, y, extent / 200, 32, i) for i, (x, y) in enumerate(centres)],
+            crs="EPSG:4326"
+        ),
+        vector_path(os.path.join(workdir, "features"))
+    )
+    return inputs
+
+
+def node_state(node, inputs):
+    # The state dict each tool node expects when the graph routes to it
+    state = {"query": f"benchmark {node}", "region": "bench", "cot_log": []}
+    if node in ("raster", "disaster"):
+        state.update(region_path=inputs["region"], dem_path=inputs["dem"], threshold=THRESHOLD, comparison="below")
+    elif node == "suitability":
+        state.update(criteria_paths=inputs["criteria"], weights=[0.5, 0.3, 0.2])
+    elif node == "ranking":
+        state.update(suitability_output=inputs["suitability"], top_n=10, min_spacing=1000)
+    elif node == "vector":
+        state.update(vector_path=inputs["features"], buffer_distance=500)
+    return state
+
+
+def _run_node(node, state, rundir):
+    # Runs in a fresh process so peak RSS belongs to this node alone
+    from tools.raster_tool import raster_tool_fn
+    from tools.disaster_tool import disaster_safe_tool_fn
+    from tools.suitability_tool import suitability_tool_fn
+    from tools.ranking_tool import ranking_tool_fn
+    from tools.vector_tool import vector_tool_fn
+
+    tool = {
+        "raster": raster_tool_fn,
+        "disaster": disaster_safe_tool_fn,
+        "suitability": suitability_tool_fn,
+        "ranking": ranking_tool_fn,
+        "vector": vector_tool_fn
+    }[node]
+
+    os.chdir(rundir)  # tools write their products under ./data
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    result = tool(state)
+    seconds = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Products only: the shared caches under data/cache are not output of the node
+    output_bytes = sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk("data") if not root.startswith(os.path.join("data", "cache"))
+        for name in names
+    )
+    error = result.get("error") or next(
+        (value.get("error") or value.get("error_msg") for value in result.values()
+         if isinstance(value, dict) and value.get("status") == "error"), None
+    )
+    return {
+        "seconds": round(seconds, 4),
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+        "delta_rss_mb": round((peak_kb - baseline_kb) / 1024, 1),
+        "output_mb": round(output_bytes / 1e6, 3),
+        "error": error
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def load_history(path):
+    # Latest earlier record per (node, size), for the comparison column
+    previous = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    previous[(record["node"], record["size"])] = record
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time, peak memory and output size of each tool node on synthetic inputs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 4000],
+                        help="raster edge lengths in pixels (e.g. 1000 5000 10000 20000)")
+    parser.add_argument("--nodes", nargs="+", choices=NODES, default=NODES)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case (the fastest is kept)")
+    parser.add_argument("--workdir", help="keep generated inputs here and reuse them on later runs")
+    parser.add_argument("--history", help="JSONL file results are compared with and appended to "
+                                          "(e.g. outside the checkout); by default nothing is recorded")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_tools_")
+    previous = load_history(args.history) if args.history else {}
+    revision = git_revision()
+    records = []
+    spawn = multiprocessing.get_context("spawn")
+
+    print(f"{'node':<12} {'size':>6} {'Mpx':>6} {'time (s)':>9} {'prev (s)':>9} {'peak (MB)':>10} "
+          f"{'delta (MB)':>11} {'output (MB)':>12}")
+    try:
+        for size in args.sizes:
+            inputs_dir = os.path.join(workdir, f"inputs_{size}")
+            manifest = os.path.join(inputs_dir, "inputs.json")
+            if os.path.exists(manifest):
+                with open(manifest) as f:
+                    inputs = json.load(f)
+            else:
+                start = time.perf_counter()
+                inputs = make_inputs(inputs_dir, size)
+                with open(manifest, "w") as f:
+                    json.dump(inputs, f)
+                print(f"-- generated {size}x{size} inputs in {time.perf_counter() - start:.1f}s")
+
+            for node in args.nodes:
+                runs = []
+                for _ in range(args.repeat):
+                    rundir = tempfile.mkdtemp(prefix=f"{node}_", dir=workdir)
+                    try:
+                        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                            runs.append(pool.submit(_run_node, node, node_state(node, inputs), rundir).result())
+                    finally:
+                        shutil.rmtree(rundir, ignore_errors=True)
+
+                best = min(runs, key=lambda run: run["seconds"])
+                record = {
+                    "node": node, "size": size, "pixels": size * size, **best,
+                    "backend": os.getenv("GEOAI_RASTER_BACKEND", "numpy"),
+                    "revision": revision, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "cpus": os.cpu_count()
+                }
+                records.append(record)
+
+                prev = previous.get((node, size))
+                prev_s = f"{prev['seconds']:9.2f}" if prev else f"{'-':>9}"
+                print(f"{node:<12} {size:>6} {size * size / 1e6:6.1f} {record['seconds']:9.2f} {prev_s} "
+                      f"{record['peak_rss_mb']:10.0f} {record['delta_rss_mb']:11.0f} {record['output_mb']:12.2f}"
+                      + (f"  ERROR: {record['error']}" if record["error"] else ""))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if records and args.history:
+        os.makedirs(os.path.dirname(args.history) or ".", exist_ok=True)
+        with open(args.history, "a") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        print(f"\nAppended {len(records)} results to {args.history}")
+
+    if any(record["error"] for record in records):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
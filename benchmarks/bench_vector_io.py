@@ -0,0 +1,89 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import rasterio
+import geopandas as gpd
+from rasterio.transform import from_origin
+
+# Repository root on the import path, so the script runs as `python benchmarks/<name>.py`
+# from anywhere as well as with `python -m benchmarks.<name>` from the root
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from tools.polygonize import polygonize
+from tools.vector_io import FORMATS, write_vector, read_vector
+
+# ~1 arc-second pixels, the resolution of the SRTM DEMs the tools threshold
+PIXEL_DEGREES = 1 / 3600
+
+
+def synthetic_mask(path, size, seed=0):
+    # Elevation-like field (a few smooth waves plus noise) thresholded at its median,
+    # giving a mask with many irregular polygons and holes, like a real elevation mask
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    field = np.zeros((size, size), dtype=np.float32)
+    for _ in range(6):
+        fx, fy, phase = rng.uniform(2, 24), rng.uniform(2, 24), rng.uniform(0, 2 * np.pi)
+        field += np.sin(2 * np.pi * (fx * x + fy * y) + phase)
+    field += rng.normal(0, 0.25, field.shape).astype(np.float32)
+    mask = (field < np.median(field)).astype(np.uint8)
+
+    profile = {
+        "driver": "GTiff", "width": size, "height": size, "count": 1, "dtype": "uint8",
+        "crs": "EPSG:4326", "transform": from_origin(72.0, 24.0, PIXEL_DEGREES, PIXEL_DEGREES),
+        "tiled": True, "blockxsize": 512, "blockysize": 512, "compress": "deflate"
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(mask, 1)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare vector output formats on a state-scale elevation mask")
+    parser.add_argument("--size", type=int, default=6000, help="mask edge length in pixels")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per operation (best is reported)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_vector_io_")
+    try:
+        mask_path = synthetic_mask(os.path.join(workdir, "mask.tif"), args.size)
+        start = time.perf_counter()
+        gdf = gpd.GeoDataFrame(geometry=polygonize(mask_path), crs="EPSG:4326")
+        print(f"Mask: {args.size}x{args.size} px -> {len(gdf)} polygons "
+              f"({time.perf_counter() - start:.1f}s to polygonize)")
+
+        # A map-tile-sized query window in the middle of the mask (1/16 of its area)
+        minx, miny, maxx, maxy = gdf.total_bounds
+        w, h = (maxx - minx) / 4, (maxy - miny) / 4
+        cx, cy = (minx + maxx) / 2, (miny + maxy) / 2
+        bbox = (cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2)
+
+        def best(fn):
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                result = fn()
+                times.append(time.perf_counter() - start)
+            return min(times), result
+
+        print(f"\n{'format':<8} {'size (MB)':>10} {'write (s)':>10} {'read (s)':>10} {'bbox read (s)':>14} {'bbox rows':>10}")
+        for fmt, ext in FORMATS.items():
+            path = os.path.join(workdir, f"mask{ext}")
+            write_s, _ = best(lambda: write_vector(gdf, path))
+            read_s, full = best(lambda: read_vector(path))
+            bbox_s, window = best(lambda: read_vector(path, bbox=bbox))
+            assert len(full) == len(gdf)
+            print(f"{fmt:<8} {os.path.getsize(path) / 1e6:10.2f} {write_s:10.2f} {read_s:10.2f} "
+                  f"{bbox_s:14.3f} {len(window):10d}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
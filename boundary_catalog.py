@@ -0,0 +1,192 @@
+import argparse
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# Trailing words that do not change which boundary a name refers to ("Pune city" -> "pune")
+GENERIC_SUFFIXES = ["municipal corporation", "city", "town"]
+
+# Trailing words that name a different administrative unit ("Pune district" is not
+# Pune city): kept in the key, and never matched in place of the bare name
+ADMIN_SUFFIXES = ["metropolitan region", "district", "state", "region"]
+
+# Trailing clauses the query parser sometimes leaves on a region name ("pune that are ...")
+TRAILING_CLAUSE = re.compile(r"\s+(that|which|with|for|in|near|from)\s.*")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS boundaries (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    display TEXT,
+    path TEXT NOT NULL,
+    source TEXT,
+    minx REAL, miny REAL, maxx REAL, maxy REAL,
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    alias TEXT PRIMARY KEY,
+    boundary_id INTEGER NOT NULL REFERENCES boundaries(id) ON DELETE CASCADE
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS boundary_rtree USING rtree(id, minx, maxx, miny, maxy);
+"""
+
+
+def clean_region(region):
+    # File-safe display name, as fetch_boundary has always derived it
+    cleaned = re.sub(r"[^a-zA-Z0-9\s]", "", region)
+    return TRAILING_CLAUSE.sub("", cleaned).strip()
+
+
+def normalize_name(region):
+    # ("pune", ["maharashtra"]) for "Pune City, Maharashtra": accents, case, punctuation
+    # and generic suffixes are dropped; comma-separated qualifiers are kept apart
+    text = unicodedata.normalize("NFKD", region).encode("ascii", "ignore").decode().lower()
+    text = TRAILING_CLAUSE.sub("", text)
+    parts = [" ".join(re.sub(r"[^a-z0-9\s]", " ", part).split()) for part in text.split(",")]
+    parts = [part for part in parts if part]
+    if not parts:
+        return "", []
+
+    base = parts[0]
+    for suffix in GENERIC_SUFFIXES:
+        if base.endswith(" " + suffix):
+            base = base[:-len(suffix) - 1]
+            break
+    return base, parts[1:]
+
+
+class BoundaryCatalog:
+    # Persistent index of fetched boundaries: normalized names and aliases map many
+    # spellings of a place to one stored file, and an R-tree over their bounds lets
+    # sub-regions be found inside an already-cached parent
+    def __init__(self, path="data/boundaries.sqlite"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def _entry(self, row):
+        if row is None:
+            return None
+        if not os.path.exists(row["path"]):
+            # The file was deleted behind our back: forget it so it is fetched again
+            self.remove(row["id"])
+            return None
+        return dict(row)
+
+    def _by_alias(self, alias):
+        return self.conn.execute(
+            "SELECT b.* FROM aliases a JOIN boundaries b ON b.id = a.boundary_id WHERE a.alias = ?", (alias,)
+        ).fetchone()
+
+    def lookup(self, region):
+        base, qualifiers = normalize_name(region)
+        if not base:
+            return None
+
+        with self.lock:
+            row = self._by_alias(" ".join([base] + qualifiers))
+            if row is None and qualifiers:
+                row = self._by_alias(base)
+                # "Aurangabad, Bihar" must not resolve to a cached Aurangabad in Maharashtra
+                if row is not None and not all(q in (row["display"] or "").lower() for q in qualifiers):
+                    row = None
+                if row is None:
+                    row = self._within_parent(base, qualifiers[0])
+            return self._entry(row)
+
+    def _within_parent(self, base, parent_name):
+        # Sub-region named inside a cached parent ("Haveli, Pune"): R-tree search of the parent's bounds
+        parent = self._by_alias(parent_name)
+        if parent is None:
+            return None
+        admin_units = [f"{base} {suffix}" for suffix in ADMIN_SUFFIXES]
+        return self.conn.execute(
+            "SELECT b.* FROM boundary_rtree r JOIN boundaries b ON b.id = r.id "
+            "WHERE r.minx >= ? AND r.maxx <= ? AND r.miny >= ? AND r.maxy <= ? AND b.id != ? "
+            f"AND (b.name = ? OR b.name LIKE ?) AND b.name NOT IN ({', '.join('?' * len(admin_units))})",
+            (parent["minx"], parent["maxx"], parent["miny"], parent["maxy"], parent["id"], base, f"{base} %",
+             *admin_units)
+        ).fetchone()
+
+    def add(self, region, path, bounds, display=None, source=None):
+        base, qualifiers = normalize_name(region)
+        full = " ".join([base] + qualifiers)
+        with self.lock, self.conn:
+            existing = self.conn.execute("SELECT id, path FROM boundaries WHERE name = ?", (base,)).fetchone()
+            # A different place with the same base name keeps its qualified name
+            name = base if existing is None or existing["path"] == path else full
+            replaced = self.conn.execute("SELECT id FROM boundaries WHERE name = ?", (name,)).fetchone()
+            if replaced is not None:
+                self._delete(replaced["id"])
+            cursor = self.conn.execute(
+                "INSERT INTO boundaries (name, display, path, source, minx, miny, maxx, maxy, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, display or region, path, source, *map(float, bounds), time.time())
+            )
+            boundary_id = cursor.lastrowid
+            minx, miny, maxx, maxy = map(float, bounds)
+            self.conn.execute("DELETE FROM boundary_rtree WHERE id = ?", (boundary_id,))
+            self.conn.execute("INSERT INTO boundary_rtree VALUES (?, ?, ?, ?, ?)", (boundary_id, minx, maxx, miny, maxy))
+            for alias in {name, full, " ".join(clean_region(region).lower().split())}:
+                if alias:
+                    self.conn.execute("INSERT OR REPLACE INTO aliases VALUES (?, ?)", (alias, boundary_id))
+        return self.lookup(region)
+
+    def _delete(self, boundary_id):
+        self.conn.execute("DELETE FROM aliases WHERE boundary_id = ?", (boundary_id,))
+        self.conn.execute("DELETE FROM boundary_rtree WHERE id = ?", (boundary_id,))
+        self.conn.execute("DELETE FROM boundaries WHERE id = ?", (boundary_id,))
+
+    def remove(self, boundary_id):
+        with self.conn:
+            self._delete(boundary_id)
+
+    def containing(self, bounds):
+        # Cached boundaries whose extent covers bounds, smallest first
+        minx, miny, maxx, maxy = map(float, bounds)
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT b.* FROM boundary_rtree r JOIN boundaries b ON b.id = r.id "
+                "WHERE r.minx <= ? AND r.maxx >= ? AND r.miny <= ? AND r.maxy >= ? "
+                "ORDER BY (r.maxx - r.minx) * (r.maxy - r.miny)",
+                (minx, maxx, miny, maxy)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def import_layer(self, layer_path, name_field, parent=None, root="data/boundaries"):
+        # Stores every named feature of a layer (e.g. all districts of a state), so
+        # they are answered locally; parent becomes a qualifier alias on each
+        from tools.vector_io import read_vector, write_vector, vector_path
+
+        gdf = read_vector(layer_path)
+        if gdf.crs is None:
+            gdf = gdf.set_crs("EPSG:4326")
+        gdf = gdf.to_crs("EPSG:4326")
+        os.makedirs(root, exist_ok=True)
+
+        count = 0
+        for name, group in gdf.groupby(name_field):
+            region = f"{name}, {parent}" if parent else str(name)
+            path = vector_path(os.path.join(root, clean_region(region).replace(" ", "_")))
+            write_vector(group, path)
+            self.add(str(name), path, group.total_bounds, display=region, source=f"import:{os.path.basename(layer_path)}")
+            count += 1
+        return count
+
+
+if __name__ == "__main__":
+    # Usage: python boundary_catalog.py districts.gpkg --name-field NAME_2 [--parent Maharashtra]
+    parser = argparse.ArgumentParser(description="Import named boundaries into the local boundary catalog")
+    parser.add_argument("layer", help="vector file with one or more named polygons per region")
+    parser.add_argument("--name-field", default="name")
+    parser.add_argument("--parent", help="name of the enclosing region, used to qualify the imported names")
+    args = parser.parse_args()
+    print(f"Imported {BoundaryCatalog().import_layer(args.layer, args.name_field, args.parent)} boundaries")
@@ -0,0 +1,229 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from tracing import add_event
+
+try:
+    import fcntl
+except ImportError:  # Windows: processes sharing a cache may drop each other's entries
+    fcntl = None
+
+# Total size of cached output files before least-recently-used entries are evicted
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# Cache hits only touch access times, so the index is rewritten for them at most this often (seconds)
+SAVE_INTERVAL = 30.0
+
+
+def _file_fingerprint(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+
+def _output_files(value):
+    # Every existing file path referenced (at any depth) by a node's outputs
+    if isinstance(value, str):
+        return [value] if os.path.isfile(value) else []
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        return [path for item in value for path in _output_files(item)]
+    return []
+
+
+@contextmanager
+def _file_lock(lock_path):
+    # Serializes index read-merge-write between processes sharing one cache
+    with open(lock_path, "w") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _failed(outputs):
+    for value in outputs.values():
+        if value is None:
+            return True
+        if isinstance(value, dict) and (value.get("status") == "error" or "error" in value):
+            return True
+    return False
+
+
+class ResultCache:
+    def __init__(self, root="data/cache", max_bytes=None):
+        self.root = root
+        self.max_bytes = max_bytes or int(os.getenv("GEOAI_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self.index_path = os.path.join(root, "index.json")
+        self.lock = threading.Lock()
+        self.entries = self._load()
+        # Keys this process dropped since its last save, so merging does not bring them back
+        self.removed = set()
+        self.dirty = False
+        self.saved_at = time.monotonic()
+        atexit.register(self.flush)
+
+    def _load(self):
+        try:
+            with open(self.index_path) as f:
+                return OrderedDict(json.load(f))
+        except (OSError, ValueError):
+            return OrderedDict()
+
+    def key(self, node, params, inputs):
+        payload = {
+            "node": node,
+            "params": params,
+            "inputs": {name: self._fingerprint(value) for name, value in inputs.items()}
+        }
+        blob = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def _fingerprint(self, value):
+        if isinstance(value, (list, tuple)):
+            return [_file_fingerprint(v) for v in value]
+        if isinstance(value, str):
+            return _file_fingerprint(value)
+        return value
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            # Outputs deleted or rewritten since they were cached invalidate the entry
+            if any(_file_fingerprint(path) != fp for path, fp in entry["files"].items()):
+                self.entries.pop(key)
+                self.removed.add(key)
+                self.dirty = True
+                self._save_if_due()
+                return None
+
+            entry["last_access"] = time.time()
+            self.entries.move_to_end(key)
+            self.dirty = True
+            self._save_if_due()
+            return entry["outputs"]
+
+    def put(self, key, outputs):
+        files = {path: _file_fingerprint(path) for path in _output_files(outputs)}
+        if not files:
+            return
+
+        with self.lock:
+            # Older entries pointing at the same paths now describe overwritten files
+            for stale in [k for k, e in self.entries.items() if k != key and set(e["files"]) & set(files)]:
+                self.entries.pop(stale)
+                self.removed.add(stale)
+
+            self.entries[key] = {
+                "outputs": outputs,
+                "files": files,
+                "size": sum(fp[1] for fp in files.values()),
+                "last_access": time.time()
+            }
+            self.entries.move_to_end(key)
+            self.removed.discard(key)
+            self._save()
+
+    def size(self):
+        return sum(entry["size"] for entry in self.entries.values())
+
+    def _merge(self):
+        # Entries other processes saved since our last load join ours; for keys both
+        # hold, the more recently used copy wins. Entries we dropped stay dropped, and
+        # ours that are gone from disk with their files were evicted elsewhere
+        merged = {key: entry for key, entry in self._load().items() if key not in self.removed}
+        for key, entry in self.entries.items():
+            if key in merged:
+                if entry["last_access"] >= merged[key]["last_access"]:
+                    merged[key] = entry
+            elif all(os.path.exists(path) for path in entry["files"]):
+                merged[key] = entry
+        self.entries = OrderedDict(sorted(merged.items(), key=lambda item: item[1]["last_access"]))
+        self.removed = set()
+
+    def _evict(self):
+        # The cache owns the product files its entries record (masks, maps and rankings
+        # under data/): evicting an entry deletes them, unless a remaining entry still
+        # references the same path or the file was rewritten since it was recorded.
+        # The most recent entry is always kept, even if it alone exceeds the budget
+        while len(self.entries) > 1 and self.size() > self.max_bytes:
+            key, entry = self.entries.popitem(last=False)
+            add_event("cache.evict", key=key, size=entry["size"])
+            referenced = {path for other in self.entries.values() for path in other["files"]}
+            for path, fp in entry["files"].items():
+                if path in referenced or _file_fingerprint(path) != fp:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _save(self):
+        os.makedirs(self.root, exist_ok=True)
+        with _file_lock(f"{self.index_path}.lock"):
+            self._merge()
+            self._evict()
+            tmp_path = f"{self.index_path}.{uuid.uuid4().hex}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump(self.entries, f)
+                os.replace(tmp_path, self.index_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        self.dirty = False
+        self.saved_at = time.monotonic()
+
+    def _save_if_due(self):
+        if self.dirty and time.monotonic() - self.saved_at >= SAVE_INTERVAL:
+            self._save()
+
+    def flush(self):
+        with self.lock:
+            if self.dirty:
+                self._save()
+
+    def lookup(self, node, state, params, inputs):
+        # Returns (key, stored outputs or None) for a node run on this state
+        key = self.key(
+            node,
+            {name: state.get(name) for name in params},
+            {name: state.get(name) for name in inputs}
+        )
+        return key, self.get(key)
+
+    def record(self, key, result, outputs):
+        produced = {name: result.get(name) for name in outputs}
+        if not result.get("error") and not _failed(produced):
+            self.put(key, produced)
+
+    def wrap(self, node, fn, params, inputs, outputs):
+        # Node wrapper: returns the stored outputs on a hit, runs and records fn on a miss
+        def cached_fn(state):
+            key, hit = self.lookup(node, state, params, inputs)
+            if hit is not None:
+                add_event("cache.hit", node=node, key=key)
+                state["cot_log"].append(f"♻ Cache hit for {node}")
+                return {**state, **hit, "step": "complete"}
+
+            result = fn(state)
+            self.record(key, result, outputs)
+            return result
+
+        cached_fn.__name__ = getattr(fn, "__name__", node)
+        return cached_fn
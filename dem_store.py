@@ -0,0 +1,212 @@
+import math
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+
+# Edge length of a full-resolution store tile, in degrees (the SRTM 1°×1° grid)
+TILE_DEGREES = 1
+
+# Tiles downloaded at once (GEOAI_DEM_DOWNLOAD_WORKERS overrides)
+DEFAULT_DOWNLOAD_WORKERS = 4
+
+# Pyramid levels, in metres per pixel; 30 m is full SRTM resolution
+DEM_SCALES = [30, 90, 250, 500, 1000]
+FULL_SCALE = DEM_SCALES[0]
+
+# Pixels a region may cover at the planned level (GEOAI_DEM_PIXEL_BUDGET overrides)
+DEFAULT_PIXEL_BUDGET = 16_000_000
+
+METERS_PER_DEGREE = 111_320
+
+# Downloads are snapped to one global grid per level: the SRTM 1 arc-second grid
+# (3600 px per degree) at 30 m, and a whole divisor of it at coarser levels, so
+# every store tile starts and ends on a pixel edge of its neighbours
+SRTM_PIXELS_PER_DEGREE = 3600
+
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+
+def path_lock(path):
+    # One lock per output path, so concurrent requests for the same file produce it
+    # once: the first thread writes it while the others wait, then find it in place
+    key = os.path.abspath(path)
+    with _path_locks_guard:
+        return _path_locks.setdefault(key, threading.Lock())
+
+
+def region_pixels(bounds, scale):
+    # Approximate pixel count of WGS84 bounds at scale metres per pixel
+    minx, miny, maxx, maxy = bounds
+    lat = math.radians((miny + maxy) / 2)
+    width_m = (maxx - minx) * METERS_PER_DEGREE * math.cos(lat)
+    height_m = (maxy - miny) * METERS_PER_DEGREE
+    return width_m * height_m / scale ** 2
+
+
+def plan_scale(bounds, pixel_budget=None, accuracy_m=None, refine=False):
+    # Pyramid level for a region: full resolution when refining; the coarsest level
+    # no coarser than accuracy_m when one is asked for; otherwise the finest level
+    # whose pixel count fits the budget (a national query lands on a coarse preview)
+    if refine:
+        return FULL_SCALE
+    if accuracy_m:
+        return max([s for s in DEM_SCALES if s <= accuracy_m] or [FULL_SCALE])
+    budget = pixel_budget or int(os.getenv("GEOAI_DEM_PIXEL_BUDGET", DEFAULT_PIXEL_BUDGET))
+    for scale in DEM_SCALES:
+        if region_pixels(bounds, scale) <= budget:
+            return scale
+    return DEM_SCALES[-1]
+
+
+def level_suffix(scale):
+    # Full resolution keeps the historical names; coarser levels carry their scale
+    return "" if not scale or scale == FULL_SCALE else f"_{scale}m"
+
+
+def dem_level_path(region, scale, ext):
+    return f"data/srtm_{region}{level_suffix(scale)}{ext}"
+
+
+def tile_degrees(scale):
+    # Coarser levels use proportionally larger tiles, so a tile has about the same
+    # pixel count at every level (a national preview is a handful of downloads)
+    return TILE_DEGREES * max(1, round(scale / FULL_SCALE))
+
+
+def pixels_per_degree(scale):
+    return max(1, round(SRTM_PIXELS_PER_DEGREE * FULL_SCALE / scale))
+
+
+def snapped_grid(bounds, scale):
+    # (affine transform as a 6-list, (height, width)) of bounds snapped outwards to the level's grid
+    n = pixels_per_degree(scale)
+    minx, miny, maxx, maxy = bounds
+    col0, col1 = math.floor(minx * n + 1e-6), math.ceil(maxx * n - 1e-6)
+    row0, row1 = math.floor(-maxy * n + 1e-6), math.ceil(-miny * n - 1e-6)
+    return [1 / n, 0, col0 / n, 0, -1 / n, -row0 / n], (row1 - row0, col1 - col0)
+
+
+def tile_name(lon, lat):
+    # SRTM-style name of the tile whose south-west corner is (lon, lat), e.g. N23E072
+    ns = "N" if lat >= 0 else "S"
+    ew = "E" if lon >= 0 else "W"
+    return f"{ns}{abs(lat):02d}{ew}{abs(lon):03d}"
+
+
+def tiles_for_bounds(bounds, degrees=TILE_DEGREES):
+    minx, miny, maxx, maxy = bounds
+    lons = range(math.floor(minx / degrees) * degrees, math.ceil(maxx / degrees) * degrees, degrees)
+    lats = range(math.floor(miny / degrees) * degrees, math.ceil(maxy / degrees) * degrees, degrees)
+    return [(lon, lat) for lat in lats for lon in lons]
+
+
+class DemTileStore:
+    # Shared cache of fixed-grid DEM tiles; regions are served as VRT mosaics
+    # over the cached tiles, so overlapping regions never download a pixel twice
+    def __init__(self, provider, root="data/dem_tiles", scale=30):
+        self.provider = provider
+        self.root = root
+        self.scale = scale
+        self.degrees = tile_degrees(scale)
+
+    def tile_path(self, lon, lat):
+        level = f"{self.scale}m" if self.degrees == TILE_DEGREES else f"{self.scale}m_{self.degrees}deg"
+        return os.path.join(self.root, level, f"{tile_name(lon, lat)}.tif")
+
+    def _download(self, tile):
+        from tools.raster_io import to_cog
+
+        lon, lat = tile
+        path = self.tile_path(lon, lat)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with path_lock(path):
+            if os.path.exists(path):
+                return path
+            # Download next to the final path and convert into place, so a crash never leaves a partial tile
+            tmp_path = f"{path[:-4]}.{uuid.uuid4().hex}.part.tif"
+            bounds = (max(lon, -180), max(lat, -90), min(lon + self.degrees, 180), min(lat + self.degrees, 90))
+            try:
+                self.provider.fetch_dem(bounds, tmp_path, scale=self.scale)
+                return to_cog(tmp_path, path, resampling="average")
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def ensure_tiles(self, bounds):
+        missing = self.missing_tiles(bounds)
+        if missing:
+            workers = int(os.getenv("GEOAI_DEM_DOWNLOAD_WORKERS", DEFAULT_DOWNLOAD_WORKERS))
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(missing)))) as pool:
+                list(pool.map(self._download, missing))
+        return [self.tile_path(*tile) for tile in tiles_for_bounds(bounds, self.degrees)]
+
+    def missing_tiles(self, bounds):
+        return [tile for tile in tiles_for_bounds(bounds, self.degrees) if not os.path.exists(self.tile_path(*tile))]
+
+    def mosaic(self, bounds, vrt_path):
+        tile_paths = self.ensure_tiles(bounds)
+        write_vrt(tile_paths, vrt_path)
+        return vrt_path
+
+
+def write_vrt(tile_paths, vrt_path):
+    # Minimal GDAL VRT over north-up tiles in one CRS. Like gdalbuildvrt, each tile is
+    # placed at its exact (possibly fractional) pixel position on the first tile's
+    # grid, so tiles off that grid are resampled into place rather than shifted
+    import rasterio
+    from rasterio.dtypes import _gdal_typename
+
+    tiles = []
+    for path in tile_paths:
+        with rasterio.open(path) as src:
+            tiles.append((path, src.bounds, src.width, src.height, src.res, src.dtypes[0], src.nodata, src.crs))
+
+    res_x, res_y = tiles[0][4]
+    dtype, nodata, crs = tiles[0][5], tiles[0][6], tiles[0][7]
+    left = min(t[1].left for t in tiles)
+    top = max(t[1].top for t in tiles)
+    right = max(t[1].right for t in tiles)
+    bottom = min(t[1].bottom for t in tiles)
+    width = math.ceil((right - left) / res_x - 1e-6)
+    height = math.ceil((top - bottom) / res_y - 1e-6)
+
+    vrt_dir = os.path.dirname(os.path.abspath(vrt_path))
+    sources = []
+    for path, tile_bounds, tile_width, tile_height, *_ in tiles:
+        x_off = _vrt_number((tile_bounds.left - left) / res_x)
+        y_off = _vrt_number((top - tile_bounds.top) / res_y)
+        x_size = _vrt_number((tile_bounds.right - tile_bounds.left) / res_x)
+        y_size = _vrt_number((tile_bounds.top - tile_bounds.bottom) / res_y)
+        sources.append(f"""    <SimpleSource>
+      <SourceFilename relativeToVRT="1">{escape(os.path.relpath(os.path.abspath(path), vrt_dir))}</SourceFilename>
+      <SourceBand>1</SourceBand>
+      <SrcRect xOff="0" yOff="0" xSize="{tile_width}" ySize="{tile_height}" />
+      <DstRect xOff="{x_off}" yOff="{y_off}" xSize="{x_size}" ySize="{y_size}" />
+    </SimpleSource>""")
+
+    nodata_xml = f"\n    <NoDataValue>{nodata}</NoDataValue>" if nodata is not None else ""
+    vrt = f"""<VRTDataset rasterXSize="{width}" rasterYSize="{height}">
+  <SRS>{escape(crs.to_wkt())}</SRS>
+  <GeoTransform>{left!r}, {res_x!r}, 0.0, {top!r}, 0.0, {-res_y!r}</GeoTransform>
+  <VRTRasterBand dataType="{_gdal_typename(dtype)}" band="1">{nodata_xml}
+{chr(10).join(sources)}
+  </VRTRasterBand>
+</VRTDataset>
+"""
+    tmp_path = f"{vrt_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(vrt)
+        os.replace(tmp_path, vrt_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return vrt_path
+
+
+def _vrt_number(value):
+    # Whole pixel counts are written as integers; anything else keeps its fraction
+    return round(value) if abs(value - round(value)) < 1e-6 else round(value, 6)
@@ -1,220 +1,429 @@
-from langgraph.graph import StateGraph
-from langchain_groq.chat_models import ChatGroq
-from tools.raster_tool import raster_tool_fn
-from tools.vector_tool import vector_tool_fn
-from tools.disaster_tool import disaster_safe_tool_fn
-from tools.ranking_tool import ranking_tool_fn
-from tools.suitability_tool import suitability_tool_fn
-
-import osmnx as ox
-import os
-import ee
-import geemap
-import geopandas as gpd
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-os.makedirs("data", exist_ok=True)
-
-# Initialize LLM and Earth Engine
-llm = ChatGroq(model="llama3-8b-8192")
-ee.Authenticate(auth_mode='notebook')
-ee.Initialize()
-
-# ---------------------- Helpers ----------------------
-
-def fetch_boundary(region):
-    import re
-    clean_region = re.sub(r"[^a-zA-Z0-9\s]", "", region)
-    clean_region = re.sub(r"\s+(that|which|with|for|in|near|from)\s.*", "", clean_region).strip()
-
-    path = f"data/{clean_region}_boundary.geojson"
-    if not os.path.exists(path):
-        try:
-            gdf = ox.geocode_to_gdf(clean_region)
-            gdf.to_file(path, driver="GeoJSON")
-        except Exception as e:
-            raise RuntimeError(f"Failed to fetch boundary for '{clean_region}': {e}")
-    return path
-
-
-
-def fetch_dem(region):
-    region_path = fetch_boundary(region)
-    dem_path = f"data/srtm_{region}.tif"
-    if os.path.exists(dem_path):
-        return dem_path
-
-    gdf = gpd.read_file(region_path)
-    bounds = gdf.total_bounds  # [minx, miny, maxx, maxy]
-    dem = ee.Image("USGS/SRTMGL1_003").clip(ee.Geometry.BBox(*bounds))
-    geemap.download_ee_image(dem, filename=dem_path, scale=30, crs='EPSG:4326')
-    return dem_path
-
-# ---------------------- Reasoning Node (with LLM) ----------------------
-
-def reasoning_node(state):
-    import re
-    query = state.get("query", "").lower()
-    state["cot_log"].append(f"Received query: '{query}'")
-
-    # Extract region
-    match = re.search(r'(?:in|around|near|buffer)\s+([a-zA-Z ,]+)', query)
-    region = match.group(1).strip() if match else "India"
-    state["region"] = region.replace(" ", "_")
-    state["cot_log"].append(f"Extracted region: '{region}'")
-
-    # Fetch region boundary and DEM
-    region_path = fetch_boundary(region)
-    state["cot_log"].append(f"Fetched boundary: {region_path}")
-    dem_path = fetch_dem(region)
-    state["cot_log"].append(f"Fetched DEM: {dem_path}")
-
-    # Optional: Extract top_n for ranking
-    match_n = re.search(r'(top|best)\s+(\d+)', query)
-    if match_n:
-        state["top_n"] = int(match_n.group(2))
-        state["cot_log"].append(f"Extracted top_n: {state['top_n']}")
-
-    # Optional: Extract buffer distance
-    match_buffer = re.search(r'buffer\s+(\d{2,5})\s*m?', query)
-    buffer_distance = int(match_buffer.group(1)) if match_buffer else 1000
-    if match_buffer:
-        state["cot_log"].append(f"Extracted buffer distance: {buffer_distance}m")
-
-    # Optional: Extract threshold for elevation
-    match_thresh = re.search(r'(?:above|below|under|over|greater than|less than)?\s*(\d{2,5})\s*m?', query)
-    threshold = int(match_thresh.group(1)) if match_thresh else 50
-    comparison = "below"  # default
-    if "above" in query or "greater than" in query or "over" in query:
-        comparison = "above"
-    elif "below" in query or "less than" in query or "under" in query:
-        comparison = "below"
-
-    # Routing logic
-    if "rank" in query or "top" in query:
-        state["cot_log"].append("Routing to ranking_analysis")
-        return {
-            **state,
-            "suitability_output": f"data/{state['region']}_suitability.tif",
-            "map_path": f"data/{state['region']}_top_{state.get('top_n', 5)}_locations.geojson",
-            "map_title": "📍 Top Ranked Locations",
-            "step": "ranking_analysis"
-        }
-    
-    elif any(term in query for term in ["disaster", "hazard", "safe zone", "safe areas", "risk", "safe"]):
-        state["cot_log"].append("Routing to disaster_safe_analysis")
-
-        # Extract threshold
-        match_thresh = re.search(r'(?:below|under|less than)\\s*(\\d{2,5})\\s*m?', query)
-        threshold = int(match_thresh.group(1)) if match_thresh else 50
-        comparison = "below"
-        
-        # You can allow 'above' threshold hazard detection too, if needed
-        if "above" in query or "greater than" in query or "over" in query:
-            comparison = "above"
-            threshold = int(match_thresh.group(1)) if match_thresh else 50
-
-        state["threshold"] = threshold
-        state["comparison"] = comparison
-        state["cot_log"].append(f"Extracted hazard threshold: {comparison} {threshold}m")
-
-        # Path to hazard mask (make it dynamic)
-        hazard_mask_path = f"data/{state['region']}_mask_{comparison}_{threshold}m.tif"
-        state["hazard_mask_path"] = hazard_mask_path
-        state["region_path"] = region_path
-
-        # Check if hazard mask exists; if not, you could optionally generate it
-        if not os.path.exists(hazard_mask_path):
-            state["cot_log"].append(f"⚠ Hazard mask file does not exist: {hazard_mask_path}")
-            return {
-                **state,
-                "step": "complete",
-                "error": f"Hazard mask not found: {hazard_mask_path}"
-            }
-
-        return {
-            **state,
-            "map_path": f"data/{state['region']}_safe_zones.geojson",
-            "map_title": "🛟 Disaster Safe Zones",
-            "step": "disaster_safe_analysis"
-        }
-
-    elif "suitable" in query or "suitability" in query:
-        state["cot_log"].append("Routing to suitability_analysis")
-        return {
-            **state,
-            "region_path": region_path,
-            "dem_path": dem_path,
-            "map_path": f"data/{state['region']}_suitability.tif",
-            "map_title": "🗺️ Suitability Map",
-            "step": "suitability_analysis"
-        }
-
-    elif any(term in query for term in ["elevation", "height", "meters", "m", "above", "below", "less than", "greater than"]):
-        state["cot_log"].append(f"Extracted threshold: {threshold}m")
-        state["cot_log"].append(f"Comparison direction: {comparison}")
-        return {
-            **state,
-            "region_path": region_path,
-            "dem_path": dem_path,
-            "threshold": threshold,
-            "comparison": comparison,
-            "map_path": f"data/{state['region']}_mask_{comparison}_{threshold}m.geojson",
-            "map_title": f"🌄 Elevation {comparison.title()} {threshold}m",
-            "step": "raster_analysis"
-        }
-
-    
-
-    else:
-        state["cot_log"].append("Routing to vector_analysis")
-        return {
-            **state,
-            "vector_path": region_path,
-            "buffer_distance": buffer_distance,
-            "map_path": f"data/{state['region']}_buffered.geojson",
-            "map_title": "📏 Buffered Region",
-            "step": "vector_analysis"
-        }
-
-# ---------------------- Final Node ----------------------
-
-def observation_node(state):
-    state["cot_log"].append("✅ Workflow complete")
-    return {**state, "step": "complete"}
-
-# ---------------------- LangGraph Setup ----------------------
-
-workflow = StateGraph(state_schema=dict)
-workflow.add_node("reasoning", reasoning_node)
-workflow.add_node("raster_analysis", raster_tool_fn)
-workflow.add_node("vector_analysis", vector_tool_fn)
-workflow.add_node("suitability_analysis", suitability_tool_fn)
-workflow.add_node("ranking_analysis", ranking_tool_fn)
-workflow.add_node("disaster_safe_analysis", disaster_safe_tool_fn)
-workflow.add_node("observe", observation_node)
-
-workflow.set_entry_point("reasoning")
-workflow.add_conditional_edges("reasoning", lambda s: s["step"])
-workflow.add_edge("raster_analysis", "observe")
-workflow.add_edge("vector_analysis", "observe")
-workflow.add_edge("suitability_analysis", "observe")
-workflow.add_edge("ranking_analysis", "observe")
-workflow.add_edge("disaster_safe_analysis", "observe")
-workflow.add_conditional_edges("observe", lambda s: s["step"])
-
-app = workflow.compile()
-
-if __name__ == "__main__":
-    query = input("🧠 Ask your spatial query: ")
-    state = {"query": query, "cot_log": []}
-    final = app.invoke(state)
-
-    print("\n🧩 Chain of Thought:")
-    for step in final.get("cot_log", []):
-        print(" -", step)
-
-    print("\n📦 Final Output State:")
-    print({k: v for k, v in final.items() if k != "cot_log"})
+from langgraph.graph import StateGraph
+from cache import ResultCache
+from providers import get_provider, LocalProvider
+from boundary_catalog import BoundaryCatalog, clean_region
+from dem_store import DemTileStore, DEM_SCALES, FULL_SCALE, plan_scale, dem_level_path, level_suffix, path_lock
+from tracing import traced, add_event
+from working_set import active
+from streaming import streamed, raster_preview
+from tools.vector_io import vector_path
+from query_parser import (
+    parse_query, llm_parse, FAST_PATH_CONFIDENCE,
+    DEFAULT_REGION, DEFAULT_THRESHOLD, DEFAULT_BUFFER_DISTANCE
+)
+
+import importlib
+import os
+from functools import lru_cache
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# ---------------------- Lazy Clients ----------------------
+
+# The LLM, Earth Engine and the GIS stacks (osmnx, geemap, geopandas, rasterio)
+# are only imported and initialized the first time a node needs them, so
+# importing this module and compiling the graph stay fast and offline.
+# Earth Engine is initialized by its data provider (providers.py).
+
+@lru_cache(maxsize=None)
+def get_llm():
+    from langchain_groq.chat_models import ChatGroq
+    return ChatGroq(model="llama3-8b-8192")
+
+
+class LazyTool:
+    # Graph node that imports its tool module on the first call
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+        self.__name__ = name
+
+    def __call__(self, state):
+        fn = getattr(importlib.import_module(self.module), self.name)
+        return fn(state)
+
+
+raster_tool_fn = LazyTool("tools.raster_tool", "raster_tool_fn")
+vector_tool_fn = LazyTool("tools.vector_tool", "vector_tool_fn")
+disaster_safe_tool_fn = LazyTool("tools.disaster_tool", "disaster_safe_tool_fn")
+ranking_tool_fn = LazyTool("tools.ranking_tool", "ranking_tool_fn")
+suitability_tool_fn = LazyTool("tools.suitability_tool", "suitability_tool_fn")
+
+# ---------------------- Helpers ----------------------
+
+@lru_cache(maxsize=None)
+def get_catalog():
+    return BoundaryCatalog()
+
+
+def resolve_boundary(region):
+    # Catalog entry for a region: any spelling already cached ("Pune", "pune city",
+    # "Pune, Maharashtra") or a sub-region inside a cached parent is answered
+    # locally; otherwise the boundary is fetched once and registered
+    catalog = get_catalog()
+    entry = catalog.lookup(region)
+    if entry is not None:
+        add_event("boundary.cache_hit", path=entry["path"], region=entry["name"])
+        return entry
+
+    os.makedirs("data", exist_ok=True)
+    clean = clean_region(region)
+    path = vector_path(f"data/{clean}_boundary")
+    # Concurrent sessions asking for the same region: one fetches, the others wait and reuse it
+    with path_lock(path):
+        entry = catalog.lookup(region)
+        if entry is not None:
+            return entry
+        if not os.path.exists(path):
+            add_event("boundary.download", region=clean)
+            try:
+                get_provider().fetch_boundary(clean, path)
+            except Exception as e:
+                raise RuntimeError(f"Failed to fetch boundary for '{clean}': {e}")
+
+        from tools.vector_io import read_vector_cached
+        gdf = read_vector_cached(path)
+        wgs84 = gdf.to_crs("EPSG:4326") if gdf.crs is not None else gdf
+        display = str(gdf["display_name"].iloc[0]) if "display_name" in gdf.columns else clean
+        return catalog.add(region, path, wgs84.total_bounds, display=display, source=get_provider().name)
+
+
+def fetch_boundary(region):
+    return resolve_boundary(region)["path"]
+
+
+def dem_scale(region, refine=False, accuracy_m=None, pixel_budget=None):
+    entry = resolve_boundary(region)
+    bounds = (entry["minx"], entry["miny"], entry["maxx"], entry["maxy"])
+    return plan_scale(bounds, pixel_budget=pixel_budget, accuracy_m=accuracy_m, refine=refine)
+
+
+def fetch_dem(region, scale=None):
+    # scale (metres per pixel) picks a pyramid level; by default the planner's choice
+    entry = resolve_boundary(region)
+    region_path = entry["path"]
+    scale = scale or dem_scale(region)
+
+    # Later queries of a session on the same region and level skip the checks below
+    working_set = active()
+    key = ("dem_path", entry["name"], scale)
+    dem_path = working_set.get(key) if working_set is not None else None
+    if dem_path and os.path.exists(dem_path):
+        return dem_path
+
+    dem_path = download_dem(entry["name"].replace(" ", "_"), region_path, scale)
+
+    # Sidecar elevation histogram / per-window min-max, built once per DEM
+    if os.getenv("GEOAI_ELEVATION_INDEX", "1") != "0":
+        from tools.elevation_index import load_index, build_index, index_path
+        with path_lock(index_path(dem_path)):
+            if load_index(dem_path, region_path) is None:
+                add_event("dem.index_build", path=dem_path)
+                build_index(dem_path, region_path)
+    if working_set is not None:
+        working_set.put(key, dem_path)
+    return dem_path
+
+
+def download_dem(region, region_path, scale=FULL_SCALE):
+    provider = get_provider()
+
+    # Remote providers go through the shared tile store (one tile set per pyramid
+    # level, 1°×1° at full resolution); regions become VRT mosaics
+    use_store = provider.tiled_store and os.getenv("GEOAI_DEM_STORE", "1") != "0"
+    dem_path = dem_level_path(region, scale, ".vrt" if use_store else ".tif")
+    # One download per DEM path; threads asking for it meanwhile wait, then take the cache hit
+    with path_lock(dem_path):
+        return _download_dem(provider, region_path, scale, use_store, dem_path)
+
+
+def _download_dem(provider, region_path, scale, use_store, dem_path):
+    if os.path.exists(dem_path):
+        add_event("dem.cache_hit", path=dem_path)
+        return dem_path
+
+    from tools.vector_io import read_vector_cached
+
+    gdf = read_vector_cached(region_path)
+    bounds = gdf.total_bounds  # [minx, miny, maxx, maxy]
+    if use_store:
+        store = DemTileStore(provider, scale=scale)
+        add_event("dem.mosaic", tiles_downloaded=len(store.missing_tiles(bounds)))
+        return store.mosaic(bounds, dem_path)
+
+    from tools.raster_io import to_cog
+
+    # A DEM already on disk at this level or finer, for this region or an enclosing
+    # one, is cropped / averaged down locally instead of downloading
+    for cached in get_catalog().containing(bounds):
+        name = cached["name"].replace(" ", "_")
+        for level in reversed([s for s in DEM_SCALES if s <= scale]):
+            source = dem_level_path(name, level, ".tif")
+            if source != dem_path and os.path.exists(source):
+                add_event("dem.derived", source=source, scale=scale)
+                return to_cog(LocalProvider(dem=source).fetch_dem(bounds, dem_path, scale=scale), resampling="average")
+
+    add_event("dem.download", path=dem_path)
+    return to_cog(provider.fetch_dem(bounds, dem_path, scale=scale), resampling="average")
+
+
+def export_dem(dem_path, region_path):
+    # Downloadable GeoTIFF of a DEM mosaic: the region's window of the VRT, written
+    # once as a COG next to it and rebuilt when the mosaic is newer
+    export_path = f"{os.path.splitext(dem_path)[0]}_export.tif"
+    with path_lock(export_path):
+        if not os.path.exists(export_path) or os.path.getmtime(export_path) < os.path.getmtime(dem_path):
+            import rasterio
+            from tools.raster_io import export_window
+            from tools.vector_io import read_vector_cached
+
+            region = read_vector_cached(region_path)
+            with rasterio.open(dem_path) as src:
+                if region.crs is not None and region.crs != src.crs:
+                    region = region.to_crs(src.crs)
+            add_event("dem.export", path=export_path)
+            export_window(dem_path, export_path, region.total_bounds)
+    return export_path
+
+# ---------------------- Reasoning Node (rules first, LLM fallback) ----------------------
+
+def parse(query):
+    parsed = parse_query(query)
+    if parsed["confidence"] >= FAST_PATH_CONFIDENCE:
+        return parsed
+    try:
+        return llm_parse(query, get_llm(), fallback=parsed)
+    except Exception:
+        # LLM unavailable or unparseable reply: keep the rule-based parse
+        return parsed
+
+
+def reasoning_node(state):
+    query = state.get("query", "").lower()
+    state["cot_log"].append(f"Received query: '{query}'")
+
+    parsed = parse(query)
+    state["cot_log"].append(f"Parsed query via {parsed['source']} (confidence {parsed['confidence']})")
+
+    # Extract region
+    region = parsed["region"] or DEFAULT_REGION
+    state["region"] = region.replace(" ", "_")
+    state["cot_log"].append(f"Extracted region: '{region}'")
+
+    # Fetch region boundary and DEM
+    region_path = fetch_boundary(region)
+    state["cot_log"].append(f"Fetched boundary: {region_path}")
+
+    # Coarsest pyramid level that answers the query well; "refine" forces full resolution
+    refine = bool(state.get("refine") or parsed.get("refine"))
+    scale = state.get("dem_scale") or dem_scale(
+        region, refine=refine, accuracy_m=state.get("accuracy_m") or parsed.get("resolution")
+    )
+    state["dem_scale"] = scale
+    state["cot_log"].append(
+        f"Planned DEM resolution: {scale} m" + ("" if scale == FULL_SCALE else " (preview; refine for 30 m)")
+    )
+    dem_path = fetch_dem(region, scale=scale)
+    state["cot_log"].append(f"Fetched DEM: {dem_path}")
+    if state.get("previews"):
+        raster_preview(dem_path, f"Elevation of {region} (preview)", node="reasoning")
+
+    # Optional: Extract top_n for ranking
+    if parsed.get("stats_only"):
+        state["stats_only"] = True
+        state["cot_log"].append("Area statistics only (no map)")
+
+    if parsed["top_n"]:
+        state["top_n"] = parsed["top_n"]
+        state["cot_log"].append(f"Extracted top_n: {state['top_n']}")
+
+    # Optional: Extract buffer distance
+    buffer_distance = parsed["buffer_distance"] or DEFAULT_BUFFER_DISTANCE
+    if parsed["buffer_distance"]:
+        state["cot_log"].append(f"Extracted buffer distance: {buffer_distance}m")
+
+    # Optional: Extract threshold for elevation
+    threshold = parsed["threshold"] if parsed["threshold"] is not None else DEFAULT_THRESHOLD
+    comparison = parsed["comparison"]
+    intent = parsed["intent"] or "vector_analysis"
+
+    # Routing logic
+    if intent == "ranking_analysis":
+        state["cot_log"].append("Routing to ranking_analysis")
+        return {
+            **state,
+            "suitability_output": f"data/{state['region']}_suitability.tif",
+            "map_path": vector_path(f"data/{state['region']}_top_{state.get('top_n', 5)}_locations"),
+            "map_title": "📍 Top Ranked Locations",
+            "step": "ranking_analysis"
+        }
+    
+    elif intent == "disaster_safe_analysis":
+        state["cot_log"].append("Routing to disaster_safe_analysis")
+
+        state["threshold"] = threshold
+        state["comparison"] = comparison
+        state["cot_log"].append(f"Extracted hazard threshold: {comparison} {threshold}m")
+
+        # A mask from an earlier elevation query is reused; otherwise the tool
+        # thresholds the DEM itself
+        hazard_mask_path = f"data/{state['region']}_mask_{comparison}_{threshold}m{level_suffix(scale)}.tif"
+        state["hazard_mask_path"] = hazard_mask_path
+        state["region_path"] = region_path
+        state["dem_path"] = dem_path
+
+        if not os.path.exists(hazard_mask_path):
+            state["cot_log"].append(f"No hazard mask at {hazard_mask_path}; it will be derived from the DEM")
+
+        return {
+            **state,
+            "map_path": vector_path(f"data/{state['region']}_safe_zones{level_suffix(scale)}"),
+            "map_title": "🛟 Disaster Safe Zones",
+            "step": "disaster_safe_analysis"
+        }
+
+    elif intent == "suitability_analysis":
+        state["cot_log"].append("Routing to suitability_analysis")
+        return {
+            **state,
+            "region_path": region_path,
+            "dem_path": dem_path,
+            "map_path": f"data/{state['region']}_suitability.tif",
+            "map_title": "🗺️ Suitability Map",
+            "step": "suitability_analysis"
+        }
+
+    elif intent == "raster_analysis":
+        state["cot_log"].append(f"Extracted threshold: {threshold}m")
+        state["cot_log"].append(f"Comparison direction: {comparison}")
+        return {
+            **state,
+            "region_path": region_path,
+            "dem_path": dem_path,
+            "threshold": threshold,
+            "comparison": comparison,
+            "map_path": None if state.get("stats_only") else vector_path(f"data/{state['region']}_mask_{comparison}_{threshold}m{level_suffix(scale)}"),
+            "map_title": f"🌄 Elevation {comparison.title()} {threshold}m",
+            "step": "raster_analysis"
+        }
+
+    
+
+    else:
+        state["cot_log"].append("Routing to vector_analysis")
+        return {
+            **state,
+            "vector_path": region_path,
+            "buffer_distance": buffer_distance,
+            "map_path": vector_path(f"data/{state['region']}_buffered"),
+            "map_title": "📏 Buffered Region",
+            "step": "vector_analysis"
+        }
+
+# ---------------------- Final Node ----------------------
+
+def observation_node(state):
+    state["cot_log"].append("✅ Workflow complete")
+    return {**state, "step": "complete"}
+
+# ---------------------- Result Cache ----------------------
+
+# Per tool node: state parameters and input files that determine its output,
+# and the state keys holding the output it produces
+CACHE_SPECS = {
+    "raster_analysis": {
+        "params": ["region", "threshold", "comparison", "simplify_tolerance", "dissolve", "stats_only"],
+        "inputs": ["region_path", "dem_path"],
+        "outputs": ["raster_result"]
+    },
+    "vector_analysis": {
+        "params": ["region", "buffer_distance", "buffer_resolution", "buffer_simplify"],
+        "inputs": ["vector_path"],
+        "outputs": ["vector_result"]
+    },
+    "suitability_analysis": {
+        "params": ["region", "weights"],
+        "inputs": ["criteria_paths"],
+        "outputs": ["suitability_output"]
+    },
+    "ranking_analysis": {
+        "params": ["region", "top_n", "min_spacing", "weights"],
+        "inputs": ["suitability_output", "criteria_paths"],
+        "outputs": ["ranking_output"]
+    },
+    "disaster_safe_analysis": {
+        "params": ["region", "threshold", "comparison", "simplify_tolerance", "dissolve"],
+        "inputs": ["hazard_mask_path", "region_path", "dem_path"],
+        "outputs": ["disaster_safe_result"]
+    }
+}
+
+result_cache = ResultCache()
+
+
+def cache_enabled():
+    return os.getenv("GEOAI_CACHE", "1") != "0"
+
+
+def cached(node, fn):
+    if not cache_enabled():
+        return fn
+    return result_cache.wrap(node, fn, **CACHE_SPECS[node])
+
+# ---------------------- LangGraph Setup ----------------------
+
+TOOL_NODES = {
+    "raster_analysis": raster_tool_fn,
+    "vector_analysis": vector_tool_fn,
+    "suitability_analysis": suitability_tool_fn,
+    "ranking_analysis": ranking_tool_fn,
+    "disaster_safe_analysis": disaster_safe_tool_fn
+}
+
+
+def build_app(reasoning=reasoning_node, wrap_tool=cached, trace=True):
+    # wrap_tool(name, fn) returns the node registered for each tool; the
+    # default adds the result cache, the async service swaps in its own.
+    # With trace, every node records a span (timing, memory, I/O) in state["trace"];
+    # every node streams its progress under app.stream (see streaming.py)
+    wrap = traced if trace else (lambda name, fn: fn)
+    node = lambda name, fn: wrap(name, streamed(name, fn))
+
+    workflow = StateGraph(state_schema=dict)
+    workflow.add_node("reasoning", node("reasoning", reasoning))
+    for name, fn in TOOL_NODES.items():
+        workflow.add_node(name, node(name, wrap_tool(name, fn)))
+    workflow.add_node("observe", node("observe", observation_node))
+
+    workflow.set_entry_point("reasoning")
+    workflow.add_conditional_edges("reasoning", lambda s: s["step"])
+    for name in TOOL_NODES:
+        workflow.add_edge(name, "observe")
+    workflow.add_conditional_edges("observe", lambda s: s["step"])
+    return workflow.compile()
+
+
+app = build_app()
+
+if __name__ == "__main__":
+    query = input("🧠 Ask your spatial query: ")
+    state = {"query": query, "cot_log": []}
+
+    # Chain-of-thought lines are printed as the nodes write them
+    print("\n🧩 Chain of Thought:")
+    final = state
+    for mode, chunk in app.stream(state, stream_mode=["updates", "custom"]):
+        if mode == "custom" and chunk["event"] == "log":
+            print(" -", chunk["message"])
+        elif mode == "updates":
+            for update in chunk.values():
+                final = update or final
+
+    print("\n⏱ Node Timings:")
+    for span in final.get("trace", []):
+        print(f" - {span['name']}: {span['attributes']['wall_time_s']:.3f}s")
+
+    print("\n📦 Final Output State:")
+    print({k: v for k, v in final.items() if k not in ("cot_log", "trace")})
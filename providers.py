@@ -0,0 +1,168 @@
+import glob
+import math
+import os
+from functools import lru_cache
+
+from dem_store import METERS_PER_DEGREE, snapped_grid
+
+# Provider selection and local data locations are read from the environment
+# (.env) when the provider is first requested:
+#   GEOAI_PROVIDER          earthengine (default) or local
+#   GEOAI_LOCAL_BOUNDARIES  GeoPackage with one named polygon per region
+#   GEOAI_LOCAL_NAME_FIELD  attribute holding the region name
+#   GEOAI_LOCAL_DEM         VRT/GeoTIFF file, or a directory of GeoTIFF tiles
+
+
+@lru_cache(maxsize=None)
+def get_ee():
+    import ee
+    ee.Authenticate(auth_mode='notebook')
+    ee.Initialize()
+    return ee
+
+
+class EarthEngineProvider:
+    # Boundaries geocoded from OpenStreetMap (Nominatim), DEM from SRTM on Earth Engine
+    name = "earthengine"
+    tiled_store = True
+
+    def fetch_boundary(self, region, path):
+        import osmnx as ox
+        from tools.vector_io import write_vector
+        gdf = ox.geocode_to_gdf(region)
+        return write_vector(gdf, path)
+
+    def fetch_dem(self, bounds, path, scale=30):
+        import geemap
+        ee = get_ee()
+        dem = ee.Image("USGS/SRTMGL1_003").clip(ee.Geometry.BBox(*bounds))
+        # Exported on the level's fixed grid, so tiles of one level mosaic without gaps or overlaps
+        transform, shape = snapped_grid(bounds, scale)
+        geemap.download_ee_image(dem, filename=path, crs='EPSG:4326', crs_transform=transform, shape=shape)
+        return path
+
+
+class LocalProvider:
+    # Air-gapped backend: boundaries from a GeoPackage, DEM from a VRT/GeoTIFF
+    # or a directory of GeoTIFF tiles, clipped with windowed reads
+    name = "local"
+    tiled_store = False
+
+    def __init__(self, boundaries=None, dem=None, name_field=None):
+        self.boundaries = boundaries or os.getenv("GEOAI_LOCAL_BOUNDARIES", "data/local/boundaries.gpkg")
+        self.dem = dem or os.getenv("GEOAI_LOCAL_DEM", "data/local/dem")
+        self.name_field = name_field or os.getenv("GEOAI_LOCAL_NAME_FIELD", "name")
+
+    def fetch_boundary(self, region, path):
+        import geopandas as gpd
+        from tools.vector_io import write_vector
+
+        if not os.path.exists(self.boundaries):
+            raise FileNotFoundError(f"Local boundary file not found: {self.boundaries}")
+
+        name = region.lower().replace("'", "''")
+        gdf = gpd.read_file(self.boundaries, where=f"lower({self.name_field}) = '{name}'")
+        if gdf.empty:
+            raise ValueError(f"No boundary named '{region}' in {self.boundaries}")
+
+        return write_vector(gdf, path)
+
+    def dem_sources(self, bounds):
+        import rasterio
+        from rasterio.coords import disjoint_bounds
+
+        if os.path.isfile(self.dem):
+            return [self.dem]
+
+        paths = sorted(glob.glob(os.path.join(self.dem, "*.tif")) + glob.glob(os.path.join(self.dem, "*.vrt")))
+        sources = []
+        for tile_path in paths:
+            with rasterio.open(tile_path) as src:
+                if not disjoint_bounds(tuple(src.bounds), tuple(bounds)):
+                    sources.append(tile_path)
+        return sources
+
+    def fetch_dem(self, bounds, path, scale=None):
+        import rasterio
+        from rasterio.enums import Resampling
+        from rasterio.merge import merge
+        from rasterio.transform import from_origin
+        from rasterio.vrt import WarpedVRT
+        from rasterio.windows import from_bounds, Window
+        from tools.windows import window_shape, iter_windows
+
+        sources = self.dem_sources(bounds)
+        if not sources:
+            raise ValueError(f"No local DEM covers bounds {tuple(bounds)} in {self.dem}")
+
+        with rasterio.open(sources[0]) as src:
+            # Requested scale (metres) as a pixel size in the source CRS; only coarser is resampled
+            res = scale / METERS_PER_DEGREE if scale and src.crs and src.crs.is_geographic else scale
+            coarser = res is not None and res > max(src.res) * 1.01
+
+        if len(sources) > 1:
+            # merge() reads each tile window by window straight into the output file
+            merge(
+                sources, bounds=tuple(bounds), dst_path=path,
+                res=(res, res) if coarser else None, resampling=Resampling.average,
+                dst_kwds={"driver": "GTiff", "tiled": True, "blockxsize": 256, "blockysize": 256}
+            )
+            return path
+
+        with rasterio.open(sources[0]) as src:
+            if coarser:
+                # Average down to the requested level through a warped view of the region
+                minx, miny, maxx, maxy = bounds
+                width, height = math.ceil((maxx - minx) / res), math.ceil((maxy - miny) / res)
+                with WarpedVRT(
+                    src, crs=src.crs, transform=from_origin(minx, maxy, res, res),
+                    width=width, height=height, resampling=Resampling.average
+                ) as vrt:
+                    profile = src.profile.copy()
+                    profile.update({
+                        "driver": "GTiff", "height": height, "width": width, "transform": vrt.transform,
+                        "tiled": True, "blockxsize": 256, "blockysize": 256
+                    })
+                    with rasterio.open(path, "w", **profile) as dst:
+                        for dst_window, src_window in iter_windows(Window(0, 0, width, height), window_shape(vrt)):
+                            dst.write(vrt.read(window=src_window), window=dst_window)
+                return path
+
+            # Snap outwards to whole pixels so the region is fully covered
+            window = from_bounds(*bounds, transform=src.transform)
+            col_off, row_off = math.floor(window.col_off), math.floor(window.row_off)
+            window = Window(
+                col_off, row_off,
+                math.ceil(window.col_off + window.width) - col_off,
+                math.ceil(window.row_off + window.height) - row_off
+            ).intersection(Window(0, 0, src.width, src.height))
+
+            profile = src.profile.copy()
+            profile.update({
+                "driver": "GTiff",
+                "height": int(window.height),
+                "width": int(window.width),
+                "transform": src.window_transform(window),
+                "tiled": True,
+                "blockxsize": 256,
+                "blockysize": 256
+            })
+
+            with rasterio.open(path, "w", **profile) as dst:
+                for dst_window, src_window in iter_windows(window, window_shape(src)):
+                    dst.write(src.read(window=src_window), window=dst_window)
+        return path
+
+
+PROVIDERS = {
+    EarthEngineProvider.name: EarthEngineProvider,
+    LocalProvider.name: LocalProvider
+}
+
+
+@lru_cache(maxsize=None)
+def get_provider(name=None):
+    name = name or os.getenv("GEOAI_PROVIDER", "earthengine")
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown data provider '{name}' (expected one of: {', '.join(PROVIDERS)})")
+    return PROVIDERS[name]()
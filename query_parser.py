@@ -0,0 +1,177 @@
+import json
+import math
+import re
+
+# Parses scoring below this are handed to the LLM
+FAST_PATH_CONFIDENCE = 0.7
+
+DEFAULT_REGION = "India"
+DEFAULT_THRESHOLD = 50
+DEFAULT_BUFFER_DISTANCE = 1000
+DEFAULT_TOP_N = 5
+
+# Intent table: first row with a matching pattern wins, so order matters
+INTENT_TABLE = [
+    ("ranking_analysis", r"\brank(?:ed|ing)?\b|\b(?:top|best)\s+\d+|\btop\b"),
+    ("disaster_safe_analysis", r"\bdisaster|\bhazard|\bsafe\b|\bflood|\brisk"),
+    ("suitability_analysis", r"\bsuitab"),
+    ("vector_analysis", r"\bbuffer"),
+    ("raster_analysis", r"\belevation|\bheight|\baltitude|\b(?:above|below|under|over|greater than|less than)\s+\d"),
+]
+
+COMPARISONS = {
+    "above": "above", "over": "above", "greater than": "above", "higher than": "above", "more than": "above",
+    "below": "below", "under": "below", "less than": "below", "lower than": "below",
+}
+
+UNITS = {
+    None: 1.0, "m": 1.0, "meter": 1.0, "meters": 1.0, "metre": 1.0, "metres": 1.0,
+    "km": 1000.0, "kilometer": 1000.0, "kilometers": 1000.0, "kilometre": 1000.0, "kilometres": 1000.0,
+    "ft": 0.3048, "feet": 0.3048,
+}
+
+_UNIT = r"(?P<unit>kilomet(?:er|re)s?|km|met(?:er|re)s?|m|ft|feet)?\b"
+_NUMBER = r"(?P<value>\d+(?:\.\d+)?)\s*"
+
+PATTERNS = {
+    "intents": [(step, re.compile(pattern)) for step, pattern in INTENT_TABLE],
+    "region": re.compile(
+        r"\b(?:in|around|near|within|across)\s+(?P<region>[a-z][a-z .,'-]*?)"
+        r"(?=\s+(?:below|above|under|over|less than|greater than|higher than|lower than|more than|with|that|which|"
+        r"from|are|is|at|for|using|in (?:full|high|highest|native|maximum)|city cent(?:er|re)|cent(?:er|re)|elevation|\d)\b"
+        r"|\s*[?.!]|\s*$)"
+    ),
+    "threshold": re.compile(
+        r"\b(?P<cmp>above|below|under|over|greater than|less than|higher than|lower than|more than)\s+" + _NUMBER + _UNIT
+    ),
+    "bare_threshold": re.compile(r"\b" + _NUMBER + _UNIT + r"(?=\s*(?:elevation|height|altitude))"),
+    "buffer": re.compile(r"\bbuffer(?:\s+of)?\s+" + _NUMBER + _UNIT),
+    "leading_buffer": re.compile(r"\b" + _NUMBER + _UNIT + r"\s+buffer"),
+    "top_n": re.compile(r"\b(?:top|best)\s+(?P<value>\d+)"),
+    "refine": re.compile(r"\b(?:full|high|highest|native|maximum)[ -]res(?:olution)?\b|\bdetailed\b|\brefine"),
+    "resolution": re.compile(r"\b(?:at|with|using)\s+" + _NUMBER + _UNIT + r"\s+(?:resolution|res|pixels?|cells?)\b"),
+    "stats_only": re.compile(r"\bhow much (?:area|land)\b|\b(?:total )?area (?:of|statistics|stats)\b|\bhow many (?:sq|square)"),
+}
+
+
+def _meters(value, unit):
+    meters = float(value) * UNITS.get(unit, 1.0)
+    return int(meters) if meters.is_integer() else meters
+
+
+def parse_query(query):
+    # Deterministic, network-free parse of a spatial query; returns the
+    # extracted parameters and a confidence score in [0, 1]
+    text = query.lower().strip()
+    parsed = {
+        "intent": None,
+        "region": None,
+        "threshold": None,
+        "comparison": "below",
+        "buffer_distance": None,
+        "top_n": None,
+        "stats_only": False,
+        "refine": False,
+        "resolution": None,
+        "source": "rules"
+    }
+
+    for step, pattern in PATTERNS["intents"]:
+        if pattern.search(text):
+            parsed["intent"] = step
+            break
+
+    match = PATTERNS["region"].search(text)
+    if match:
+        region = re.sub(r"^(?:the)\s+", "", match.group("region")).strip(" ,.")
+        parsed["region"] = region or None
+
+    match = PATTERNS["threshold"].search(text)
+    if match:
+        parsed["comparison"] = COMPARISONS[match.group("cmp")]
+        parsed["threshold"] = _meters(match.group("value"), match.group("unit"))
+    else:
+        match = PATTERNS["bare_threshold"].search(text)
+        if match:
+            parsed["threshold"] = _meters(match.group("value"), match.group("unit"))
+
+    match = PATTERNS["buffer"].search(text) or PATTERNS["leading_buffer"].search(text)
+    if match:
+        parsed["buffer_distance"] = _meters(match.group("value"), match.group("unit"))
+
+    match = PATTERNS["top_n"].search(text)
+    if match:
+        parsed["top_n"] = int(match.group("value"))
+
+    parsed["stats_only"] = bool(PATTERNS["stats_only"].search(text))
+    parsed["refine"] = bool(PATTERNS["refine"].search(text))
+
+    match = PATTERNS["resolution"].search(text)
+    if match:
+        parsed["resolution"] = _meters(match.group("value"), match.group("unit"))
+
+    # Confidence: an intent and a region are needed; elevation queries also need a threshold
+    confidence = 0.0
+    if parsed["intent"]:
+        confidence += 0.5
+    if parsed["region"]:
+        confidence += 0.3
+    if parsed["intent"] != "raster_analysis" or parsed["threshold"] is not None:
+        confidence += 0.2
+    parsed["confidence"] = round(confidence, 2)
+    return parsed
+
+
+LLM_PROMPT = """Extract the spatial analysis request from the user query as JSON with keys:
+"intent" (one of: raster_analysis, vector_analysis, suitability_analysis, ranking_analysis, disaster_safe_analysis),
+"region" (place name), "threshold" (meters or null), "comparison" ("above" or "below"),
+"buffer_distance" (meters or null), "top_n" (integer or null).
+Reply with the JSON object only.
+
+Query: {query}"""
+
+
+def _checked_llm_value(key, value):
+    # The LLM's value coerced to what parse_query would produce, or None when it is
+    # missing or invalid (the rule-based value is then kept)
+    if value is None or value == "" or isinstance(value, bool):
+        return None
+    try:
+        if key == "intent":
+            return value if value in dict(INTENT_TABLE) else None
+        if key == "region":
+            return (value.strip() or None) if isinstance(value, str) else None
+        if key == "comparison":
+            return COMPARISONS.get(str(value).strip().lower())
+        if key == "top_n":
+            number = float(value)
+            return int(number) if number.is_integer() and number > 0 else None
+        number = _meters(value, None)
+        if not math.isfinite(number) or (key == "buffer_distance" and number <= 0):
+            return None
+        return number
+    except (TypeError, ValueError):
+        return None
+
+
+def llm_parse(query, llm, fallback=None):
+    # Low-confidence fallback: ask the LLM and keep rule-based values for anything it leaves out
+    parsed = dict(fallback or parse_query(query))
+    response = llm.invoke(LLM_PROMPT.format(query=query))
+    content = getattr(response, "content", response)
+    match = re.search(r"\{.*\}", content, re.DOTALL)
+    if not match:
+        raise ValueError(f"LLM returned no JSON for query: '{query}'")
+
+    extracted = json.loads(match.group(0))
+    if not isinstance(extracted, dict):
+        raise ValueError(f"LLM returned no JSON object for query: '{query}'")
+    for key in ("intent", "region", "threshold", "comparison", "buffer_distance", "top_n"):
+        value = _checked_llm_value(key, extracted.get(key))
+        if value is not None:
+            parsed[key] = value
+    if parsed["comparison"] not in ("above", "below"):
+        parsed["comparison"] = "below"
+
+    parsed["source"] = "llm"
+    return parsed
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import main
+from tracing import add_event
+
+# Queries executing at once; the rest wait in the queue
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("GEOAI_SERVICE_CONCURRENCY", 8))
+
+# Window (seconds) over which throughput is reported
+THROUGHPUT_WINDOW = 60.0
+
+
+def query_key(query, params):
+    # Queries differing only in case or spacing are the same request
+    normalized = " ".join(query.lower().split())
+    return normalized, tuple(sorted((k, repr(v)) for k, v in params.items()))
+
+
+class QueryService:
+    # Runs many queries through the LangGraph workflow concurrently: reasoning
+    # (LLM, geocoding, DEM download) runs on threads, tool nodes (raster and
+    # vector crunching) on a process pool, and identical in-flight queries share one run
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, process_workers=None):
+        self.max_concurrency = max_concurrency
+        process_workers = process_workers or os.cpu_count() or 1
+        self.process_pool = ProcessPoolExecutor(max_workers=process_workers)
+        # Cores are split between pool workers, so a tool's own pools (polygonize
+        # tiles, suitability chunks) do not start cpu_count processes or threads each
+        self.node_workers = max(1, (os.cpu_count() or 1) // process_workers)
+        self.app = main.build_app(reasoning=self._reasoning, wrap_tool=self._offload)
+        self.inflight = {}
+        self.semaphore = None
+        self.queued = 0
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.deduplicated = 0
+        self.finished_at = deque()
+        self.latencies = deque(maxlen=1000)
+
+    async def _reasoning(self, state):
+        return await asyncio.to_thread(main.reasoning_node, state)
+
+    def _offload(self, name, fn):
+        spec = main.CACHE_SPECS[name]
+
+        async def node(state):
+            # Cache lookups stay in this process; only misses cross to the pool
+            key = None
+            if main.cache_enabled():
+                key, hit = main.result_cache.lookup(name, state, spec["params"], spec["inputs"])
+                if hit is not None:
+                    add_event("cache.hit", node=name, key=key)
+                    state["cot_log"].append(f"♻ Cache hit for {name}")
+                    return {**state, **hit, "step": "complete"}
+
+            loop = asyncio.get_running_loop()
+            state = {"workers": self.node_workers, "polygonize_workers": self.node_workers, **state}
+            result = await loop.run_in_executor(self.process_pool, fn, state)
+            if key is not None:
+                main.result_cache.record(key, result, spec["outputs"])
+            return result
+
+        node.__name__ = name
+        return node
+
+    async def submit(self, query, **params):
+        key = query_key(query, params)
+        self.submitted += 1
+        if key in self.inflight:
+            self.deduplicated += 1
+            return dict(await asyncio.shield(self.inflight[key]))
+
+        task = asyncio.ensure_future(self._run(query, params))
+        self.inflight[key] = task
+        task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return dict(await asyncio.shield(task))
+
+    async def _run(self, query, params):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self.queued += 1
+        async with self.semaphore:
+            self.queued -= 1
+            self.running += 1
+            start = time.perf_counter()
+            try:
+                final = await self.app.ainvoke({"query": query, "cot_log": [], **params})
+                if final.get("error"):
+                    self.failed += 1
+                return final
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.running -= 1
+                self.completed += 1
+                self.latencies.append(time.perf_counter() - start)
+                self.finished_at.append(time.monotonic())
+
+    async def run_many(self, queries):
+        return await asyncio.gather(*(self.submit(q) for q in queries), return_exceptions=True)
+
+    def metrics(self):
+        now = time.monotonic()
+        while self.finished_at and now - self.finished_at[0] > THROUGHPUT_WINDOW:
+            self.finished_at.popleft()
+        latencies = sorted(self.latencies)
+        return {
+            "queue_depth": self.queued,
+            "running": self.running,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "deduplicated": self.deduplicated,
+            "throughput_per_min": len(self.finished_at) * 60.0 / THROUGHPUT_WINDOW,
+            "latency_p50_s": latencies[len(latencies) // 2] if latencies else None,
+            "latency_max_s": latencies[-1] if latencies else None
+        }
+
+    def close(self):
+        self.process_pool.shutdown()
+
+
+async def _main(queries):
+    service = QueryService()
+    try:
+        results = await service.run_many(queries)
+        for query, final in zip(queries, results):
+            if isinstance(final, Exception):
+                print(f"❌ {query}: {final}")
+            else:
+                print(f"✅ {query}: {final.get('map_path')}")
+        print("\n📊 Service metrics:", service.metrics())
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    # Usage: python service.py queries.txt   (one query per line; stdin if omitted)
+    source = open(sys.argv[1]) if len(sys.argv) > 1 else sys.stdin
+    asyncio.run(_main([line.strip() for line in source if line.strip()]))
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+# Progress events for app.stream(..., stream_mode=["updates", "custom"]):
+#   {"event": "node_start", "node"}            a node began
+#   {"event": "log", "node", "message"}        a cot_log line, as it is written
+#   {"event": "node_end", "node", "seconds"}   a node finished
+#   {"event": "preview", "node", "kind", "title", ...}
+#       kind "raster":   image (uint8 2-D array, at most PREVIEW_SIZE px) and bounds
+#       kind "features": geojson and bounds (first polygons of a product still being built)
+# Under app.invoke, or outside the graph, events are dropped.
+
+# Longest edge (pixels) of raster previews
+PREVIEW_SIZE = 256
+
+# Polygons sent in a features preview
+PREVIEW_FEATURES = 500
+
+
+def emit(event, **data):
+    try:
+        from langgraph.config import get_stream_writer
+        writer = get_stream_writer()
+    except (ImportError, RuntimeError):
+        return
+    writer({"event": event, **data})
+
+
+class StreamingLog(list):
+    # cot_log that also streams every appended line
+    def __init__(self, items, node):
+        super().__init__(items)
+        self.node = node
+
+    def append(self, message):
+        super().append(message)
+        emit("log", node=self.node, message=message)
+
+    def __reduce__(self):
+        # Pickled into tool worker processes as a plain list
+        return list, (list(self),)
+
+
+def streamed(name, fn):
+    # Wraps a graph node (sync or async) so its start, cot_log lines and end are streamed
+    def prepare(state):
+        emit("node_start", node=name)
+        return {**state, "cot_log": StreamingLog(state.get("cot_log") or [], name)}
+
+    if asyncio.iscoroutinefunction(fn):
+        async def run_async(state):
+            start = time.perf_counter()
+            result = await fn(prepare(state))
+            emit("node_end", node=name, seconds=time.perf_counter() - start)
+            return result
+
+        run_async.__name__ = name
+        return run_async
+
+    def run(state):
+        start = time.perf_counter()
+        result = fn(prepare(state))
+        emit("node_end", node=name, seconds=time.perf_counter() - start)
+        return result
+
+    run.__name__ = name
+    return run
+
+
+def raster_preview(path, title, node=None, band=1):
+    # Streams a coarse grayscale view of a raster, read from its overviews
+    import numpy as np
+    import rasterio
+    from rasterio.warp import transform_bounds
+
+    with rasterio.open(path) as src:
+        scale = max(src.width, src.height) / PREVIEW_SIZE
+        shape = (max(1, round(src.height / max(scale, 1))), max(1, round(src.width / max(scale, 1))))
+        data = src.read(band, out_shape=shape, masked=True).astype(np.float32).filled(np.nan)
+        bounds = transform_bounds(src.crs, "EPSG:4326", *src.bounds) if src.crs else tuple(src.bounds)
+
+    valid = ~np.isnan(data)
+    image = np.zeros(data.shape, dtype=np.uint8)
+    if valid.any():
+        low, high = np.nanmin(data), np.nanmax(data)
+        image[valid] = (255 * (data[valid] - low) / (high - low)).astype(np.uint8) if high > low else 255
+    emit("preview", node=node, kind="raster", title=title, image=image, bounds=bounds)
+
+
+def features_preview(geoms, crs, title, node=None):
+    # Streams the first polygons of a vector product while the rest are still being built
+    import geopandas as gpd
+
+    if not len(geoms):
+        return
+    gdf = gpd.GeoDataFrame(geometry=list(geoms)[:PREVIEW_FEATURES], crs=crs).to_crs("EPSG:4326")
+    emit("preview", node=node, kind="features", title=title,
+         geojson=gdf.__geo_interface__, bounds=tuple(gdf.total_bounds), count=len(gdf))
@@ -0,0 +1,299 @@
+import hashlib
+import io
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from tools.vector_io import read_vector, vector_info
+
+TILE_SIZE = 256
+WEB_MERCATOR_EXTENT = 20037508.342789244
+
+# Rendered PNG tiles kept in memory (least recently used are dropped first)
+DEFAULT_CACHE_TILES = 4096
+
+# Registered layers kept (vector layers hold their reprojected frames); least recently used are dropped first
+DEFAULT_MAX_LAYERS = 64
+
+# Colour ramp for continuous rasters (suitability scores etc.): value stop -> RGB
+RAMP = [
+    (0.0, (68, 1, 84)),
+    (0.25, (59, 82, 139)),
+    (0.5, (33, 145, 140)),
+    (0.75, (94, 201, 98)),
+    (1.0, (253, 231, 37)),
+]
+
+DEFAULT_STYLE = {"fillColor": "#3388ff", "color": "#3388ff", "fillOpacity": 0.4}
+
+# Vector formats with an on-disk spatial index are queried per tile instead of held in memory
+INDEXED_VECTOR_EXTENSIONS = (".parquet", ".fgb")
+
+TILE_URL = re.compile(r"^/tiles/(?P<layer>[0-9a-f]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.png$")
+
+
+def tile_bounds(z, x, y):
+    # Web Mercator bounds (minx, miny, maxx, maxy) of an XYZ tile
+    size = 2 * WEB_MERCATOR_EXTENT / (2 ** z)
+    minx = -WEB_MERCATOR_EXTENT + x * size
+    maxy = WEB_MERCATOR_EXTENT - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def _rgba(hex_color, opacity):
+    hex_color = hex_color.lstrip("#")
+    return tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4)) + (int(round(opacity * 255)),)
+
+
+def _encode_png(rgba):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, "RGBA").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class TileServer:
+    # Local XYZ endpoint rendering raster and vector products to PNG tiles on
+    # demand, so the browser only ever receives the tiles in view
+    def __init__(self, host=None, port=None, cache_tiles=DEFAULT_CACHE_TILES, max_layers=DEFAULT_MAX_LAYERS):
+        self.host = host or os.getenv("GEOAI_TILE_HOST", "127.0.0.1")
+        self.port = int(port if port is not None else os.getenv("GEOAI_TILE_PORT", 0))
+        self.cache_tiles = cache_tiles
+        self.max_layers = max_layers
+        self.layers = OrderedDict()
+        self.tiles = OrderedDict()
+        self.lock = threading.Lock()
+        self.httpd = None
+
+    # ---------------------- Layers ----------------------
+
+    def register(self, path, style=None):
+        # Layer ids change with the file's mtime, so rewritten outputs never hit stale tiles
+        stat = os.stat(path)
+        source = os.path.abspath(path)
+        layer_id = hashlib.sha1(f"{source}:{stat.st_mtime_ns}:{style}".encode()).hexdigest()[:16]
+        with self.lock:
+            # Layers of an earlier version of the same file describe a product that was replaced
+            for stale in [k for k, l in self.layers.items() if l["source"] == source and l["version"] != stat.st_mtime_ns]:
+                self._drop(stale)
+            if layer_id not in self.layers:
+                kind = "raster" if path.lower().endswith((".tif", ".tiff", ".vrt")) else "vector"
+                self.layers[layer_id] = {
+                    "path": path, "source": source, "version": stat.st_mtime_ns, "kind": kind,
+                    "style": {**DEFAULT_STYLE, **(style or {})}
+                }
+            self.layers.move_to_end(layer_id)
+            while len(self.layers) > self.max_layers:
+                self._drop(next(iter(self.layers)))
+        return layer_id
+
+    def unregister(self, layer_id):
+        with self.lock:
+            self._drop(layer_id)
+
+    def _drop(self, layer_id):
+        # Forgets a layer and its rendered tiles (caller holds the lock)
+        self.layers.pop(layer_id, None)
+        for key in [key for key in self.tiles if key[0] == layer_id]:
+            del self.tiles[key]
+
+    def url(self, layer_id):
+        base = os.getenv("GEOAI_TILE_PUBLIC_URL", f"http://{self.host}:{self.port}")
+        return f"{base}/tiles/{layer_id}/{{z}}/{{x}}/{{y}}.png"
+
+    def bounds(self, layer_id):
+        # Layer extent in EPSG:4326 as (minx, miny, maxx, maxy)
+        layer = self.layers[layer_id]
+        if layer["kind"] == "raster":
+            import rasterio
+            from rasterio.warp import transform_bounds
+            with rasterio.open(layer["path"]) as src:
+                return transform_bounds(src.crs or "EPSG:4326", "EPSG:4326", *src.bounds)
+        from pyproj import Transformer
+        if layer["path"].lower().endswith(INDEXED_VECTOR_EXTENSIONS):
+            info = vector_info(layer["path"])
+            if info["bounds"] is None:
+                return (math.nan,) * 4
+            transformer = Transformer.from_crs(info["crs"] or "EPSG:4326", "EPSG:4326", always_xy=True)
+            return transformer.transform_bounds(*info["bounds"])
+        gdf = self._vector(layer)
+        transformer = Transformer.from_crs("EPSG:3857", "EPSG:4326", always_xy=True)
+        return transformer.transform_bounds(*gdf.total_bounds)
+
+    def _vector(self, layer):
+        # Loaded once per layer, reprojected to Web Mercator, with a spatial index
+        if "gdf" not in layer:
+            gdf = read_vector(layer["path"])
+            if gdf.crs is None:
+                gdf = gdf.set_crs("EPSG:4326")
+            gdf = gdf.to_crs("EPSG:3857")
+            gdf.sindex  # build the spatial index once, up front
+            layer["gdf"] = gdf
+        return layer["gdf"]
+
+    def _features(self, layer, bounds):
+        # Geometries (Web Mercator) intersecting a tile's bounds
+        if layer["path"].lower().endswith(INDEXED_VECTOR_EXTENSIONS):
+            # bbox read through the file's spatial index; only this tile's features are decoded
+            from pyproj import Transformer
+            if "crs" not in layer:
+                layer["crs"] = vector_info(layer["path"])["crs"] or "EPSG:4326"
+            transformer = Transformer.from_crs("EPSG:3857", layer["crs"], always_xy=True)
+            gdf = read_vector(layer["path"], bbox=transformer.transform_bounds(*bounds))
+            if gdf.crs is None:
+                gdf = gdf.set_crs("EPSG:4326")
+            return gdf.to_crs("EPSG:3857").geometry
+
+        gdf = self._vector(layer)
+        from shapely.geometry import box
+        return gdf.geometry.iloc[gdf.sindex.query(box(*bounds))]
+
+    def _raster_range(self, layer, src):
+        if "range" not in layer:
+            # Value range from a decimated read (served by the COG overviews)
+            scale = max(1, max(src.width, src.height) // 1024)
+            sample = src.read(1, out_shape=(max(1, src.height // scale), max(1, src.width // scale)), masked=True)
+            layer["range"] = (float(sample.min()), float(sample.max())) if sample.count() else (0.0, 1.0)
+        return layer["range"]
+
+    # ---------------------- Rendering ----------------------
+
+    def tile(self, layer_id, z, x, y):
+        key = (layer_id, z, x, y)
+        with self.lock:
+            self.layers.move_to_end(layer_id)
+            layer = self.layers[layer_id]
+            if key in self.tiles:
+                self.tiles.move_to_end(key)
+                return self.tiles[key]
+
+        if layer["kind"] == "raster":
+            png = _encode_png(self._render_raster(layer, z, x, y))
+        else:
+            png = _encode_png(self._render_vector(layer, z, x, y))
+
+        with self.lock:
+            self.tiles[key] = png
+            while len(self.tiles) > self.cache_tiles:
+                self.tiles.popitem(last=False)
+        return png
+
+    def _render_raster(self, layer, z, x, y):
+        import rasterio
+        from rasterio.enums import Resampling
+        from rasterio.transform import from_bounds
+        from rasterio.vrt import WarpedVRT
+
+        transform = from_bounds(*tile_bounds(z, x, y), TILE_SIZE, TILE_SIZE)
+        with rasterio.open(layer["path"]) as src:
+            vmin, vmax = self._raster_range(layer, src)
+            categorical = src.dtypes[0] == "uint8" and vmax <= 1
+            # Warping straight onto the tile grid lets GDAL pick the matching overview
+            with WarpedVRT(
+                src, crs="EPSG:3857", transform=transform, width=TILE_SIZE, height=TILE_SIZE,
+                resampling=Resampling.nearest if categorical else Resampling.bilinear
+            ) as vrt:
+                data = vrt.read(1, masked=True)
+
+        rgba = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+        valid = ~np.ma.getmaskarray(data)
+        values = np.ma.getdata(data).astype(np.float32)
+
+        if categorical:
+            rgba[valid & (values == 1)] = _rgba(layer["style"]["fillColor"], layer["style"]["fillOpacity"])
+            return rgba
+
+        scaled = np.clip((values - vmin) / ((vmax - vmin) or 1.0), 0, 1)
+        stops = [stop for stop, _ in RAMP]
+        for channel in range(3):
+            rgba[..., channel] = np.interp(scaled, stops, [color[channel] for _, color in RAMP])
+        rgba[..., 3] = np.where(valid, int(round(layer["style"].get("fillOpacity", 0.7) * 255)), 0)
+        return rgba
+
+    def _render_vector(self, layer, z, x, y):
+        from rasterio.features import rasterize
+        from rasterio.transform import from_bounds
+
+        bounds = tile_bounds(z, x, y)
+        rgba = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+        geoms = self._features(layer, bounds)
+        if len(geoms) == 0:
+            return rgba
+
+        transform = from_bounds(*bounds, TILE_SIZE, TILE_SIZE)
+        pixel = (bounds[2] - bounds[0]) / TILE_SIZE
+
+        # Points are drawn as small discs, polygons filled and outlined
+        points = geoms[geoms.geom_type.isin(["Point", "MultiPoint"])]
+        areas = geoms[~geoms.geom_type.isin(["Point", "MultiPoint"])]
+        shape = (TILE_SIZE, TILE_SIZE)
+        fill = np.zeros(shape, dtype=bool)
+        outline = np.zeros(shape, dtype=bool)
+        if len(areas):
+            fill = rasterize(((g, 1) for g in areas), out_shape=shape, transform=transform, dtype="uint8").astype(bool)
+            outline = rasterize(
+                ((g, 1) for g in areas.boundary), out_shape=shape, transform=transform, dtype="uint8", all_touched=True
+            ).astype(bool)
+        if len(points):
+            outline |= rasterize(
+                ((g, 1) for g in points.buffer(4 * pixel)), out_shape=shape, transform=transform, dtype="uint8"
+            ).astype(bool)
+
+        style = layer["style"]
+        rgba[fill] = _rgba(style["fillColor"], style["fillOpacity"])
+        rgba[outline] = _rgba(style["color"], 1.0)
+        return rgba
+
+    # ---------------------- HTTP ----------------------
+
+    def start(self):
+        if self.httpd is not None:
+            return self
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                match = TILE_URL.match(self.path.split("?")[0])
+                if not match or match.group("layer") not in server.layers:
+                    self.send_error(404)
+                    return
+                try:
+                    png = server.tile(
+                        match.group("layer"), int(match.group("z")), int(match.group("x")), int(match.group("y"))
+                    )
+                except Exception as e:
+                    self.send_error(500, str(e))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(png)))
+                self.send_header("Cache-Control", "max-age=3600")
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                self.wfile.write(png)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+
+def zoom_for_bounds(bounds, viewport_px=800):
+    # Zoom level at which EPSG:4326 bounds roughly fill the map viewport
+    span = max(bounds[2] - bounds[0], (bounds[3] - bounds[1]) * 1.5, 1e-6)
+    return int(max(1, min(18, math.floor(math.log2(360 * viewport_px / (TILE_SIZE * span))))))
@@ -0,0 +1,109 @@
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import shapely
+import geopandas as gpd
+
+# Features narrower than this (degrees of longitude) are buffered in their UTM zone;
+# wider ones in an azimuthal equidistant projection centred on the feature
+UTM_MAX_SPAN = 6.0
+
+# Polygon parts with more vertices than this are cut into grid pieces that buffer
+# independently (buffer(A ∪ B) = buffer(A) ∪ buffer(B) for positive distances)
+CHUNK_VERTICES = 50000
+
+# Segments per quarter circle on buffer arcs (shapely's default)
+DEFAULT_RESOLUTION = 8
+
+
+def local_crs(bounds):
+    # Metric CRS with little distortion over a feature with these WGS84 bounds
+    minx, miny, maxx, maxy = bounds
+    lon, lat = (minx + maxx) / 2, (miny + maxy) / 2
+    if maxx - minx <= UTM_MAX_SPAN and -80 <= lat <= 84:
+        zone = int((lon + 180) // 6) % 60 + 1
+        return f"EPSG:{32600 + zone if lat >= 0 else 32700 + zone}"
+    return f"+proj=aeqd +lat_0={lat:.6f} +lon_0={lon:.6f} +datum=WGS84 +units=m +no_defs"
+
+
+def _split_large(parts, owners, chunk_vertices):
+    # Cut oversized parts along a grid so one huge boundary spreads over several workers
+    counts = shapely.get_num_coordinates(parts)
+    large = counts > chunk_vertices
+    if not large.any():
+        return parts, owners
+
+    pieces, piece_owners = [parts[~large]], [owners[~large]]
+    for part, owner, count in zip(parts[large], owners[large], counts[large]):
+        k = math.ceil(math.sqrt(count / chunk_vertices))
+        minx, miny, maxx, maxy = shapely.bounds(part)
+        xs, ys = np.linspace(minx, maxx, k + 1), np.linspace(miny, maxy, k + 1)
+        cells = shapely.box(
+            np.repeat(xs[:-1], k), np.tile(ys[:-1], k), np.repeat(xs[1:], k), np.tile(ys[1:], k)
+        )
+        cut = shapely.get_parts(shapely.intersection(part, cells))
+        cut = cut[shapely.get_type_id(cut) == 3]  # polygons only; edge slivers are covered by neighbours
+        pieces.append(cut)
+        piece_owners.append(np.full(len(cut), owner))
+    return np.concatenate(pieces), np.concatenate(piece_owners)
+
+
+def _tree_union(pieces, pool, workers):
+    # Union of one feature's many pieces as a reduction tree: runs of neighbouring
+    # pieces (grid cells come out in order) are unioned in parallel, then their
+    # results, so only the last, small merge of a few shapes runs on one thread
+    while len(pieces) > workers:
+        size = max(2, math.ceil(len(pieces) / workers))
+        pieces = list(pool.map(shapely.union_all, [pieces[i:i + size] for i in range(0, len(pieces), size)]))
+    return shapely.union_all(pieces)
+
+
+def buffer_geometries(geoms, distance, resolution=None, simplify=None, workers=None, chunk_vertices=CHUNK_VERTICES):
+    # Buffers a GeoSeries by distance (metres), each feature in its own local metric CRS.
+    # simplify (metres) thins vertices first; resolution sets segments per quarter circle.
+    # shapely 2 releases the GIL inside vectorized ops, so chunks run on threads
+    resolution = resolution or DEFAULT_RESOLUTION
+    workers = workers or os.cpu_count() or 1
+    crs = geoms.crs or "EPSG:4326"
+    wgs84 = geoms.set_crs(crs, allow_override=True).to_crs("EPSG:4326")
+
+    groups = {}
+    for i, bounds in enumerate(wgs84.bounds.values):
+        groups.setdefault(local_crs(bounds), []).append(i)
+
+    result = np.empty(len(geoms), dtype=object)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for target, members in groups.items():
+            projected = np.asarray(wgs84.iloc[members].to_crs(target).values, dtype=object)
+            parts, owners = shapely.get_parts(projected, return_index=True)
+            if simplify:
+                parts = shapely.simplify(parts, simplify, preserve_topology=True)
+            if distance > 0 and workers > 1:
+                parts, owners = _split_large(parts, owners, chunk_vertices)
+
+            chunks = [c for c in np.array_split(np.arange(len(parts)), workers * 4) if len(c)]
+            buffered = np.concatenate(list(pool.map(
+                lambda chunk: shapely.buffer(parts[chunk], distance, quad_segs=resolution), chunks
+            )))
+
+            # Re-assemble each feature from its buffered parts
+            order = np.argsort(owners, kind="stable")
+            splits = np.flatnonzero(np.diff(owners[order])) + 1
+            feature_ids = owners[order][np.r_[0, splits]] if len(order) else []
+            groups = np.split(buffered[order], splits)
+            large = [len(group) > workers > 1 for group in groups]
+            merged = list(pool.map(
+                lambda item: shapely.union_all(item[0]) if not item[1] else None, zip(groups, large)
+            ))
+            # Features cut into more pieces than workers (huge boundaries) merge as a tree
+            for i in np.flatnonzero(large):
+                merged[i] = _tree_union(groups[i], pool, workers)
+
+            features = np.full(len(members), shapely.Polygon(), dtype=object)
+            features[feature_ids] = merged
+            local = gpd.GeoSeries(features, crs=target).to_crs(crs)
+            result[members] = np.asarray(local.values, dtype=object)
+
+    return gpd.GeoSeries(result, index=geoms.index, crs=crs)
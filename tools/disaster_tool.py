@@ -1,45 +1,123 @@
-import os
-import rasterio
-import geopandas as gpd
-import numpy as np
-from shapely.geometry import shape
-from rasterio.features import shapes
-
-def disaster_safe_tool_fn(state):
-    try:
-        mask_path = state["hazard_mask_path"]
-        region_path = state["region_path"]
-        output_path = f"data/{state['region']}_safe_zones.geojson"
-        os.makedirs("data", exist_ok=True)
-
-        with rasterio.open(mask_path) as src:
-            mask_data = src.read(1)
-            transform = src.transform
-            crs = src.crs or "EPSG:4326"
-
-        # Convert safe zones (i.e., where mask == 0)
-        mask_bool = (mask_data == 0)
-        shapes_gen = shapes(mask_bool.astype(np.uint8), transform=transform)
-        safe_shapes = [shape(geom) for geom, val in shapes_gen if val == 1]
-
-        safe_gdf = gpd.GeoDataFrame(geometry=safe_shapes, crs=crs)
-        safe_gdf.to_file(output_path, driver="GeoJSON", index=False)
-
-        state["cot_log"].append(f"🛟 Disaster-safe zones saved to {output_path}")
-        return {
-            **state,
-            "disaster_safe_result": {
-                "safe_vector": output_path
-            },
-            "step": "complete"
-        }
-    except Exception as e:
-        state["cot_log"].append(f"❌ Error in disaster_safe_tool_fn: {str(e)}")
-        return {
-            **state,
-            "disaster_safe_result": {
-                "safe_vector": None,
-                "error": str(e)
-            },
-            "step": "complete"
-        }
\ No newline at end of file
+import os
+import numpy as np
+import rasterio
+import geopandas as gpd
+from shapely.geometry import mapping
+from rasterio.features import geometry_mask, geometry_window
+from tools.polygonize import polygonize
+from tools.vector_io import vector_path, write_vector, read_vector_cached
+from tools.lazy_raster import lazy_enabled, write_intermediates
+from streaming import features_preview
+from dem_store import level_suffix
+from tools.raster_tool import MASK_NODATA
+
+
+class SafeZoneSelector:
+    # Selects safe pixels inside the region (picklable for worker processes): from a
+    # hazard mask (safe where 0; DEM nodata is MASK_NODATA there), or straight from the
+    # DEM when a threshold is given (safe where the elevation is valid and not on the hazard side)
+    def __init__(self, geom, threshold=None, comparison="below", nodata=None):
+        self.geom = geom
+        self.threshold = threshold
+        self.comparison = comparison
+        self.nodata = nodata if nodata is not None else -32768
+
+    def __call__(self, data, transform):
+        inside = geometry_mask(self.geom, out_shape=data.shape, transform=transform, invert=True)
+        if self.threshold is None:
+            return inside & (data == 0)
+
+        valid = ~np.isclose(data, self.nodata)
+        if self.comparison == "above":
+            hazard = data > self.threshold
+        else:
+            hazard = data < self.threshold
+        return inside & valid & ~hazard
+
+
+def disaster_safe_tool_fn(state):
+    try:
+        mask_path = state.get("hazard_mask_path")
+        region_path = state["region_path"]
+        output_path = vector_path(f"data/{state['region']}_safe_zones{level_suffix(state.get('dem_scale'))}")
+        os.makedirs("data", exist_ok=True)
+
+        region = read_vector_cached(region_path)
+
+        reusable = False
+        if mask_path and os.path.exists(mask_path):
+            # Masks written before nodata had its own value mark DEM gaps as 0 (safe)
+            with rasterio.open(mask_path) as src:
+                reusable = src.nodata == MASK_NODATA
+                crs = src.crs or "EPSG:4326"
+
+        if reusable:
+            # Reuse the mask from an earlier elevation query
+            source, window = mask_path, None
+            geom = [mapping(region.to_crs(crs).union_all())]
+            selector = SafeZoneSelector(geom)
+            state["cot_log"].append(f"Reusing hazard mask {mask_path}")
+        else:
+            # No mask yet: threshold the DEM and polygonize safe zones in one
+            # streaming pass, without writing an intermediate mask raster
+            source = state["dem_path"]
+            with rasterio.open(source) as src:
+                crs = src.crs or "EPSG:4326"
+                geom = [mapping(region.to_crs(crs).union_all())]
+                window = geometry_window(src, geom)
+                nodata = src.nodata
+            selector = SafeZoneSelector(geom, state["threshold"], state.get("comparison", "below"), nodata)
+            state["cot_log"].append(
+                f"Building hazard zones from the DEM ({state.get('comparison', 'below')} {state['threshold']}m)"
+            )
+
+        if window is not None and lazy_enabled():
+            # Lazy backend: classify, vectorize (and optionally write the hazard mask)
+            # in one chunk-parallel pass over the DEM
+            from tools.lazy_raster import safe_zones
+            mask_out = state.get("hazard_mask_path") if write_intermediates(state) else None
+            safe_shapes = safe_zones(
+                source, geom, state["threshold"], state.get("comparison", "below"), window,
+                simplify=state.get("simplify_tolerance"),
+                dissolve=state.get("dissolve", False),
+                mask_path=mask_out,
+                workers=state.get("polygonize_workers")
+            )
+            if mask_out:
+                state["cot_log"].append(f"Hazard mask written to {mask_out}")
+        else:
+            # Convert safe zones to polygons
+            safe_shapes = polygonize(
+                source,
+                selector,
+                tile_size=state.get("polygonize_tile_size"),
+                workers=state.get("polygonize_workers"),
+                simplify=state.get("simplify_tolerance"),
+                dissolve=state.get("dissolve", False),
+                window=window,
+                preview=(lambda geoms: features_preview(
+                    geoms, crs, "Safe zones (first polygons)", node="disaster_safe_analysis"
+                )) if state.get("previews") else None
+            )
+
+        safe_gdf = gpd.GeoDataFrame(geometry=safe_shapes, crs=crs)
+        write_vector(safe_gdf, output_path)
+
+        state["cot_log"].append(f"🛟 Disaster-safe zones saved to {output_path}")
+        return {
+            **state,
+            "disaster_safe_result": {
+                "safe_vector": output_path
+            },
+            "step": "complete"
+        }
+    except Exception as e:
+        state["cot_log"].append(f"❌ Error in disaster_safe_tool_fn: {str(e)}")
+        return {
+            **state,
+            "disaster_safe_result": {
+                "safe_vector": None,
+                "error": str(e)
+            },
+            "step": "complete"
+        }
@@ -0,0 +1,166 @@
+import json
+import os
+import uuid
+
+import numpy as np
+import rasterio
+from shapely.geometry import mapping
+from rasterio.features import geometry_mask, geometry_window
+from tools.windows import window_shape, iter_windows
+from tools.vector_io import read_vector_cached
+from dem_store import path_lock
+
+# Histogram bins: 1 m wide, covering every elevation on Earth (values outside are clamped)
+BIN_METERS = 1
+ELEVATION_RANGE = (-500, 9000)
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def index_path(dem_path):
+    return f"{os.path.splitext(dem_path)[0]}.index.json"
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+
+def _row_areas(src, window):
+    # Ground area (m²) of one pixel in each row of the window
+    res_x, res_y = src.res
+    if not (src.crs and src.crs.is_geographic):
+        return np.full(int(window.height), res_x * res_y)
+    transform = src.window_transform(window)
+    rows = np.arange(int(window.height)) + 0.5
+    lats = np.radians(transform.f + rows * transform.e)
+    return (np.radians(res_x) * EARTH_RADIUS_M * np.cos(lats)) * (np.radians(res_y) * EARTH_RADIUS_M)
+
+
+def build_index(dem_path, region_path, window_size=None):
+    # One streaming pass over the region: elevation histogram (pixel counts and
+    # ground area per bin) plus min/max per processing window, so thresholds can
+    # be answered, and windows skipped, without reading pixels again
+    n_bins = (ELEVATION_RANGE[1] - ELEVATION_RANGE[0]) // BIN_METERS
+    counts = np.zeros(n_bins, dtype=np.int64)
+    areas = np.zeros(n_bins, dtype=np.float64)
+    tiles = []
+
+    region = read_vector_cached(region_path)
+    with rasterio.open(dem_path) as src:
+        if region.crs != src.crs:
+            region = region.to_crs(src.crs)
+        geom = [mapping(region.union_all())]
+        nodata = src.nodata if src.nodata is not None else -32768
+        region_window = geometry_window(src, geom)
+        shape = window_shape(src, window_size)
+
+        for _, src_window in iter_windows(region_window, shape):
+            data = src.read(1, window=src_window).astype(np.float32)
+            inside = geometry_mask(geom, out_shape=data.shape, transform=src.window_transform(src_window), invert=True)
+            valid = inside & ~np.isclose(data, nodata)
+            n_valid = int(valid.sum())
+            tile = [int(src_window.col_off), int(src_window.row_off), int(src_window.width), int(src_window.height)]
+            if not n_valid:
+                tiles.append(tile + [None, None, 0])
+                continue
+
+            values = data[valid]
+            bins = np.clip(((values - ELEVATION_RANGE[0]) // BIN_METERS).astype(np.int64), 0, n_bins - 1)
+            counts += np.bincount(bins, minlength=n_bins)
+            row_area = np.broadcast_to(_row_areas(src, src_window)[:, None], data.shape)[valid]
+            areas += np.bincount(bins, weights=row_area, minlength=n_bins)
+            tiles.append(tile + [float(values.min()), float(values.max()), n_valid])
+
+        index = {
+            "dem": _fingerprint(dem_path),
+            "region": _fingerprint(region_path),
+            "window_shape": list(shape),
+            "integer": bool(np.issubdtype(np.dtype(src.dtypes[0]), np.integer)),
+            "bin_meters": BIN_METERS,
+            "range": list(ELEVATION_RANGE),
+            "counts": counts.tolist(),
+            "areas_m2": areas.tolist(),
+            "tiles": tiles
+        }
+
+    path = index_path(dem_path)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return index
+
+
+def load_index(dem_path, region_path):
+    # The sidecar index, or None when it is missing or older than the DEM/boundary
+    path = index_path(dem_path)
+    try:
+        with open(path) as f:
+            index = json.load(f)
+        if index["dem"] != _fingerprint(dem_path) or index["region"] != _fingerprint(region_path):
+            return None
+    except (OSError, ValueError, KeyError):
+        return None
+    return index
+
+
+def ensure_index(dem_path, region_path):
+    with path_lock(index_path(dem_path)):
+        return load_index(dem_path, region_path) or build_index(dem_path, region_path)
+
+
+def threshold_stats(index, threshold, comparison):
+    # (pixel count, area in km²) on the requested side of the threshold
+    bin_meters = index["bin_meters"]
+    lows = index["range"][0] + np.arange(len(index["counts"])) * bin_meters
+    counts = np.asarray(index["counts"], dtype=np.float64)
+    areas = np.asarray(index["areas_m2"])
+
+    if index["integer"]:
+        # Integer DEMs: every value in a 1 m bin equals the bin's lower edge, so this is exact
+        selected = lows > threshold if comparison == "above" else lows < threshold
+        weights = selected.astype(np.float64)
+    else:
+        # Float DEMs: assume values are spread evenly within a bin
+        below = np.clip((threshold - lows) / bin_meters, 0, 1)
+        weights = 1 - below if comparison == "above" else below
+
+    return int(round((counts * weights).sum())), float((areas * weights).sum() / 1e6)
+
+
+def tile_states(index, threshold, comparison):
+    # Windows (keyed by absolute column/row offset) whose mask is known from min/max alone:
+    # "nodata" when no pixel is valid and inside the region, "clear" / "full" when every
+    # pixel is and none / all of them pass, and "empty" when none passes but some pixels
+    # are nodata or outside the region (where they are still needs the DEM)
+    states = {}
+    for col, row, width, height, lo, hi, n_valid in index["tiles"]:
+        if not n_valid:
+            states[(col, row)] = "nodata"
+            continue
+        complete = n_valid == width * height
+        if comparison == "above":
+            passes_none, passes_all = hi <= threshold, lo > threshold
+        else:
+            passes_none, passes_all = lo >= threshold, hi < threshold
+        if passes_none:
+            states[(col, row)] = "clear" if complete else "empty"
+        elif passes_all and complete:
+            states[(col, row)] = "full"
+    return states
+
+
+def none_pass(index, threshold, comparison):
+    # True only when the per-window min/max prove no pixel passes; the histogram count
+    # is an estimate for float DEMs and can round to 0 while a few pixels still pass
+    states = tile_states(index, threshold, comparison)
+    return all(states.get((tile[0], tile[1])) in ("nodata", "clear", "empty") for tile in index["tiles"])
+
+
+def index_enabled():
+    return os.getenv("GEOAI_ELEVATION_INDEX", "1") != "0"
@@ -0,0 +1,198 @@
+import heapq
+import importlib.util
+import os
+import threading
+
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.features import geometry_mask
+from rasterio.windows import Window
+from tools.polygonize import vectorize_selected, merge_seams, georeference
+from tools.raster_io import cog_writer, warped
+from tools.raster_tool import MASK_NODATA
+
+# Optional lazy backend (GEOAI_RASTER_BACKEND=dask): rasters open through rioxarray as
+# chunked dask arrays, and a chain of stages (weighted sum -> top-k, threshold ->
+# safe-zone polygons) stays one task graph that is computed in a single parallel pass
+# over the input chunks. dask and rioxarray are imported only when the backend is used.
+
+# Chunk edge length (pixels) of lazily opened rasters
+DEFAULT_CHUNK = 2048
+
+# Per-pixel classes of a thresholded region
+OUTSIDE, HAZARD, SAFE = 0, 1, 2
+
+
+def lazy_enabled():
+    if os.getenv("GEOAI_RASTER_BACKEND", "numpy").lower() != "dask":
+        return False
+    return all(importlib.util.find_spec(name) is not None for name in ("dask", "rioxarray"))
+
+
+def write_intermediates(state):
+    # Intermediate rasters of a fused chain are only written when asked for
+    return bool(state.get("write_intermediates", os.getenv("GEOAI_WRITE_INTERMEDIATES", "0") == "1"))
+
+
+def _compute(*args, workers=None):
+    import dask
+    return dask.compute(*args, scheduler="threads", num_workers=workers or os.cpu_count() or 1)
+
+
+def _offsets(chunks):
+    return np.cumsum((0,) + chunks[:-1]).tolist()
+
+
+def open_band(path, reference=None):
+    # Band 1 as a chunked float32 dask array (NaN where nodata), warped (bilinear)
+    # onto reference (crs, transform, width, height) when the grids differ
+    import rioxarray
+
+    size = int(os.getenv("GEOAI_DASK_CHUNK", DEFAULT_CHUNK))
+    with rasterio.open(path) as src:
+        grid = (src.crs, src.transform, src.width, src.height)
+        if reference is not None and grid != (
+            reference["crs"], reference["transform"], reference["width"], reference["height"]
+        ):
+            with warped(src, reference) as vrt:
+                data = rioxarray.open_rasterio(vrt, chunks={"x": size, "y": size}, masked=True, lock=False)
+        else:
+            data = rioxarray.open_rasterio(path, chunks={"x": size, "y": size}, masked=True, lock=False)
+    return data.isel(band=0).data.astype(np.float32)
+
+
+class _BandWriter:
+    # da.store target: each computed block is written into band 1 of an open dataset
+    def __init__(self, dst):
+        self.dst = dst
+
+    def __setitem__(self, key, block):
+        self.dst.write(block, 1, window=Window.from_slices(*key))
+
+
+def store(array, dst):
+    # Delayed write of a dask array into dst, to be computed with the rest of a chain
+    import dask.array as da
+    return da.store(array, _BandWriter(dst), lock=threading.Lock(), compute=False)
+
+
+# ---------------------- Suitability -> ranking ----------------------
+
+def weighted_sum(paths, weights, reference):
+    # NaN wherever any criterion has no data
+    layers = [open_band(path, reference) for path in paths]
+    return sum(np.float32(weight) * layer for weight, layer in zip(weights, layers))
+
+
+def normalized(total, min_val, max_val):
+    import dask.array as da
+    scale = 0.0 if max_val == min_val else 1.0 / (max_val - min_val)
+    return da.where(da.isnan(total), 0, (total - np.float32(min_val)) * np.float32(scale)).astype(np.float32)
+
+
+def write_suitability(total, min_val, max_val, output_path, meta, workers=None):
+    meta = {**meta, "dtype": "float32", "count": 1, "nodata": 0}
+    with cog_writer(output_path, meta, resampling="average") as dst:
+        _compute(store(normalized(total, min_val, max_val), dst), workers=workers)
+    return output_path
+
+
+def suitability(paths, weights, reference, output_path, meta, workers=None):
+    # Range pass, then the normalize-and-write pass, both chunk-parallel
+    import dask.array as da
+    total = weighted_sum(paths, weights, reference)
+    min_val, max_val = _compute(da.nanmin(total), da.nanmax(total), workers=workers)
+    if np.isnan(min_val):
+        raise ValueError("No pixel has valid data in every criterion.")
+    return write_suitability(total, float(min_val), float(max_val), output_path, meta, workers)
+
+
+def _block_candidates(block, k, footprint, row_off, col_off):
+    from tools.ranking_tool import tile_candidates
+    picks, valid_count = tile_candidates(block, None, k, footprint)
+    return [(value, row + row_off, col + col_off) for value, row, col in picks], valid_count
+
+
+def top_candidates(surface, k, footprint=None, workers=None):
+    # Best k (value, row, col) of a lazy surface plus its valid-pixel count and value
+    # range, all from one pass: the blocks feeding the per-chunk top-k also feed the
+    # min / max reductions, so each input chunk is read once
+    import dask
+    import dask.array as da
+
+    blocks = surface.to_delayed()
+    rows, cols = _offsets(surface.chunks[0]), _offsets(surface.chunks[1])
+    tasks = [
+        dask.delayed(_block_candidates)(blocks[i, j], k, footprint, row_off, col_off)
+        for i, row_off in enumerate(rows) for j, col_off in enumerate(cols)
+    ]
+    per_block, min_val, max_val = _compute(tasks, da.nanmin(surface), da.nanmax(surface), workers=workers)
+
+    heap = []
+    valid_total = 0
+    for picks, valid_count in per_block:
+        valid_total += valid_count
+        for item in picks:
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            else:
+                heapq.heappushpop(heap, item)
+    return sorted(heap, reverse=True), valid_total, float(min_val), float(max_val)
+
+
+# ---------------------- Threshold -> safe zones ----------------------
+
+class _Classifier:
+    # Block function: OUTSIDE (outside the region or nodata), HAZARD or SAFE per pixel
+    def __init__(self, geom, threshold, comparison, transform, window):
+        self.geom = geom
+        self.threshold = threshold
+        self.comparison = comparison
+        self.transform = transform
+        self.window = window
+
+    def __call__(self, block, block_info=None):
+        (row_start, _), (col_start, _) = block_info[0]["array-location"]
+        transform = self.transform * Affine.translation(
+            self.window.col_off + col_start, self.window.row_off + row_start
+        )
+        inside = geometry_mask(self.geom, out_shape=block.shape, transform=transform, invert=True)
+        inside &= ~np.isnan(block)
+        hazard = block > self.threshold if self.comparison == "above" else block < self.threshold
+        return np.where(inside, np.where(hazard, HAZARD, SAFE), OUTSIDE).astype(np.uint8)
+
+
+def safe_zones(dem_path, geom, threshold, comparison, window, simplify=None, dissolve=False,
+               mask_path=None, workers=None):
+    # Safe-zone polygons of a region straight from the DEM: classify, vectorize each
+    # chunk and (with mask_path) write the hazard mask, all in one pass over the DEM
+    import dask
+
+    with rasterio.open(dem_path) as src:
+        transform = src.transform
+        meta = src.meta.copy()
+
+    dem = open_band(dem_path)[window.toslices()]
+    classes = dem.map_blocks(_Classifier(geom, threshold, comparison, transform, window), dtype=np.uint8)
+    safe = classes == SAFE
+
+    blocks = safe.to_delayed()
+    rows = [int(window.row_off) + r for r in _offsets(safe.chunks[0])]
+    cols = [int(window.col_off) + c for c in _offsets(safe.chunks[1])]
+    tasks = [
+        dask.delayed(vectorize_selected)(blocks[i, j], col_off, row_off)
+        for i, row_off in enumerate(rows) for j, col_off in enumerate(cols)
+    ]
+
+    if mask_path:
+        meta.update(height=int(window.height), width=int(window.width), transform=transform * Affine.translation(
+            window.col_off, window.row_off), dtype="uint8", count=1, nodata=MASK_NODATA)
+        mask = np.where(classes == OUTSIDE, MASK_NODATA, classes == HAZARD).astype(np.uint8)
+        with cog_writer(mask_path, meta) as dst:
+            per_block, _ = _compute(tasks, store(mask, dst), workers=workers)
+    else:
+        per_block, = _compute(tasks, workers=workers)
+
+    geoms = merge_seams([g for chunk in per_block for g in chunk], cols[1:], rows[1:])
+    return georeference(geoms, transform, simplify, dissolve)
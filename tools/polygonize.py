@@ -0,0 +1,118 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import rasterio
+import shapely
+from affine import Affine
+from rasterio.features import shapes
+from rasterio.windows import Window
+from shapely.geometry import shape
+from tools.windows import iter_windows
+
+# Edge length (pixels) of the tiles handed to each polygonization worker
+DEFAULT_TILE_SIZE = 2048
+
+
+class ValueSelector:
+    # Selects the pixels equal to a single raster value (picklable for worker processes)
+    def __init__(self, value=1):
+        self.value = value
+
+    def __call__(self, data, transform):
+        return data == self.value
+
+
+def _vectorize_tile(path, window, selector, band=1):
+    with rasterio.open(path) as src:
+        data = src.read(band, window=window)
+        selected = selector(data, src.window_transform(window))
+
+    return vectorize_selected(selected, window.col_off, window.row_off)
+
+
+def vectorize_selected(selected, col_off, row_off):
+    if not selected.any():
+        return []
+
+    # Vectorize in global pixel coordinates: integer edges make seams line up exactly
+    pixel_transform = Affine.translation(col_off, row_off)
+    return [
+        shape(geom)
+        for geom, _ in shapes(selected.astype(np.uint8), mask=selected, transform=pixel_transform)
+    ]
+
+
+def merge_seams(geoms, seam_cols, seam_rows):
+    # Polygons cut by a tile edge have that edge as one of their bounds;
+    # only those need to be unioned with their neighbours
+    if not geoms or (not seam_cols and not seam_rows):
+        return geoms
+
+    geoms = np.asarray(geoms, dtype=object)
+    bounds = shapely.bounds(geoms)
+    on_seam = (
+        np.isin(bounds[:, 0], seam_cols) | np.isin(bounds[:, 2], seam_cols) |
+        np.isin(bounds[:, 1], seam_rows) | np.isin(bounds[:, 3], seam_rows)
+    )
+    if not on_seam.any():
+        return list(geoms)
+
+    merged = shapely.get_parts(shapely.union_all(geoms[on_seam]))
+    return list(geoms[~on_seam]) + list(merged)
+
+
+def polygonize(path, selector=None, tile_size=None, workers=None, simplify=None, dissolve=False, band=1, window=None,
+               preview=None):
+    # window limits vectorization to part of the raster (e.g. a region inside a DEM mosaic);
+    # preview(geoms) is called once with the polygons of the first non-empty tile
+    selector = selector or ValueSelector(1)
+    tile_size = tile_size or DEFAULT_TILE_SIZE
+
+    with rasterio.open(path) as src:
+        full = window or Window(0, 0, src.width, src.height)
+        transform = src.transform
+
+    tiles = [absolute for _, absolute in iter_windows(full, (tile_size, tile_size))]
+    col_off, row_off = int(full.col_off), int(full.row_off)
+    seam_cols = list(range(col_off + tile_size, col_off + int(full.width), tile_size))
+    seam_rows = list(range(row_off + tile_size, row_off + int(full.height), tile_size))
+
+    def collect(results):
+        tile_geoms = []
+        for chunk in results:
+            if preview is not None and chunk and not any(tile_geoms):
+                preview(georeference(chunk, transform, simplify))
+            tile_geoms.append(chunk)
+        return tile_geoms
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tiles) == 1:
+        tile_geoms = collect(_vectorize_tile(path, window, selector, band) for window in tiles)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tiles))) as pool:
+            tile_geoms = collect(pool.map(
+                _vectorize_tile,
+                [path] * len(tiles), tiles, [selector] * len(tiles), [band] * len(tiles)
+            ))
+
+    geoms = merge_seams([g for chunk in tile_geoms for g in chunk], seam_cols, seam_rows)
+    return georeference(geoms, transform, simplify, dissolve)
+
+
+def georeference(geoms, transform, simplify=None, dissolve=False):
+    # Pixel-coordinate polygons -> dataset CRS in one vectorized pass
+    if not geoms:
+        return []
+
+    a, b, c, d, e, f = transform[:6]
+    geoms = shapely.transform(
+        np.asarray(geoms, dtype=object),
+        lambda xy: np.column_stack((a * xy[:, 0] + b * xy[:, 1] + c, d * xy[:, 0] + e * xy[:, 1] + f))
+    )
+
+    if simplify:
+        geoms = shapely.simplify(geoms, simplify, preserve_topology=True)
+    if dissolve:
+        return [shapely.union_all(geoms)]
+    return list(geoms)
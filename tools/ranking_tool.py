@@ -1,53 +1,230 @@
-import os
-import rasterio
-import geopandas as gpd
-from shapely.geometry import Point
-import numpy as np
-
-def ranking_tool_fn(state):
-    try:
-        suitability_path = state["suitability_output"]
-        num_top_locations = state.get("top_n", 5)
-        output_path = f"data/{state['region']}top{num_top_locations}_locations.geojson"
-        os.makedirs("data", exist_ok=True)
-
-        if num_top_locations <= 0:
-            raise ValueError("Number of top locations must be greater than zero.")
-
-        with rasterio.open(suitability_path) as src:
-            data = src.read(1)
-            transform = src.transform
-            crs = src.crs or "EPSG:4326"
-
-            # Mask out nodata if set
-            if src.nodata is not None:
-                data = np.where(data == src.nodata, np.nan, data)
-
-        # Flatten and remove NaNs
-        valid_indices = np.flatnonzero(~np.isnan(data))
-        if len(valid_indices) < num_top_locations:
-            raise ValueError("Not enough valid data points to select top locations.")
-
-        # Find top-N indices
-        flat_data = data.ravel()
-        top_indices = valid_indices[np.argpartition(flat_data[valid_indices], -num_top_locations)[-num_top_locations:]]
-        top_indices = top_indices[np.argsort(flat_data[top_indices])[::-1]]  # sort descending
-
-        coords = [~transform * (idx % data.shape[1], idx // data.shape[1]) for idx in top_indices]
-        gdf = gpd.GeoDataFrame(geometry=[Point(xy) for xy in coords], crs=crs)
-        gdf.to_file(output_path, driver="GeoJSON", index=False)
-
-        state["cot_log"].append(f"Top {num_top_locations} ranked locations saved at {output_path}")
-        return {
-            **state,
-            "ranking_output": output_path,
-            "step": "complete"
-        }
-    except Exception as e:
-        state["cot_log"].append(f"Error in ranking_tool_fn: {str(e)}")
-        return {
-            **state,
-            "ranking_output": None,
-            "step": "complete",
-            "error": str(e)
-        }
\ No newline at end of file
+import os
+import heapq
+import math
+import rasterio
+import geopandas as gpd
+import numpy as np
+from rasterio.errors import CRSError
+from rasterio.transform import xy
+from rasterio.windows import Window
+from tools.windows import window_shape, iter_windows, WINDOWED_PIXEL_THRESHOLD
+from tools.vector_io import vector_path, write_vector
+from tools.raster_cache import raster_cache_enabled, mapped_band
+from tools.lazy_raster import lazy_enabled, write_intermediates
+from working_set import load, file_key
+from dem_store import METERS_PER_DEGREE
+
+# With min_spacing set, each tile contributes this many times top_n candidates
+# so the global suppression pass still has enough to choose from
+NMS_OVERSAMPLE = 4
+
+
+def metre_scale(crs, bounds):
+    # Metres per map unit along x and y. Degrees are converted at the latitude of the
+    # raster's centre (east-west degrees shrink with cos(latitude)), which holds to well
+    # under a percent across a region; projected CRSs use their linear unit
+    if crs is not None and crs.is_geographic:
+        lat = math.radians((bounds[1] + bounds[3]) / 2)
+        return METERS_PER_DEGREE * math.cos(lat), METERS_PER_DEGREE
+    try:
+        factor = crs.linear_units_factor[1]
+    except (AttributeError, CRSError):
+        factor = 1.0
+    return factor, factor
+
+
+def spacing_footprint(min_spacing, res, scale, shape):
+    # Pixels around a pick (at the centre) whose centres are closer than min_spacing
+    # metres: the same Euclidean test suppress() applies to the final candidates.
+    # Half-sizes are clamped to shape (the tile): a pick at any pixel already clears
+    # the whole tile along an axis where the spacing exceeds it
+    res_x, res_y = res[0] * scale[0], res[1] * scale[1]
+    rows = min(math.ceil(min_spacing / res_y), int(shape[0]))
+    cols = min(math.ceil(min_spacing / res_x), int(shape[1]))
+    dr, dc = np.ogrid[-rows:rows + 1, -cols:cols + 1]
+    return np.hypot(dr * res_y, dc * res_x) < min_spacing
+
+
+def tile_candidates(data, nodata, k, footprint=None):
+    # Top-k (value, row, col) of one tile; with a footprint (see spacing_footprint),
+    # picks are greedy local maxima, each clearing the footprint around it
+    data = data.astype(np.float32)
+    invalid = np.isnan(data)
+    if nodata is not None:
+        invalid |= data == nodata
+    data[invalid] = -np.inf
+    valid_count = int(data.size - np.count_nonzero(invalid))
+    k = min(k, valid_count)
+    if k == 0:
+        return [], valid_count
+
+    if footprint is None:
+        flat = data.ravel()
+        top = np.argpartition(flat, -k)[-k:]
+        rows, cols = np.unravel_index(top, data.shape)
+        return list(zip(flat[top].tolist(), rows.tolist(), cols.tolist())), valid_count
+
+    picks = []
+    half_rows, half_cols = footprint.shape[0] // 2, footprint.shape[1] // 2
+    for _ in range(k):
+        idx = int(np.argmax(data))
+        row, col = divmod(idx, data.shape[1])
+        value = float(data[row, col])
+        if value == -np.inf:
+            break
+        picks.append((value, row, col))
+        # The footprint, cut where it overhangs the tile edges
+        r0, r1 = max(0, row - half_rows), min(data.shape[0], row + half_rows + 1)
+        c0, c1 = max(0, col - half_cols), min(data.shape[1], col + half_cols + 1)
+        clip = footprint[r0 - row + half_rows:r1 - row + half_rows, c0 - col + half_cols:c1 - col + half_cols]
+        data[r0:r1, c0:c1][clip] = -np.inf
+    return picks, valid_count
+
+
+def rank_windowed(src, k, window_size=None, footprint=None, band=None):
+    # Bounded min-heap of the best candidates across tiles: memory is one
+    # tile plus k entries, however large the raster is. band (a mapped array)
+    # is sliced instead of reading each tile from src
+    heap = []
+    valid_total = 0
+    full = Window(0, 0, src.width, src.height)
+    for _, window in iter_windows(full, window_shape(src, window_size)):
+        data = band[window.toslices()] if band is not None else src.read(1, window=window)
+        picks, valid_count = tile_candidates(data, src.nodata, k, footprint)
+        valid_total += valid_count
+        for value, row, col in picks:
+            item = (value, row + int(window.row_off), col + int(window.col_off))
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            else:
+                heapq.heappushpop(heap, item)
+    return sorted(heap, reverse=True), valid_total
+
+
+def suppress(candidates, xs, ys, n, min_spacing, scale=(1.0, 1.0)):
+    # Greedy non-maximum suppression over value-sorted candidates, min_spacing in metres
+    # (scale: metres per map unit along x and y, see metre_scale)
+    sx, sy = scale
+    keep = []
+    for i in range(len(candidates)):
+        if all(math.hypot((xs[i] - xs[j]) * sx, (ys[i] - ys[j]) * sy) >= min_spacing for j in keep):
+            keep.append(i)
+            if len(keep) == n:
+                break
+    return keep
+
+
+def rank_raster(state, suitability_path, k):
+    min_spacing = state.get("min_spacing")
+    with rasterio.open(suitability_path) as src:
+        unit_scale = metre_scale(src.crs, src.bounds)
+
+        # The shared memory-mapped surface replaces a private decode of the raster
+        band = mapped_band(suitability_path)[0] if raster_cache_enabled() else None
+        windowed = state.get("windowed")
+        if windowed is None:
+            windowed = src.width * src.height > WINDOWED_PIXEL_THRESHOLD
+
+        footprint = None
+        if min_spacing:
+            tile = window_shape(src, state.get("window_size")) if windowed else src.shape
+            footprint = spacing_footprint(min_spacing, src.res, unit_scale, tile)
+
+        if windowed:
+            candidates, valid_count = rank_windowed(src, k, state.get("window_size"), footprint, band)
+        else:
+            # Re-ranking the same surface (another top_n or spacing) reuses the array
+            data = band if band is not None else load(("raster", *file_key(suitability_path)), lambda: src.read(1))
+            candidates, valid_count = tile_candidates(data, src.nodata, k, footprint)
+            candidates.sort(reverse=True)
+        return candidates, valid_count, src.transform, src.crs or "EPSG:4326", unit_scale
+
+
+def rank_suitability(state, suitability_path, k):
+    # Normalizing is monotonic, so the best pixels of the raw weighted sum are the best
+    # of the suitability map: one pass finds them and the range that scales their scores
+    from tools.lazy_raster import weighted_sum, top_candidates, write_suitability
+
+    criteria_paths = state["criteria_paths"]
+    if len(criteria_paths) != len(state["weights"]):
+        raise ValueError("Mismatch between number of criteria paths and weights.")
+
+    with rasterio.open(state.get("reference_grid") or criteria_paths[0]) as ref:
+        meta = ref.meta.copy()
+        reference = {"crs": ref.crs, "transform": ref.transform, "width": ref.width, "height": ref.height}
+        res, shape = ref.res, ref.shape
+        unit_scale = metre_scale(ref.crs, ref.bounds)
+
+    min_spacing = state.get("min_spacing")
+    footprint = spacing_footprint(min_spacing, res, unit_scale, shape) if min_spacing else None
+    total = weighted_sum(criteria_paths, state["weights"], reference)
+    candidates, valid_count, min_val, max_val = top_candidates(total, k, footprint, state.get("workers"))
+
+    scale = 0.0 if max_val == min_val else 1.0 / (max_val - min_val)
+    candidates = [((value - min_val) * scale, row, col) for value, row, col in candidates]
+
+    if write_intermediates(state):
+        write_suitability(total, min_val, max_val, suitability_path, meta, state.get("workers"))
+        state["cot_log"].append(f"Suitability map written to {suitability_path}")
+    return candidates, valid_count, reference["transform"], reference["crs"] or "EPSG:4326", unit_scale
+
+
+def ranking_tool_fn(state):
+    try:
+        suitability_path = state["suitability_output"]
+        num_top_locations = state.get("top_n", 5)
+        min_spacing = state.get("min_spacing")  # metres
+        output_path = vector_path(f"data/{state['region']}_top_{num_top_locations}_locations")
+        os.makedirs("data", exist_ok=True)
+
+        if num_top_locations <= 0:
+            raise ValueError("Number of top locations must be greater than zero.")
+
+        k = num_top_locations * NMS_OVERSAMPLE if min_spacing else num_top_locations
+        criteria_paths = state.get("criteria_paths")
+        if lazy_enabled() and criteria_paths and not os.path.exists(suitability_path):
+            # suitability -> ranking fused: top-k straight from the lazy weighted sum
+            candidates, valid_count, transform, crs, unit_scale = rank_suitability(state, suitability_path, k)
+            state["cot_log"].append("Ranked the weighted criteria directly (dask backend)")
+        else:
+            candidates, valid_count, transform, crs, unit_scale = rank_raster(state, suitability_path, k)
+
+        if valid_count < num_top_locations:
+            raise ValueError("Not enough valid data points to select top locations.")
+
+        # Pixel centres -> map coordinates, all at once
+        rows = np.array([c[1] for c in candidates])
+        cols = np.array([c[2] for c in candidates])
+        xs, ys = xy(transform, rows, cols)
+        xs, ys = np.atleast_1d(xs), np.atleast_1d(ys)
+
+        if min_spacing:
+            keep = suppress(candidates, xs, ys, num_top_locations, min_spacing, unit_scale)
+            if len(keep) < num_top_locations:
+                state["cot_log"].append(
+                    f"Only {len(keep)} locations are at least {min_spacing} m apart; returning those"
+                )
+        else:
+            keep = list(range(num_top_locations))
+
+        gdf = gpd.GeoDataFrame(
+            {"rank": np.arange(1, len(keep) + 1), "score": [candidates[i][0] for i in keep]},
+            geometry=gpd.points_from_xy(xs[keep], ys[keep]),
+            crs=crs
+        )
+        write_vector(gdf, output_path)
+
+        state["cot_log"].append(f"Top {num_top_locations} ranked locations saved at {output_path}")
+        return {
+            **state,
+            "ranking_output": output_path,
+            "step": "complete"
+        }
+    except Exception as e:
+        state["cot_log"].append(f"Error in ranking_tool_fn: {str(e)}")
+        return {
+            **state,
+            "ranking_output": None,
+            "step": "complete",
+            "error": str(e)
+        }
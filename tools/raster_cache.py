@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.windows import Window
+
+from tools.raster_io import warped
+from tools.windows import window_shape, iter_windows
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent decoders may both write; the last rename wins
+    fcntl = None
+
+# Decoded bands are stored uncompressed as .npy files that every process maps
+# read-only: the OS page cache holds one copy of a DEM however many sessions or
+# batch workers read it, and nothing is decompressed twice
+
+# Part of every key; bumped when the decoded contents change for the same source
+# (2: warped bands without nodata fill uncovered cells with NaN instead of 0)
+FORMAT_VERSION = 2
+
+# Total size of decoded arrays before the least recently mapped are deleted
+# (GEOAI_RASTER_CACHE_BYTES overrides)
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+
+
+def raster_cache_enabled():
+    return os.getenv("GEOAI_RASTER_CACHE", "1") != "0"
+
+
+def cache_root():
+    return os.getenv("GEOAI_RASTER_CACHE_DIR", "data/cache/arrays")
+
+
+def max_bytes():
+    return int(os.getenv("GEOAI_RASTER_CACHE_BYTES", DEFAULT_MAX_BYTES))
+
+
+def _grid(reference):
+    return [str(reference["crs"]), list(reference["transform"])[:6], reference["width"], reference["height"]]
+
+
+def _version(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+@contextmanager
+def _decode_lock(lock_path):
+    # One process decodes a product; the others wait for it and then map the result
+    with open(lock_path, "w") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _decode(src, array_path, band, region):
+    # Window by window into a new .npy, so decoding never holds the raster in memory
+    tmp_path = f"{array_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        out = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=src.dtypes[band - 1], shape=(int(region.height), int(region.width))
+        )
+        for dst_window, src_window in iter_windows(region, window_shape(src)):
+            out[dst_window.toslices()] = src.read(band, window=src_window)
+        out.flush()
+        del out
+        os.replace(tmp_path, array_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def mapped_band(path, band=1, reference=None, window=None):
+    # (read-only memmap of the band, {"transform", "crs", "nodata"}). With reference
+    # (a grid dict: crs, transform, width, height) the band is first warped onto that
+    # grid (bilinear), so criteria on other grids map aligned as well. With window
+    # (whole pixels) only that part is decoded and mapped, and the transform is the
+    # window's: a region's slice of a DEM mosaic, not the full tiles under it
+    with rasterio.open(path) as src:
+        native = {"crs": src.crs, "transform": src.transform, "width": src.width, "height": src.height}
+    if reference is not None and _grid(reference) == _grid(native):
+        reference = None
+    grid = reference or native
+    region = Window(0, 0, grid["width"], grid["height"])
+    if window is not None:
+        region = Window(*[int(round(v)) for v in window.flatten()]).intersection(region)
+    extent = [int(region.col_off), int(region.row_off), int(region.width), int(region.height)]
+
+    root = cache_root()
+    os.makedirs(root, exist_ok=True)
+    source, version = os.path.abspath(path), _version(path)
+    key = hashlib.sha1(json.dumps(
+        [FORMAT_VERSION, source, version, band, reference and _grid(reference), extent]
+    ).encode()).hexdigest()
+    array_path = os.path.join(root, f"{key}.npy")
+    meta_path = os.path.join(root, f"{key}.json")
+
+    if not os.path.exists(meta_path):
+        with _decode_lock(os.path.join(root, f"{key}.lock")):
+            if not os.path.exists(meta_path):
+                with rasterio.open(path) as src:
+                    if reference is not None:
+                        with warped(src, reference) as vrt:
+                            _decode(vrt, array_path, band, region)
+                            nodata = vrt.nodata
+                    else:
+                        _decode(src, array_path, band, region)
+                        nodata = src.nodata
+                transform = Affine(*list(grid["transform"])[:6]) * Affine.translation(extent[0], extent[1])
+                meta = {
+                    "transform": list(transform)[:6],
+                    "crs": grid["crs"].to_wkt() if grid["crs"] else None,
+                    "nodata": nodata,
+                    "source": source, "version": version, "band": band
+                }
+                tmp_path = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+                try:
+                    with open(tmp_path, "w") as f:
+                        json.dump(meta, f)
+                    os.replace(tmp_path, meta_path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+        _drop_stale(root, source, version)
+        _evict(root, keep=key)
+    else:
+        # Access time for LRU eviction: the metadata file's mtime
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        array = np.load(array_path, mmap_mode="r")
+    except FileNotFoundError:
+        # Evicted by another process between the check and the map: decode again
+        _remove_entry(os.path.join(root, key))
+        return mapped_band(path, band, reference, window)
+    meta["transform"] = Affine(*meta["transform"])
+    return array, meta
+
+
+def _remove_entry(stem):
+    # Metadata first, so a concurrent reader decodes afresh rather than mapping a half-removed entry
+    for suffix in (".json", ".npy", ".lock"):
+        try:
+            os.remove(stem + suffix)
+        except OSError:
+            pass
+
+
+def _evict(root, keep):
+    # Least recently mapped arrays go first until the total fits the byte budget;
+    # the array just decoded is always kept, even if it alone exceeds it. Arrays
+    # still mapped elsewhere stay readable: removing a file does not unmap it
+    entries = []
+    for name in os.listdir(root):
+        if not name.endswith(".json"):
+            continue
+        stem = os.path.join(root, name[:-len(".json")])
+        try:
+            entries.append((os.path.getmtime(stem + ".json"), os.path.getsize(stem + ".npy"), stem))
+        except OSError:
+            continue
+    total = sum(size for _, size, _ in entries)
+    budget = max_bytes()
+    for _, size, stem in sorted(entries):
+        if total <= budget:
+            break
+        if os.path.basename(stem) == keep:
+            continue
+        _remove_entry(stem)
+        total -= size
+
+
+def _drop_stale(root, source, version):
+    # Arrays decoded from an older version of the same file are never read again
+    for name in os.listdir(root):
+        if not name.endswith(".json"):
+            continue
+        meta_path = os.path.join(root, name)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if meta.get("source") == source and meta.get("version") != version:
+            _remove_entry(meta_path[:-len(".json")])
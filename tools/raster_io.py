@@ -0,0 +1,136 @@
+import os
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+from rasterio.io import MemoryFile
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window, from_bounds
+
+from tools.windows import window_shape, iter_windows
+
+# Internal tile size of written COGs; overviews stop once they fit in one tile
+COG_BLOCK_SIZE = 512
+
+
+def warped(src, reference, resampling=Resampling.bilinear):
+    # src on a reference grid (crs, transform, width, height). Cells the source does not
+    # cover read as nodata: its own, or NaN (warped as float32) when it declares none,
+    # so they are never mistaken for real zeros
+    extra = {} if src.nodata is not None else {"nodata": np.nan, "dtype": "float32"}
+    return WarpedVRT(
+        src, crs=reference["crs"], transform=reference["transform"],
+        width=reference["width"], height=reference["height"], resampling=resampling, **extra
+    )
+
+
+def overview_factors(width, height, block_size=COG_BLOCK_SIZE):
+    factors = []
+    factor = 2
+    while max(width, height) / factor >= block_size / 2:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+@lru_cache(maxsize=None)
+def codec_available(compress):
+    # Whether this GDAL build writes the codec: a one-pixel GeoTIFF is written in memory
+    # and read back. Builds without it either raise or silently write uncompressed
+    try:
+        with MemoryFile() as memfile:
+            with memfile.open(driver="GTiff", width=1, height=1, count=1, dtype="uint8", compress=compress,
+                             transform=rasterio.transform.from_origin(0, 1, 1, 1)) as dst:
+                dst.write(np.zeros((1, 1, 1), dtype=np.uint8))
+            with memfile.open() as src:
+                return src.compression is not None and src.compression.name.upper() == compress
+    except Exception:
+        return False
+
+
+def _cog_options(dtype):
+    # GEOAI_COG_COMPRESS picks the codec (ZSTD by default, DEFLATE when GDAL lacks it)
+    compress = os.getenv("GEOAI_COG_COMPRESS", "ZSTD").upper()
+    if compress != "DEFLATE" and not codec_available(compress):
+        compress = "DEFLATE"
+    predictor = 3 if np.issubdtype(np.dtype(dtype), np.floating) else 2
+    return {
+        "driver": "GTiff",
+        "tiled": True,
+        "blockxsize": COG_BLOCK_SIZE,
+        "blockysize": COG_BLOCK_SIZE,
+        "compress": compress,
+        "predictor": predictor,
+        "copy_src_overviews": True,
+        "bigtiff": "IF_SAFER"
+    }
+
+
+def to_cog(src_path, dst_path=None, resampling="nearest"):
+    # Adds overviews to src_path and rewrites it as a Cloud-Optimized GeoTIFF
+    # (tiled, compressed with a predictor, overviews stored after the header)
+    dst_path = dst_path or src_path
+    with rasterio.open(src_path, "r+") as src:
+        factors = overview_factors(src.width, src.height)
+        if factors:
+            src.build_overviews(factors, Resampling[resampling])
+            src.update_tags(ns="rio_overview", resampling=resampling)
+        dtype = src.dtypes[0]
+
+    # Unique per call: threads of one process may convert the same product at once
+    tmp_path = f"{dst_path}.{uuid.uuid4().hex}.cog.tif"
+    try:
+        rasterio.shutil.copy(src_path, tmp_path, **_cog_options(dtype))
+        os.replace(tmp_path, dst_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    if src_path != dst_path:
+        os.remove(src_path)
+    return dst_path
+
+
+@contextmanager
+def cog_writer(path, profile, resampling="nearest"):
+    # Write windows into a plain tiled GeoTIFF, then build overviews and
+    # convert to a COG on close; memory stays bounded by what the caller writes
+    work_path = f"{path}.{uuid.uuid4().hex}.work.tif"
+    work_profile = {k: v for k, v in profile.items() if k not in ("compress", "predictor", "blockxsize", "blockysize")}
+    work_profile.update({
+        "driver": "GTiff",
+        "tiled": True,
+        "blockxsize": COG_BLOCK_SIZE,
+        "blockysize": COG_BLOCK_SIZE,
+        "bigtiff": "IF_SAFER"
+    })
+
+    try:
+        with rasterio.open(work_path, "w", **work_profile) as dst:
+            yield dst
+        to_cog(work_path, path, resampling=resampling)
+    finally:
+        if os.path.exists(work_path):
+            os.remove(work_path)
+
+
+def export_window(src_path, dst_path, bounds):
+    # The part of a raster inside bounds (in its CRS) as a standalone COG, e.g. a
+    # region of a DEM mosaic VRT; copied window by window, never held in memory
+    with rasterio.open(src_path) as src:
+        region = from_bounds(*bounds, transform=src.transform).round_offsets().round_lengths()
+        region = region.intersection(Window(0, 0, src.width, src.height))
+        profile = src.profile.copy()
+        profile.update({
+            "driver": "GTiff",
+            "width": int(region.width),
+            "height": int(region.height),
+            "transform": src.window_transform(region)
+        })
+        with cog_writer(dst_path, profile, resampling="average") as dst:
+            for dst_window, src_window in iter_windows(region, window_shape(src)):
+                dst.write(src.read(window=src_window), window=dst_window)
+    return dst_path
@@ -1,95 +1,284 @@
-import os
-from rasterio.mask import mask
-import rasterio
-import geopandas as gpd
-from shapely.geometry import mapping, shape
-import numpy as np
-from rasterio.features import shapes
-
-def raster_tool_fn(state):
-    try:
-        region_path = state["region_path"]
-        dem_path = state["dem_path"]
-        threshold = state["threshold"]
-        comparison = state.get("comparison", "below")
-
-        os.makedirs("data", exist_ok=True)
-
-        region = gpd.read_file(region_path)
-        with rasterio.open(dem_path) as src:
-            # Reproject region to match DEM CRS if needed
-            if region.crs != src.crs:
-                region = region.to_crs(src.crs)
-
-            geom = [mapping(region.unary_union)]
-            clipped, transform = mask(src, geom, crop=True)
-            meta = src.meta.copy()
-
-            nodata = src.nodata if src.nodata is not None else -32768
-            elevation_data = clipped[0].astype(np.float32)
-            elevation_data[np.isclose(elevation_data, nodata)] = np.nan  # safer than equality
-
-            # Apply threshold
-            if comparison == "above":
-                mask_arr = (elevation_data > threshold).astype(np.uint8)
-            else:
-                mask_arr = (elevation_data < threshold).astype(np.uint8)
-
-            # Save raster mask
-            meta.update({
-                "height": mask_arr.shape[0],
-                "width": mask_arr.shape[1],
-                "transform": transform,
-                "dtype": "uint8",
-                "count": 1,
-                "nodata": 0
-            })
-
-            raster_out_path = f"data/{state['region']}_mask_{comparison}_{threshold}m.tif"
-            with rasterio.open(raster_out_path, "w", **meta) as dst:
-                dst.write(mask_arr, 1)
-
-            # Convert to vector polygons
-            results = (
-                {"properties": {"value": v}, "geometry": s}
-                for s, v in shapes(mask_arr, transform=transform)
-                if v == 1
-            )
-            geoms = [shape(feature["geometry"]) for feature in results]
-
-            if not geoms:
-                state["cot_log"].append(f"No areas found {comparison} {threshold}m.")
-                return {
-                    **state,
-                    "raster_result": {
-                        "status": "empty",
-                        "message": f"No areas found {comparison} {threshold}m."
-                    },
-                    "step": "complete"
-                }
-
-            vector_output = gpd.GeoDataFrame(geometry=geoms, crs=region.crs)
-            vector_out_path = f"data/{state['region']}_mask_{comparison}_{threshold}m.geojson"
-            vector_output.to_file(vector_out_path, driver="GeoJSON", index=False)
-
-        # Log
-        state["cot_log"].append(f"Masked raster saved to {raster_out_path}")
-        state["cot_log"].append(f"Vectorized thresholded areas saved to {vector_out_path}")
-
-        return {
-            **state,
-            "raster_result": {
-                "status": "success",
-                "raster_output": raster_out_path,
-                "vectorized_output": vector_out_path
-            },
-            "step": "complete"
-        }
-
-    except Exception as e:
-        state["cot_log"].append(f"Error in raster_tool_fn: {str(e)}")
-        return {
-            **state,
-            "raster_result": {"status": "error", "error_msg": str(e)},
-            "step": "complete"
+import os
+import hashlib
+from rasterio.mask import mask
+import rasterio
+import geopandas as gpd
+from shapely.geometry import mapping, shape
+import numpy as np
+from rasterio.features import geometry_mask, geometry_window
+from tools.windows import window_shape, iter_windows, WINDOWED_PIXEL_THRESHOLD
+from tools.polygonize import polygonize, ValueSelector
+from tools.raster_io import cog_writer
+from tools.vector_io import vector_path, write_vector, read_vector_cached
+from tools.elevation_index import load_index, ensure_index, threshold_stats, tile_states, none_pass, index_enabled
+from tools.raster_cache import raster_cache_enabled, mapped_band
+from working_set import load, file_key
+from streaming import raster_preview, features_preview
+from dem_store import level_suffix
+
+# Mask value of pixels outside the region or without DEM data (0 is "not on the
+# requested side", 1 is "on it"), so mask readers can tell no-hazard from no-data
+MASK_NODATA = 255
+
+
+def clip_elevation(src, geom):
+    # Region crop of band 1 as float32, with nodata (and outside-region pixels) as NaN
+    nodata = src.nodata if src.nodata is not None else -32768
+    if raster_cache_enabled():
+        # The region's window of the shared memory-mapped band instead of a private decode
+        window = geometry_window(src, geom)
+        transform = src.window_transform(window)
+        band, _ = mapped_band(src.name, window=window)
+        elevation_data = band.astype(np.float32)
+        elevation_data[geometry_mask(geom, out_shape=elevation_data.shape, transform=transform)] = np.nan
+    else:
+        clipped, transform = mask(src, geom, crop=True)
+        elevation_data = clipped[0].astype(np.float32)
+    elevation_data[np.isclose(elevation_data, nodata)] = np.nan  # safer than equality
+    return elevation_data, transform
+
+
+def clip_elevation_cached(src, geom):
+    # The clipped array is shared by a session's queries that only change the threshold;
+    # callers must not modify it
+    region = hashlib.sha1(b"".join(shape(g).wkb for g in geom)).hexdigest()
+    return load(("clip", *file_key(src.name), region), lambda: clip_elevation(src, geom))
+
+
+def write_mask(src, mask_arr, valid, transform, out_path):
+    meta = src.meta.copy()
+    meta.update({
+        "height": mask_arr.shape[0],
+        "width": mask_arr.shape[1],
+        "transform": transform,
+        "dtype": "uint8",
+        "count": 1,
+        "nodata": MASK_NODATA
+    })
+
+    with cog_writer(out_path, meta) as dst:
+        dst.write(np.where(valid, mask_arr, MASK_NODATA).astype(np.uint8), 1)
+
+
+def threshold_in_memory(src, geom, threshold, comparison, out_path):
+    elevation_data, transform = clip_elevation_cached(src, geom)
+
+    # Apply threshold
+    if comparison == "above":
+        mask_arr = (elevation_data > threshold).astype(np.uint8)
+    else:
+        mask_arr = (elevation_data < threshold).astype(np.uint8)
+
+    # Save raster mask
+    write_mask(src, mask_arr, ~np.isnan(elevation_data), transform, out_path)
+    return transform
+
+
+def threshold_levels(elevation_data, thresholds, comparison):
+    # One pass over the elevation array for many thresholds: each pixel gets the
+    # number of sorted thresholds it falls on the wrong side of, so the mask and
+    # pixel count for every threshold follow without re-reading the elevations.
+    # Returns (sorted thresholds, levels, per-threshold pixel counts)
+    thresholds = np.unique(np.asarray(thresholds, dtype=np.float64))
+    valid = ~np.isnan(elevation_data)
+    values = elevation_data[valid]
+
+    if comparison == "above":
+        # elevation > t[i]  <=>  i < (number of thresholds below the elevation)
+        side = "left"
+    else:
+        # elevation < t[i]  <=>  i >= (number of thresholds at or below the elevation)
+        side = "right"
+    # Nodata pixels get the level that is outside every mask
+    levels = np.full(elevation_data.shape, 0 if comparison == "above" else len(thresholds), dtype=np.int32)
+    levels[valid] = np.searchsorted(thresholds, values, side=side)
+
+    histogram = np.bincount(levels[valid], minlength=len(thresholds) + 1)
+    if comparison == "above":
+        # Pixels above t[i] are those with level > i
+        counts = histogram[::-1].cumsum()[::-1][1:]
+    else:
+        # Pixels below t[i] are those with level <= i
+        counts = histogram.cumsum()[:-1]
+    return thresholds, levels, counts
+
+
+def level_mask(levels, index, comparison):
+    if comparison == "above":
+        return levels > index
+    return levels <= index
+
+
+def threshold_windowed(src, geom, threshold, comparison, out_path, window_size=None, tile_states=None):
+    # Stream the thresholded mask into a tiled COG, one window at a time,
+    # so peak memory is bounded by the window size rather than the region size.
+    # tile_states (from the elevation index) marks windows known to be all nodata,
+    # all-0 or all-1, which are left empty or written without reading the DEM
+    region_window = geometry_window(src, geom)
+    transform = src.window_transform(region_window)
+    nodata = src.nodata if src.nodata is not None else -32768
+
+    meta = src.meta.copy()
+    meta.update({
+        "height": int(region_window.height),
+        "width": int(region_window.width),
+        "transform": transform,
+        "dtype": "uint8",
+        "count": 1,
+        "nodata": MASK_NODATA
+    })
+
+    band = mapped_band(src.name, window=region_window)[0] if raster_cache_enabled() else None
+
+    with cog_writer(out_path, meta) as dst:
+        for dst_window, src_window in iter_windows(region_window, window_shape(src, window_size)):
+            known = (tile_states or {}).get((int(src_window.col_off), int(src_window.row_off)))
+            if known == "nodata":
+                continue  # unwritten tiles read back as nodata
+            if known in ("clear", "full"):
+                dst.write(
+                    np.full((int(dst_window.height), int(dst_window.width)), int(known == "full"), dtype=np.uint8),
+                    1, window=dst_window
+                )
+                continue
+
+            if band is not None:
+                elevation_data = band[dst_window.toslices()].astype(np.float32)
+            else:
+                elevation_data = src.read(1, window=src_window).astype(np.float32)
+            inside = geometry_mask(
+                geom,
+                out_shape=elevation_data.shape,
+                transform=src.window_transform(src_window),
+                invert=True
+            )
+            valid = inside & ~np.isclose(elevation_data, nodata)
+
+            if comparison == "above":
+                mask_arr = elevation_data > threshold
+            else:
+                mask_arr = elevation_data < threshold
+            dst.write(np.where(valid, mask_arr, MASK_NODATA).astype(np.uint8), 1, window=dst_window)
+
+    return transform
+
+
+def vectorize_mask(state, raster_out_path, crs):
+    comparison = state.get("comparison", "below")
+    threshold = state["threshold"]
+    title = f"Elevation {comparison} {threshold}m"
+
+    preview = None
+    if state.get("previews"):
+        # The mask is on disk: show it while polygonization, the slow part, runs
+        raster_preview(raster_out_path, f"{title} (mask preview)", node="raster_analysis")
+        preview = lambda geoms: features_preview(geoms, crs, f"{title} (first polygons)", node="raster_analysis")
+
+    # Convert to vector polygons (tiled, in parallel, seams stitched)
+    geoms = polygonize(
+        raster_out_path,
+        ValueSelector(1),
+        tile_size=state.get("polygonize_tile_size"),
+        workers=state.get("polygonize_workers"),
+        simplify=state.get("simplify_tolerance"),
+        dissolve=state.get("dissolve", False),
+        preview=preview
+    )
+
+    if not geoms:
+        state["cot_log"].append(f"No areas found {comparison} {threshold}m.")
+        return {
+            "status": "empty",
+            "message": f"No areas found {comparison} {threshold}m."
+        }
+
+    vector_output = gpd.GeoDataFrame(geometry=geoms, crs=crs)
+    vector_out_path = write_vector(vector_output, vector_path(f"data/{state['region']}_mask_{comparison}_{threshold}m{level_suffix(state.get('dem_scale'))}"))
+
+    # Log
+    state["cot_log"].append(f"Masked raster saved to {raster_out_path}")
+    state["cot_log"].append(f"Vectorized thresholded areas saved to {vector_out_path}")
+
+    return {
+        "status": "success",
+        "raster_output": raster_out_path,
+        "vectorized_output": vector_out_path
+    }
+
+
+def raster_tool_fn(state):
+    try:
+        region_path = state["region_path"]
+        dem_path = state["dem_path"]
+        threshold = state["threshold"]
+        comparison = state.get("comparison", "below")
+
+        os.makedirs("data", exist_ok=True)
+
+        # The sidecar elevation index answers area and emptiness without reading pixels
+        index = None
+        if index_enabled():
+            index = ensure_index(dem_path, region_path) if state.get("stats_only") else load_index(dem_path, region_path)
+        area = None
+        if index:
+            empty = none_pass(index, threshold, comparison)
+            pixels, area_km2 = (0, 0.0) if empty else threshold_stats(index, threshold, comparison)
+            area = {"pixels": pixels, "area_km2": round(area_km2, 4)}
+            state["cot_log"].append(f"Elevation index: {area_km2:,.2f} km² ({pixels} pixels) {comparison} {threshold}m")
+
+            if state.get("stats_only"):
+                return {**state, "raster_result": {"status": "success", **area}, "step": "complete"}
+            if empty:
+                state["cot_log"].append(f"No areas found {comparison} {threshold}m.")
+                return {
+                    **state,
+                    "raster_result": {
+                        "status": "empty",
+                        "message": f"No areas found {comparison} {threshold}m.",
+                        **area
+                    },
+                    "step": "complete"
+                }
+
+        region = read_vector_cached(region_path)
+        with rasterio.open(dem_path) as src:
+            # Reproject region to match DEM CRS if needed
+            if region.crs != src.crs:
+                region = region.to_crs(src.crs)
+
+            geom = [mapping(region.union_all())]
+            # Masks of a preview level carry its scale, so they are never reused at another level
+            raster_out_path = f"data/{state['region']}_mask_{comparison}_{threshold}m{level_suffix(state.get('dem_scale'))}.tif"
+
+            windowed = state.get("windowed")
+            if windowed is None:
+                region_window = geometry_window(src, geom)
+                windowed = region_window.width * region_window.height > WINDOWED_PIXEL_THRESHOLD
+
+            if windowed:
+                # Index windows line up with ours only when both use the same window shape
+                states = None
+                if index and list(window_shape(src, state.get("window_size"))) == index["window_shape"]:
+                    states = tile_states(index, threshold, comparison)
+                threshold_windowed(
+                    src, geom, threshold, comparison, raster_out_path,
+                    window_size=state.get("window_size"),
+                    tile_states=states
+                )
+                state["cot_log"].append(f"Thresholded DEM window by window into {raster_out_path}")
+            else:
+                threshold_in_memory(src, geom, threshold, comparison, raster_out_path)
+
+            result = vectorize_mask(state, raster_out_path, region.crs)
+            if area and result["status"] == "success":
+                result.update(area)
+
+        return {**state, "raster_result": result, "step": "complete"}
+
+    except Exception as e:
+        state["cot_log"].append(f"Error in raster_tool_fn: {str(e)}")
+        return {
+            **state,
+            "raster_result": {"status": "error", "error_msg": str(e)},
+            "step": "complete"
         }
\ No newline at end of file
@@ -1,66 +1,197 @@
-import os
-import rasterio
-import numpy as np
-
-def suitability_tool_fn(state):
-    try:
-        criteria_paths = state["criteria_paths"]  # list of raster paths
-        weights = state["weights"]                # list of weights
-        output_path = f"data/{state['region']}_suitability.tif"
-        os.makedirs("data", exist_ok=True)
-
-        if len(criteria_paths) != len(weights):
-            raise ValueError("Mismatch between number of criteria paths and weights.")
-
-        weighted_sum = None
-        nodata_mask = None
-
-        for path, weight in zip(criteria_paths, weights):
-            with rasterio.open(path) as src:
-                data = src.read(1).astype(np.float32)
-                mask = data == src.nodata if src.nodata is not None else np.isnan(data)
-
-                if weighted_sum is None:
-                    weighted_sum = np.zeros_like(data, dtype=np.float32)
-                    nodata_mask = mask.copy()
-                    meta = src.meta.copy()
-                else:
-                    nodata_mask |= mask  # combine masks from all layers
-
-                data[mask] = 0  # set nodata to 0 before weighting
-                weighted_sum += weight * data
-
-        # Mask nodata before normalization
-        valid_data = np.where(~nodata_mask, weighted_sum, np.nan)
-
-        min_val = np.nanmin(valid_data)
-        max_val = np.nanmax(valid_data)
-
-        if max_val == min_val:
-            norm_data = np.zeros_like(valid_data, dtype=np.float32)
-        else:
-            norm_data = (valid_data - min_val) / (max_val - min_val)
-
-        # Replace NaNs (from nodata) with 0 or set explicit nodata
-        norm_data = np.where(np.isnan(norm_data), 0, norm_data)
-
-        meta.update(dtype='float32', count=1, nodata=0)
-
-        with rasterio.open(output_path, 'w', **meta) as dst:
-            dst.write(norm_data, 1)
-
-        state["cot_log"].append(f"Generated suitability map at {output_path}")
-        return {
-            **state,
-            "suitability_output": output_path,
-            "step": "complete"
-        }
-
-    except Exception as e:
-        state["cot_log"].append(f"Error in suitability_tool_fn: {str(e)}")
-        return {
-            **state,
-            "step": "complete",
-            "suitability_output": None,
-            "error": str(e)
-        }
\ No newline at end of file
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import rasterio
+import numpy as np
+from rasterio.windows import Window
+from tools.windows import window_shape, iter_windows
+from tools.raster_io import cog_writer, warped
+from tools.raster_cache import raster_cache_enabled, mapped_band
+from tools.lazy_raster import lazy_enabled
+from streaming import raster_preview
+from working_set import active, load, file_key
+
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
+
+
+class AlignedCriteria:
+    # Opens every criterion on the reference grid, warping mismatched ones on
+    # the fly; one set of handles per thread since datasets are not thread-safe
+    def __init__(self, paths, reference):
+        self.paths = paths
+        self.reference = reference
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.opened = []
+        self.arrays = None
+
+    def datasets(self):
+        if not hasattr(self.local, "datasets"):
+            datasets = []
+            for path in self.paths:
+                src = rasterio.open(path)
+                with self.lock:
+                    self.opened.append(src)
+                if (src.crs, src.transform, src.width, src.height) != (
+                    self.reference["crs"], self.reference["transform"],
+                    self.reference["width"], self.reference["height"]
+                ):
+                    src = warped(src, self.reference)
+                    with self.lock:
+                        self.opened.append(src)
+                datasets.append(src)
+            self.local.datasets = datasets
+        return self.local.datasets
+
+    def cache_arrays(self):
+        # Whole aligned criteria through the session working set; windows then slice
+        # them, so a change of weights recomputes from memory
+        grid = (str(self.reference["crs"]), tuple(self.reference["transform"]),
+                self.reference["width"], self.reference["height"])
+        self.arrays = [
+            load(("criterion", *file_key(path), grid), lambda src=src: src.read(1))
+            for path, src in zip(self.paths, self.datasets())
+        ]
+
+    def map_arrays(self):
+        # Criteria decoded (and aligned) once into shared memory-mapped arrays
+        self.arrays = [mapped_band(path, reference=self.reference)[0] for path in self.paths]
+
+    def close(self):
+        # Warped views were appended after their sources, so close in reverse
+        for src in reversed(self.opened):
+            src.close()
+
+    def weighted_sum(self, window, weights):
+        layers = {}
+        valid = None
+        for i, src in enumerate(self.datasets()):
+            if self.arrays is not None:
+                data = self.arrays[i][window.toslices()].astype(np.float32)
+            else:
+                data = src.read(1, window=window).astype(np.float32)
+            mask = np.isnan(data)
+            if src.nodata is not None and not np.isnan(src.nodata):
+                mask |= data == src.nodata
+            valid = ~mask if valid is None else valid & ~mask
+            layers[f"c{i}"] = data
+
+        if ne is not None:
+            # One fused pass over all layers instead of a temporary per term
+            expression = " + ".join(f"w{i} * c{i}" for i in range(len(layers)))
+            local_dict = {**layers, **{f"w{i}": np.float32(w) for i, w in enumerate(weights)}}
+            total = ne.evaluate(f"where(valid, {expression}, 0)", local_dict={**local_dict, "valid": valid})
+        else:
+            total = np.zeros(valid.shape, dtype=np.float32)
+            for i, weight in enumerate(weights):
+                total += np.float32(weight) * layers[f"c{i}"]
+            total[~valid] = 0
+        return total, valid
+
+
+def _bounded_map(pool, fn, items, ahead):
+    # Like pool.map, but keeps at most `ahead` results in flight so finished
+    # chunks cannot pile up in memory while the writer catches up
+    pending = []
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= ahead:
+            yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+
+def _chunk_range(criteria, window, weights):
+    total, valid = criteria.weighted_sum(window, weights)
+    if not valid.any():
+        return None
+    return float(total[valid].min()), float(total[valid].max())
+
+
+def _chunk_normalized(criteria, window, weights, min_val, scale):
+    total, valid = criteria.weighted_sum(window, weights)
+    if scale == 0:
+        return np.zeros(total.shape, dtype=np.float32)
+    if ne is not None:
+        return ne.evaluate("where(valid, (total - min_val) * scale, 0)", local_dict={
+            "valid": valid, "total": total, "min_val": np.float32(min_val), "scale": np.float32(scale)
+        }).astype(np.float32)
+    return np.where(valid, (total - min_val) * scale, 0).astype(np.float32)
+
+
+def suitability_tool_fn(state):
+    try:
+        criteria_paths = state["criteria_paths"]  # list of raster paths
+        weights = state["weights"]                # list of weights
+        output_path = f"data/{state['region']}_suitability.tif"
+        os.makedirs("data", exist_ok=True)
+
+        if len(criteria_paths) != len(weights):
+            raise ValueError("Mismatch between number of criteria paths and weights.")
+
+        # Common grid: an explicit reference raster, else the first criterion
+        with rasterio.open(state.get("reference_grid") or criteria_paths[0]) as ref:
+            meta = ref.meta.copy()
+            reference = {"crs": ref.crs, "transform": ref.transform, "width": ref.width, "height": ref.height}
+            shape = window_shape(ref, state.get("window_size"))
+
+        workers = state.get("workers") or os.cpu_count() or 1
+        if lazy_enabled():
+            from tools.lazy_raster import suitability
+            suitability(criteria_paths, weights, reference, output_path, meta, workers)
+            state["cot_log"].append(f"Generated suitability map at {output_path} (dask backend)")
+            if state.get("previews"):
+                raster_preview(output_path, "Suitability (preview)", node="suitability_analysis")
+            return {**state, "suitability_output": output_path, "step": "complete"}
+
+        criteria = AlignedCriteria(criteria_paths, reference)
+        working_set = active()
+        if raster_cache_enabled():
+            criteria.map_arrays()
+        elif working_set is not None and working_set.fits(4 * reference["width"] * reference["height"] * len(criteria_paths)):
+            criteria.cache_arrays()
+        chunks = [window for _, window in iter_windows(Window(0, 0, reference["width"], reference["height"]), shape)]
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                # Pass 1: streaming global min/max of the weighted sum over valid pixels
+                ranges = [r for r in pool.map(lambda w: _chunk_range(criteria, w, weights), chunks) if r]
+                if not ranges:
+                    raise ValueError("No pixel has valid data in every criterion.")
+
+                min_val = min(r[0] for r in ranges)
+                max_val = max(r[1] for r in ranges)
+                scale = 0.0 if max_val == min_val else 1.0 / (max_val - min_val)
+
+                # Pass 2: recompute each chunk, normalize and write; nodata becomes 0
+                meta.update(dtype='float32', count=1, nodata=0)
+                with cog_writer(output_path, meta, resampling="average") as dst:
+                    results = _bounded_map(
+                        pool, lambda w: _chunk_normalized(criteria, w, weights, min_val, scale), chunks, 2 * workers
+                    )
+                    for window, norm_data in zip(chunks, results):
+                        dst.write(norm_data, 1, window=window)
+        finally:
+            criteria.close()
+
+        state["cot_log"].append(f"Generated suitability map at {output_path}")
+        if state.get("previews"):
+            raster_preview(output_path, "Suitability (preview)", node="suitability_analysis")
+        return {
+            **state,
+            "suitability_output": output_path,
+            "step": "complete"
+        }
+
+    except Exception as e:
+        state["cot_log"].append(f"Error in suitability_tool_fn: {str(e)}")
+        return {
+            **state,
+            "step": "complete",
+            "suitability_output": None,
+            "error": str(e)
+        }
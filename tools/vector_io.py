@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+# Vector products are written in the format picked by GEOAI_VECTOR_FORMAT:
+#   parquet  GeoParquet (pyarrow), zstd-compressed, rows in Hilbert order with a bbox column (default)
+#   fgb      FlatGeobuf with a packed Hilbert R-tree
+#   geojson  plain GeoJSON (no spatial index)
+# geopandas is imported inside the functions so importing this module stays cheap.
+FORMATS = {
+    "parquet": ".parquet",
+    "fgb": ".fgb",
+    "geojson": ".geojson"
+}
+
+# Rows per Parquet row group; with Hilbert-sorted rows each group covers a compact area,
+# so bbox reads only decode the groups that intersect the query window
+PARQUET_ROW_GROUP_SIZE = 8192
+
+# Frames kept by read_vector_cached (boundaries are re-read by every node of a query)
+CACHED_FRAMES = 32
+
+_frames = OrderedDict()
+_frames_lock = threading.Lock()
+
+
+def vector_format():
+    fmt = os.getenv("GEOAI_VECTOR_FORMAT", "parquet").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown GEOAI_VECTOR_FORMAT '{fmt}' (expected one of {', '.join(FORMATS)})")
+    return fmt
+
+
+def vector_path(stem):
+    # Output path for a product, e.g. data/Surat_buffered -> data/Surat_buffered.parquet
+    return f"{stem}{FORMATS[vector_format()]}"
+
+
+def _format_of(path):
+    ext = os.path.splitext(path)[1].lower()
+    for fmt, fmt_ext in FORMATS.items():
+        if ext == fmt_ext:
+            return fmt
+    return "geojson" if ext == ".json" else None
+
+
+def write_vector(gdf, path):
+    fmt = _format_of(path)
+    root, ext = os.path.splitext(path)
+    # Unique per call: threads of one process (sessions, service requests) may write the same product
+    tmp_path = f"{root}.{uuid.uuid4().hex}.tmp{ext}"
+
+    try:
+        if fmt == "parquet":
+            if len(gdf) > 1 and not gdf.geometry.is_empty.any():
+                gdf = gdf.iloc[gdf.geometry.hilbert_distance().argsort()]
+            gdf.to_parquet(
+                tmp_path, index=False, compression="zstd",
+                write_covering_bbox=True, row_group_size=PARQUET_ROW_GROUP_SIZE
+            )
+        elif fmt == "fgb":
+            gdf.to_file(tmp_path, driver="FlatGeobuf", index=False, SPATIAL_INDEX="YES")
+        else:
+            gdf.to_file(tmp_path, driver="GeoJSON", index=False)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def read_vector(path, bbox=None, columns=None):
+    # bbox (minx, miny, maxx, maxy, in the file's CRS) only reads intersecting
+    # features: Parquet skips row groups by their bbox statistics, FlatGeobuf walks its R-tree
+    import geopandas as gpd
+
+    if _format_of(path) == "parquet":
+        return gpd.read_parquet(path, bbox=bbox, columns=columns)
+    return gpd.read_file(path, bbox=bbox, columns=columns)
+
+
+def read_vector_cached(path):
+    # In-process LRU over read_vector, keyed by file identity so rewritten files are re-read;
+    # callers get a copy and may modify it freely. Inside a session, frames are held
+    # (and byte-accounted) by the session's working set instead
+    from working_set import active, file_key
+
+    key = file_key(path)
+    working_set = active()
+    if working_set is not None:
+        return working_set.get_or_load(("frame", *key), lambda: read_vector(path)).copy()
+
+    with _frames_lock:
+        if key in _frames:
+            _frames.move_to_end(key)
+            return _frames[key].copy()
+
+    gdf = read_vector(path)
+    with _frames_lock:
+        _frames[key] = gdf
+        while len(_frames) > CACHED_FRAMES:
+            _frames.popitem(last=False)
+    return gdf.copy()
+
+
+def vector_info(path):
+    # CRS and total bounds from file metadata, without reading any geometry
+    if _format_of(path) == "parquet":
+        import pyarrow.parquet as pq
+        from pyproj import CRS
+
+        geo = json.loads(pq.read_metadata(path).metadata[b"geo"])
+        column = geo["columns"][geo["primary_column"]]
+        crs = column.get("crs", "OGC:CRS84")
+        return {
+            "crs": CRS.from_user_input(crs) if crs is not None else None,
+            "bounds": tuple(column["bbox"]) if column.get("bbox") else None
+        }
+
+    import pyogrio
+    from pyproj import CRS
+
+    info = pyogrio.read_info(path, force_total_bounds=True)
+    return {
+        "crs": CRS.from_user_input(info["crs"]) if info["crs"] else None,
+        "bounds": tuple(info["total_bounds"]) if info.get("total_bounds") is not None else None
+    }
@@ -1,48 +1,55 @@
-import os
-import geopandas as gpd
-
-def vector_tool_fn(state):
-    try:
-        vector_path = state.get("vector_path")
-        buffer_distance = state.get("buffer_distance", 1000)
-
-        if not vector_path or not os.path.exists(vector_path):
-            raise ValueError("Missing or invalid 'vector_path' in state.")
-
-        import geopandas as gpd
-
-        gdf = gpd.read_file(vector_path)
-        if gdf.empty:
-            raise ValueError("Input vector file contains no features.")
-
-        gdf = gdf[gdf.is_valid]
-        if gdf.empty:
-            raise ValueError("All geometries were invalid after validation.")
-
-        if gdf.crs is None:
-            gdf.set_crs("EPSG:4326", inplace=True)
-
-        gdf_proj = gdf.to_crs(epsg=3857)
-        buffered = gdf_proj.buffer(buffer_distance)
-        result = gpd.GeoDataFrame(geometry=buffered).set_crs(gdf_proj.crs).to_crs("EPSG:4326")
-
-        out_path = f"data/{state['region']}_buffered.geojson"
-        result.to_file(out_path, driver="GeoJSON")
-
-        state["cot_log"].append(
-            f"Buffered {len(result)} valid features by {buffer_distance}m and saved to {out_path}"
-        )
-
-        return {
-            **state,
-            "vector_result": {"status": "success", "vector_output": out_path},
-            "step": "complete"
-        }
-
-    except Exception as e:
-        state["cot_log"].append(f"Error in vector_tool_fn: {str(e)}")
-        return {
-            **state,
-            "vector_result": {"status": "error", "error_msg": str(e)},
-            "step": "complete"
+import os
+import geopandas as gpd
+from tools.vector_io import write_vector, read_vector_cached, vector_path as product_path
+from tools.buffering import buffer_geometries
+
+def vector_tool_fn(state):
+    try:
+        vector_path = state.get("vector_path")
+        buffer_distance = state.get("buffer_distance", 1000)
+        os.makedirs("data", exist_ok=True)
+
+        if not vector_path or not os.path.exists(vector_path):
+            raise ValueError("Missing or invalid 'vector_path' in state.")
+
+        gdf = read_vector_cached(vector_path)
+        if gdf.empty:
+            raise ValueError("Input vector file contains no features.")
+
+        gdf = gdf[gdf.is_valid]
+        if gdf.empty:
+            raise ValueError("All geometries were invalid after validation.")
+
+        if gdf.crs is None:
+            gdf.set_crs("EPSG:4326", inplace=True)
+
+        # Each feature is buffered in its own UTM / azimuthal equidistant CRS, so the
+        # distance is true on the ground rather than stretched by Web Mercator
+        buffered = buffer_geometries(
+            gdf.geometry,
+            buffer_distance,
+            resolution=state.get("buffer_resolution"),
+            simplify=state.get("buffer_simplify"),
+            workers=state.get("workers")
+        )
+        result = gpd.GeoDataFrame(geometry=buffered).to_crs("EPSG:4326")
+
+        out_path = write_vector(result, product_path(f"data/{state['region']}_buffered"))
+
+        state["cot_log"].append(
+            f"Buffered {len(result)} valid features by {buffer_distance}m and saved to {out_path}"
+        )
+
+        return {
+            **state,
+            "vector_result": {"status": "success", "vector_output": out_path},
+            "step": "complete"
+        }
+
+    except Exception as e:
+        state["cot_log"].append(f"Error in vector_tool_fn: {str(e)}")
+        return {
+            **state,
+            "vector_result": {"status": "error", "error_msg": str(e)},
+            "step": "complete"
         }
\ No newline at end of file
@@ -0,0 +1,36 @@
+from rasterio.windows import Window
+
+# Default edge length (pixels) of a processing window when the source is not tiled
+DEFAULT_WINDOW_SIZE = 1024
+
+# Rasters (or clipped regions) larger than this, in pixels, are processed window by window
+WINDOWED_PIXEL_THRESHOLD = 50_000_000
+
+
+def window_shape(src, window_size=None):
+    if window_size:
+        return int(window_size), int(window_size)
+
+    block_h, block_w = src.block_shapes[0]
+    # Striped rasters (one row per block, or full-width blocks) fall back to square windows
+    if block_h == 1 or block_w >= src.width:
+        return DEFAULT_WINDOW_SIZE, DEFAULT_WINDOW_SIZE
+
+    # Group small internal tiles so each window is roughly DEFAULT_WINDOW_SIZE wide
+    factor_h = max(1, DEFAULT_WINDOW_SIZE // block_h)
+    factor_w = max(1, DEFAULT_WINDOW_SIZE // block_w)
+    return block_h * factor_h, block_w * factor_w
+
+
+def iter_windows(bounds_window, shape):
+    # Yields (relative, absolute) window pairs covering bounds_window:
+    # relative is offset inside bounds_window, absolute is offset in the source raster
+    win_h, win_w = shape
+    col_off, row_off = int(bounds_window.col_off), int(bounds_window.row_off)
+    width, height = int(bounds_window.width), int(bounds_window.height)
+
+    for row in range(0, height, win_h):
+        for col in range(0, width, win_w):
+            h = min(win_h, height - row)
+            w = min(win_w, width - col)
+            yield Window(col, row, w, h), Window(col_off + col, row_off + row, w, h)
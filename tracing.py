@@ -0,0 +1,202 @@
+import asyncio
+import contextvars
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+
+# Span currently executing in this thread/task, so helpers deep inside a node
+# (fetch_boundary, the result cache, ...) can attach events to it
+current_span = contextvars.ContextVar("current_span", default=None)
+
+_export_lock = threading.Lock()
+
+# Size at which the trace file is rotated to <file>.1, replacing the previous one
+# (GEOAI_TRACE_MAX_BYTES overrides), so exports keep at most about twice this on disk
+DEFAULT_TRACE_MAX_BYTES = 50 * 1024 ** 2
+
+# State keys (and nested keys) that point at rasters whose size is worth recording
+RASTER_KEYS = [
+    ("dem_path",),
+    ("hazard_mask_path",),
+    ("suitability_output",),
+    ("raster_result", "raster_output"),
+]
+
+
+def _io_counters():
+    # Bytes moved through read/write syscalls by this process (Linux /proc)
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(":") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _rss_bytes():
+    # Resident set size of this process right now (Linux /proc)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _process_peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def add_event(name, **attributes):
+    span = current_span.get()
+    if span is not None:
+        span["events"].append({"name": name, "time_unix_nano": time.time_ns(), "attributes": attributes})
+
+
+def set_attribute(key, value):
+    span = current_span.get()
+    if span is not None:
+        span["attributes"][key] = value
+
+
+def _lookup(state, keys):
+    for key in keys:
+        state = state.get(key) if isinstance(state, dict) else None
+    return state
+
+
+def _raster_dims(before, after):
+    # Dimensions of rasters a node produced (paths that were not already in its input)
+    dims = {}
+    for keys in RASTER_KEYS:
+        value = _lookup(after, keys)
+        if value != _lookup(before, keys) and isinstance(value, str) and os.path.exists(value):
+            try:
+                import rasterio
+                with rasterio.open(value) as src:
+                    dims[f"raster.{'.'.join(keys)}"] = f"{src.width}x{src.height}"
+            except Exception:
+                pass
+    return dims
+
+
+def _export(span):
+    # Spans are appended to GEOAI_TRACE_FILE only when it is set; off by default
+    path = os.getenv("GEOAI_TRACE_FILE", "")
+    if not path or path == "0":
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    max_bytes = int(os.getenv("GEOAI_TRACE_MAX_BYTES", DEFAULT_TRACE_MAX_BYTES))
+    with _export_lock:
+        try:
+            if os.path.getsize(path) >= max_bytes:
+                os.replace(path, f"{path}.1")
+        except OSError:
+            pass
+        with open(path, "a") as f:
+            f.write(json.dumps(span, default=str) + "\n")
+
+
+class _Recorder:
+    # Measures one node run and turns it into an OpenTelemetry-style span dict
+    def __init__(self, name, state):
+        self.state = state
+        self.span = {
+            "name": name,
+            "trace_id": state.get("trace_id") or uuid.uuid4().hex,
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_span_id": None,
+            "start_time_unix_nano": time.time_ns(),
+            "end_time_unix_nano": None,
+            "status": "ok",
+            "attributes": {},
+            "events": []
+        }
+
+    def start(self):
+        self.token = current_span.set(self.span)
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        self.children_cpu = _children_cpu()
+        self.rss = _rss_bytes()
+        self.peak_rss = _process_peak_rss_bytes()
+        self.io = _io_counters()
+        return self
+
+    def finish(self, result, error=None):
+        current_span.reset(self.token)
+        span = self.span
+        span["end_time_unix_nano"] = time.time_ns()
+        # Per node: cpu_time_s is CPU of the thread that ran the node (for async nodes
+        # it includes other tasks the event loop ran meanwhile), children_cpu_time_s CPU
+        # of worker processes the node started and joined, rss_delta_bytes and
+        # peak_rss_growth_bytes how much the node moved current and peak RSS.
+        # process_peak_rss_bytes is the high-water mark of the whole process so far
+        peak_rss = _process_peak_rss_bytes()
+        span["attributes"].update({
+            "wall_time_s": round(time.perf_counter() - self.wall, 6),
+            "cpu_time_s": round(time.thread_time() - self.cpu, 6),
+            "children_cpu_time_s": round(_children_cpu() - self.children_cpu, 6),
+            "peak_rss_growth_bytes": peak_rss - self.peak_rss,
+            "process_peak_rss_bytes": peak_rss
+        })
+        rss = _rss_bytes()
+        if rss is not None and self.rss is not None:
+            span["attributes"]["rss_delta_bytes"] = rss - self.rss
+        io = _io_counters()
+        if io and self.io:
+            span["attributes"]["bytes_read"] = io[0] - self.io[0]
+            span["attributes"]["bytes_written"] = io[1] - self.io[1]
+
+        if error is not None:
+            span["status"] = "error"
+            span["attributes"]["error"] = str(error)
+        else:
+            span["attributes"].update(_raster_dims(self.state, result))
+            if result.get("error"):
+                span["status"] = "error"
+                span["attributes"]["error"] = str(result["error"])
+
+        _export(span)
+        if error is not None:
+            return None
+        trace = list(result.get("trace") or self.state.get("trace") or []) + [span]
+        return {**result, "trace_id": span["trace_id"], "trace": trace}
+
+
+def traced(name, fn):
+    # Wraps a graph node (sync or async) so every run appends a span to state["trace"]
+    if asyncio.iscoroutinefunction(fn):
+        async def run_async(state):
+            recorder = _Recorder(name, state).start()
+            try:
+                result = await fn({**state, "trace_id": recorder.span["trace_id"]})
+            except Exception as e:
+                recorder.finish(state, e)
+                raise
+            return recorder.finish(result)
+
+        run_async.__name__ = name
+        return run_async
+
+    def run(state):
+        recorder = _Recorder(name, state).start()
+        try:
+            result = fn({**state, "trace_id": recorder.span["trace_id"]})
+        except Exception as e:
+            recorder.finish(state, e)
+            raise
+        return recorder.finish(result)
+
+    run.__name__ = name
+    return run
@@ -0,0 +1,111 @@
+import contextvars
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from tracing import add_event
+
+# Bytes of decoded data (arrays, frames) a session keeps in memory between queries
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+# Working set of the session whose query is running; None outside a session
+# (CLI, batch, service workers), in which case loads go straight to disk
+current_working_set = contextvars.ContextVar("current_working_set", default=None)
+
+
+def file_key(path):
+    # Identity of a file's current contents: a rewritten file gets a new key
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+
+def nbytes(value):
+    # Approximate memory held by a cached value
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes(item) for item in value)
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if hasattr(value, "geometry") and hasattr(value, "memory_usage"):
+        import shapely
+        # Coordinates dominate a boundary frame; memory_usage does not see inside geometries
+        coords = int(shapely.get_num_coordinates(value.geometry.values).sum())
+        return int(value.memory_usage(deep=True).sum()) + coords * 16
+    return 64
+
+
+class WorkingSet:
+    # Decoded inputs of one session (boundary frames, clipped DEM arrays, criterion
+    # and suitability arrays) kept across queries, so a query that only changes a
+    # parameter skips straight to its last step. Least-recently-used entries are
+    # evicted once the total size exceeds max_bytes
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or int(os.getenv("GEOAI_WORKING_SET_BYTES", DEFAULT_MAX_BYTES))
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def fits(self, size):
+        return size <= self.max_bytes
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        size = nbytes(value) if size is None else size
+        if not self.fits(size):
+            return value
+        with self.lock:
+            self.entries[key] = (value, size)
+            self.entries.move_to_end(key)
+            while self.size() > self.max_bytes:
+                self.entries.popitem(last=False)
+        return value
+
+    def get_or_load(self, key, loader):
+        value = self.get(key)
+        if value is not None:
+            add_event("working_set.hit", kind=key[0])
+            return value
+        return self.put(key, loader())
+
+    def size(self):
+        return sum(size for _, size in self.entries.values())
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.size(), "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def active():
+    return current_working_set.get()
+
+
+@contextmanager
+def session(working_set):
+    # Makes working_set the one node code loads through while the block runs
+    token = current_working_set.set(working_set)
+    try:
+        yield working_set
+    finally:
+        current_working_set.reset(token)
+
+
+def load(key, loader):
+    # loader() through the active working set, or directly without one
+    working_set = active()
+    if working_set is None:
+        return loader()
+    return working_set.get_or_load(key, loader)